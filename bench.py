@@ -0,0 +1,916 @@
+""" Benchmarks for the scraping and table building pipeline. Each benchmark times the current implementation against
+the one it replaced, on data that is already cached locally. Usage: python bench.py [benchmark name ...] """
+import os
+import sys
+import glob
+import json
+import pickle
+import time
+import shutil
+import tempfile
+import tracemalloc
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+from bs4 import BeautifulSoup
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.utils import check_array
+
+from config import CACHE_DIRECTORY, SEASON_START_DATES
+from data import BoxscoreShards, DefenseTeamTable, OffenseTable, OffenseTeamTable, ScoreTable, boxscore_rows, floatify
+from data import AdvancedPassingTable, AdvancedRushingTable, AdvancedReceivingTable, AsofIndex, load_table, save_table
+from data import read_fingerprint, write_fingerprint, build_tables, SEASON_TABLES as SEASON_TABLE_NAMES
+from config import BUILD_WORKERS, MODEL_WARM_TREES
+from data import IDENTIFIER_COLUMNS, compact_table, concat_tables, append_season, TableRegistry, registry
+from model import QuarterbackFeatureSpaceTable, PositionPlayerFeatureSpaceTable, DefenseFeatureSpaceTable
+from model import FootballRandomForestModel, ModelRegistry, MODEL_CLASSES, SlatePredictor, models, FeatureMatrix
+from model import sweep, sweep_summary, walk_forward
+from web import FootballBoxscore, page_cache, load_boxscores
+
+
+def cached_pages(pattern="/boxscores/", limit=None):
+    """ Returns the html of every page in the page cache whose url contains pattern """
+    urls = sorted(url for url in page_cache.urls() if pattern in url)[:limit]
+    return [page_cache.get(url) for url in urls]
+
+
+def season_boxscores(season):
+    """ Returns the season's BoxscoreShards if it has any, otherwise its cached list of FootballBoxscore objects """
+    shards = BoxscoreShards(season)
+    return shards if shards.exists() else load_boxscores(season)
+
+
+def cached_seasons():
+    """ Returns the seasons that have shards or a boxscore pickle """
+    return [season for season in sorted(SEASON_START_DATES) if season_boxscores(season)]
+
+
+def timed(fn, items, repeat=1):
+    """ Calls fn on every item repeat times. Returns the best wall-clock time of a pass in seconds """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def legacy_parse(html):
+    """ The original FootballBoxscore.full_scrape parse: one re-parse of the page per table """
+    fbs = FootballBoxscore(None)
+    soup = BeautifulSoup(html, "html.parser")
+    fbs.scorebox = fbs.parse_scorebox(soup)
+    for attribute, table_div_id in FootballBoxscore.TABLES:
+        setattr(fbs, attribute, fbs.parse_table(soup, table_div_id))
+    return fbs
+
+
+def bench_parse(limit=100):
+    """ Pages per second of the legacy parse against the single-pass parse with each available parser backend """
+    pages = cached_pages(limit=limit)
+    print(f"parse: {len(pages)} cached boxscore pages")
+    contenders = [("legacy (html.parser x15)", legacy_parse),
+                  ("single pass (html.parser)", lambda h: FootballBoxscore(None).parse(h, parser="html.parser"))]
+    try:
+        import lxml  # noqa: F401
+        contenders.append(("single pass (lxml)", lambda h: FootballBoxscore(None).parse(h, parser="lxml")))
+    except ImportError:
+        pass
+    for name, fn in contenders:
+        print(f"    {name:<28} {len(pages) / timed(fn, pages):8.1f} pages/s")
+
+
+def legacy_floatify(table, string_columns=['team']):
+    """ The original per-cell floatify """
+    off_float = table[[c for c in table.columns if not c in string_columns]] \
+        .applymap(lambda x: np.nan if x == "" else float(x.replace("%", ""))).copy()
+    off_string = table[string_columns].copy()
+    table = pd.concat([off_string, off_float], axis=1)
+    table = table.reset_index().rename(columns={'index': 'player'})
+    return table
+
+
+def bench_floatify():
+    """ Full-season numeric conversion of each player stat table: the legacy per-cell floatify run once per game
+    against the vectorized floatify run once on the concatenated season, for float64 and float32 output """
+    for season in cached_seasons():
+        boxscores = season_boxscores(season)
+        for shard in ["offense", "advancedPassing", "advancedRushing", "advancedReceiving"]:
+            rows = boxscore_rows(boxscores, shard)
+            stats = rows.drop(columns=['game', 'date']).set_index('player')
+            games = [stats[(rows.game == game).values] for game in rows.game.unique()]
+            legacy = timed(lambda game: legacy_floatify(game), games)
+            vectorized = timed(floatify, [stats])
+            compact = timed(lambda t: floatify(t, dtype=np.float32), [stats])
+            print(f"floatify {season} {shard:<18} {len(stats):6d} rows  legacy {legacy:7.3f}s  "
+                  f"vectorized {vectorized:7.3f}s ({legacy / vectorized:5.1f}x)  float32 {compact:7.3f}s")
+
+
+def legacy_build_team_table(team_table):
+    """ The original OffenseTeamTable.build_team_table: one pd.Series per row for every compound column """
+    team_table = team_table.copy()
+    team_table["Time of Possession"] = team_table["Time of Possession"].apply(
+        lambda x: float(x.split(":")[0]) + float(x.split(":")[1]) / 60
+    )
+    parts = [
+        team_table[column].apply(lambda x, names=names: pd.Series(dict(zip(names, x.split("-")))))
+        for column, names in OffenseTeamTable.COMPOUND_COLUMNS.items()
+    ]
+    rest = team_table[
+        ["First Downs", "Net Pass Yards", "Time of Possession", 'Total Yards', 'Turnovers', 'team', 'date', 'opp']
+    ]
+    return pd.concat(parts + [rest], axis=1)
+
+
+def bench_team_table():
+    """ OffenseTeamTable.build_team_table on every cached season stacked together: per-row pd.Series splitting
+    against the declarative single-regex split """
+    records = []
+    for season in cached_seasons():
+        boxscores = season_boxscores(season)
+        records.append(OffenseTeamTable.team_records(
+            boxscore_rows(boxscores, "teamStats"), boxscore_rows(boxscores, "score")
+        ))
+    team_table = pd.concat(records)
+    legacy = timed(legacy_build_team_table, [team_table])
+    vectorized = timed(OffenseTeamTable.build_team_table, [team_table])
+    print(f"team_table {len(team_table):6d} rows  legacy {legacy:7.3f}s  vectorized {vectorized:7.3f}s "
+          f"({legacy / vectorized:5.1f}x)")
+
+
+def legacy_defense_records(off_team_table, score_table):
+    """ The original DefenseTeamTable.build: one re-indexed join per team and a per-row points allowed lookup """
+    def_team_table = []
+    for team in off_team_table.team.unique():
+        def_team = off_team_table[off_team_table.team == team].copy()[['team', 'date', 'opp']]
+        def_table = def_team.join(off_team_table.set_index(['date', 'team']), on=['date', 'opp'], rsuffix=".2")
+        def_table = def_table.reset_index()
+        del def_table['index']
+        del def_table['opp.2']
+        def_team_table.append(def_table)
+
+    def_team_table = pd.concat(def_team_table)
+    del def_team_table['player']
+    def_team_table = def_team_table.drop_duplicates(["team", "date"]).sort_values('date')
+    def_team_table['name'] = def_team_table['team']
+
+    score_ref = pd.concat([
+        score_table[['date', 'home', 'home_score']].rename(columns={'home': "opp", 'home_score': "pts_allowed"}),
+        score_table[['date', 'away', 'away_score']].rename(columns={'away': "opp", 'away_score': "pts_allowed"}),
+    ]).sort_values('date').set_index(['date', 'opp'])
+    def_team_table = def_team_table.join(score_ref, on=['date', 'opp'])
+
+    def score_pts_allowed(pts):
+        if pts == 0.0:
+            return 10.0
+        elif pts <= 6:
+            return 7.0
+        elif pts <= 13:
+            return 4.0
+        elif pts <= 20:
+            return 1.0
+        elif pts <= 27.0:
+            return 0.0
+        elif pts <= 34.0:
+            return -1.0
+        else:
+            return -4.0
+
+    def_team_table['DKScore_pts'] = def_team_table['pts_allowed'].apply(score_pts_allowed)
+    def_team_table['DKScore'] = (
+        def_team_table['sacks_allowed'] + 2.0 * def_team_table['pass_int'] + 2.0 * def_team_table['fumbles_lost']
+        + def_team_table['DKScore_pts']
+    )
+    return def_team_table
+
+
+def stacked_seasons(tables, copies, concat=pd.concat):
+    """ Takes (season, table) pairs of one table type. Returns them concatenated with concat copies times, each copy
+    shifted a whole number of years into the future so dates never collide, to stand in for a long run of seasons """
+    frames = []
+    for copy in range(copies):
+        for season, table in tables:
+            table = table.copy()
+            table['date'] = table['date'] + pd.DateOffset(years=copy * len(tables))
+            frames.append(table)
+    return concat(frames)
+
+
+def bench_defense_team(copies=(1, 4, 16)):
+    """ DefenseTeamTable build on stacked cached seasons: asserts the keyed self-join reproduces the per-team join
+    loop exactly (values, dtypes, row order and index), then times both as the number of seasons grows """
+    seasons = cached_seasons()
+    off_tables = [(season, OffenseTeamTable(season).table) for season in seasons]
+    score_tables = [(season, ScoreTable(season).table) for season in seasons]
+    for n in copies:
+        off_team_table = stacked_seasons(off_tables, n).reset_index(drop=True)
+        score_table = stacked_seasons(score_tables, n).reset_index(drop=True)
+        expected = legacy_defense_records(off_team_table, score_table)
+        pd.testing.assert_frame_equal(DefenseTeamTable.defense_records(off_team_table, score_table), expected)
+        legacy = timed(lambda t: legacy_defense_records(*t), [(off_team_table, score_table)])
+        joined = timed(lambda t: DefenseTeamTable.defense_records(*t), [(off_team_table, score_table)])
+        print(f"defense_team {n * len(seasons):3d} seasons {len(off_team_table):6d} rows  legacy {legacy:7.3f}s  "
+              f"self-join {joined:7.3f}s ({legacy / joined:5.1f}x)  matches legacy")
+
+
+# Run in a fresh interpreter so the parent's memory does not count. Prints load seconds, then the growth in RSS (MB)
+# after the load and after a pass that reads every numeric value. Current RSS comes from /proc where there is one,
+# otherwise peak RSS is used.
+LOAD_SCRIPT = """
+import os, sys, json, time, resource
+from data import load_table
+def rss():
+    if os.path.exists("/proc/self/statm"):
+        with open("/proc/self/statm") as reader:
+            return int(reader.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+before = rss()
+start = time.perf_counter()
+table = load_table(sys.argv[1], json.loads(sys.argv[2]))
+seconds = time.perf_counter() - start
+loaded = rss()
+table.sum(numeric_only=True)
+print(json.dumps([seconds, loaded - before, rss() - before]))
+"""
+
+
+def measure_load(stem, columns=None, repeat=3):
+    """ Loads a cached table in a fresh interpreter repeat times. Returns the best load seconds and the peak RSS
+    growth in MB after loading and after reading every numeric value """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", LOAD_SCRIPT, stem, json.dumps(columns)],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+        ).stdout
+        runs.append(json.loads(output))
+    return min(run[0] for run in runs), min(run[1] for run in runs), min(run[2] for run in runs)
+
+
+def bench_cache_load(copies=64):
+    """ Load time and RSS of the pickle cache against the memory-mapped columnar cache, for OffenseTable stacked over
+    copies of every cached season and for each cached feature space table, reading all columns and a few """
+    tables = [(f"offense x{copies * len(cached_seasons())} seasons",
+               stacked_seasons([(season, OffenseTable(season).table) for season in cached_seasons()], copies),
+               ['name', 'date', 'DKScore'])]
+    for path in sorted(glob.glob(f"{CACHE_DIRECTORY}/*FeatureSpaceTable.*")):
+        name = os.path.basename(path).split(".")[0]
+        tables.append((name, load_table(f"{CACHE_DIRECTORY}/{name}"), ['name', 'date', 'Y']))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, table, columns in tables:
+            print(f"cache_load {name}: {table.shape[0]} rows x {table.shape[1]} columns")
+            for table_format in ["pickle", "columns"]:
+                stem = f"{directory}/{name.split()[0]}_{table_format}"
+                save_table(table, stem, table_format)
+                for selection in [None, [c for c in columns if c in table.columns]]:
+                    seconds, loaded, touched = measure_load(stem, selection)
+                    label = "all columns" if selection is None else f"{len(selection)} columns"
+                    print(f"    {table_format:<8} {label:<12} load {seconds * 1e3:8.2f}ms  "
+                          f"rss +{loaded:6.1f}MB loaded  +{touched:6.1f}MB after reading")
+
+
+SEASON_TABLES = [ScoreTable, OffenseTeamTable, DefenseTeamTable, OffenseTable, AdvancedPassingTable,
+                 AdvancedRushingTable, AdvancedReceivingTable]
+FEATURE_SPACES = [QuarterbackFeatureSpaceTable, PositionPlayerFeatureSpaceTable, DefenseFeatureSpaceTable]
+
+
+def refresh_pipeline(seasons):
+    """ Refreshes every season table of the seasons and the feature spaces over all of them. Returns the names of
+    the tables that were rebuilt """
+    rebuilt = []
+    for season in seasons:
+        boxscores = season_boxscores(season)
+        for table_class in SEASON_TABLES:
+            table = table_class(season, refresh=True, boxscores=boxscores)
+            if table.rebuilt:
+                rebuilt.append(f"{season}/{table.name}")
+    for table_class in FEATURE_SPACES:
+        table = table_class(seasons=seasons, refresh=True)
+        if table.rebuilt:
+            rebuilt.append(table.name)
+    return rebuilt
+
+
+def bench_refresh():
+    """ Refreshes the season tables and feature spaces of the cached seasons twice. The first pass rebuilds whatever
+    is stale; the second finds every fingerprint current and only loads. """
+    seasons = cached_seasons()
+    for label in ["first pass", "warm pass"]:
+        start = time.perf_counter()
+        rebuilt = refresh_pipeline(seasons)
+        print(f"refresh {label:<10} {time.perf_counter() - start:7.2f}s  rebuilt {len(rebuilt)} tables "
+              f"{rebuilt if rebuilt else ''}")
+
+
+def legacy_query_asof(table, name, date):
+    """ The original FootballTable.query_asof: a scan of the whole table per lookup """
+    out = table[table.name == name].copy()
+    out = out[out['date'] < date].sort_values('date', ascending=True)
+    return out.fillna(0).tail(5).mean(numeric_only=True)
+
+
+def check_asof(cases):
+    """ Takes tables with name and date columns. Checks AsofIndex.query equals the original scan for every name (plus an
+    unknown one) at every date of each table. Returns the number of lookups checked """
+    queries = 0
+    for table in cases:
+        index = AsofIndex(table)
+        names = list(table['name'].dropna().unique()[:50]) + ["UNKNOWN", None]
+        dates = list(table['date'].dropna().unique()) + [pd.Timestamp("1990-01-01"), pd.Timestamp("2100-01-01")]
+        for name in names:
+            for date in dates:
+                date = pd.Timestamp(date)
+                pd.testing.assert_series_equal(index.query(name, date), legacy_query_asof(table, name, date),
+                                               check_exact=True)
+                queries += 1
+    return queries
+
+
+def bench_asof():
+    """ Checks AsofIndex against the original scan, then times the lookups of a feature-space style pass over every
+    offense row (player lookup, then the lookup of the defense faced) """
+    cases = []
+    for season in cached_seasons():
+        cases += [OffenseTable(season).table, DefenseTeamTable(season).table, AdvancedPassingTable(season).table]
+    print(f"asof: {check_asof(cases)} lookups on {len(cases)} cached tables identical to the original scan")
+    for season in cached_seasons():
+        offense, defense = OffenseTable(season).table, DefenseTeamTable(season).table
+        matchups = list(zip(offense['name'], offense['opp'], offense['date']))
+
+        def legacy_pass(_):
+            for name, opp, date in matchups:
+                legacy_query_asof(offense, name, date)
+                legacy_query_asof(defense, opp, date)
+
+        def indexed_pass(_):
+            offense_index, defense_index = AsofIndex(offense), AsofIndex(defense)
+            for name, opp, date in matchups:
+                offense_index.query(name, date)
+                defense_index.query(opp, date)
+
+        legacy, indexed = timed(legacy_pass, [None]), timed(indexed_pass, [None])
+        print(f"asof {season} {len(matchups)} matchups  legacy {legacy:7.3f}s  indexed {indexed:7.3f}s "
+              f"({legacy / indexed:5.1f}x, index build included)")
+
+
+def legacy_asof_features(matchups, sources):
+    """ The original feature-space build loop: one query_asof per source for each matchup, glued into a record with
+    reset_index / drop_duplicates / sort_values, and every record transposed into a row """
+    records = []
+    for _, x in matchups.iterrows():
+        parts = []
+        for table, column, prefix in sources:
+            record = legacy_query_asof(table, x[column], x['date'])
+            record.index = [prefix + i for i in record.index]
+            parts.append(record)
+        full_rec = pd.concat(parts)
+        full_rec = full_rec.reset_index() \
+            .drop_duplicates('index') \
+            .set_index('index') \
+            .sort_values('index', ascending=False)
+        records.append(full_rec)
+    return pd.concat(records, axis=1).T
+
+
+def feature_sources(feature_space):
+    """ Returns the (table, matchups column, prefix) sources and the default matchups of a feature space object, with
+    matchups from the first game on, so early games with no history are covered too """
+    if isinstance(feature_space, QuarterbackFeatureSpaceTable):
+        sources = [(feature_space.offense_table, 'name', "o_"), (feature_space.adv_passing_table, 'name', "o_"),
+                   (feature_space.defense_table, 'opp', "d_")]
+        matchups = feature_space.offense_table[feature_space.offense_table.pass_att > 10]
+    elif isinstance(feature_space, PositionPlayerFeatureSpaceTable):
+        sources = [(feature_space.offense_table, 'name', "o_"), (feature_space.adv_rush_table, 'name', "o_"),
+                   (feature_space.adv_recv_table, 'name', "o_"), (feature_space.defense_table, 'opp', "d_")]
+        matchups = feature_space.offense_table[feature_space.offense_table.pass_att <= 1]
+    else:
+        sources = [(feature_space.defense_table, 'name', "teamDef_"), (feature_space.offense_table, 'opp', "oppOff_")]
+        matchups = feature_space.defense_table
+    return sources, matchups[['name', 'date', 'opp']]
+
+
+def bench_features():
+    """ Builds each feature space's features for every game of the cached seasons with the original per-matchup loop
+    and with FootballTable.asof_features. Asserts the two are identical (values, column order, index) and times both.
+    """
+    seasons = cached_seasons()
+    for feature_class in FEATURE_SPACES:
+        feature_space = feature_class(seasons=seasons, refresh=False)
+        sources, matchups = feature_sources(feature_space)
+        start = time.perf_counter()
+        expected = legacy_asof_features(matchups, sources)
+        legacy = time.perf_counter() - start
+        start = time.perf_counter()
+        features = feature_space.asof_features(matchups, sources)
+        engine = time.perf_counter() - start
+        pd.testing.assert_frame_equal(features, expected, check_exact=True)
+        print(f"features {feature_space.name:<32} {len(matchups):6d} matchups  legacy {legacy:7.2f}s  "
+              f"engine {engine:7.3f}s ({legacy / engine:6.1f}x)  identical, {features.shape[1]} columns")
+
+
+def megabytes(table):
+    """ Returns the deep memory usage of a table in MB """
+    return table.memory_usage(deep=True).sum() / 2 ** 20
+
+
+def bench_memory(copies=8):
+    """ Memory of each season table type stacked over copies of every cached season, and of each cached feature space,
+    as cached and after compact_table. Asserts compact feature spaces are numeric apart from identifiers and dates and
+    that their values match to float32 precision. """
+    seasons = cached_seasons()
+    for table_class in SEASON_TABLES:
+        tables = [(season, table_class(season).table) for season in seasons]
+        table = stacked_seasons(tables, copies)
+        compact = stacked_seasons([(season, compact_table(t)) for season, t in tables], copies, concat_tables)
+        print(f"memory {table_class.__name__:<32} {len(table):8d} rows  {megabytes(table):8.2f}MB -> "
+              f"{megabytes(compact):8.2f}MB compact")
+    for feature_class in FEATURE_SPACES:
+        table = feature_class(seasons=seasons, refresh=False).table
+        compact = compact_table(table)
+        features = compact.drop(columns=[c for c in compact.columns if c in IDENTIFIER_COLUMNS or c == 'date'])
+        assert (features.dtypes == np.float32).all(), features.dtypes[features.dtypes != np.float32]
+        np.testing.assert_allclose(features.to_numpy(np.float64), table[features.columns].to_numpy(np.float64),
+                                   rtol=1e-6, atol=1e-4)
+        print(f"memory {feature_class.__name__:<32} {len(table):8d} rows  {megabytes(table):8.2f}MB -> "
+              f"{megabytes(compact):8.2f}MB compact")
+
+
+def season_games(season):
+    """ Returns the season's games as a list of FootballBoxscore objects ordered by url, parsed from the page cache
+    when the season is stored as shards """
+    boxscores = season_boxscores(season)
+    if isinstance(boxscores, list):
+        return sorted(boxscores, key=lambda fbs: fbs.url)
+    games = []
+    for url in sorted(boxscores.read("score")['game']):
+        fbs = FootballBoxscore(url)
+        fbs.full_scrape(offline=True)
+        games.append(fbs)
+    return games
+
+
+def season_tables(season, boxscores=None):
+    """ Returns the tables append_season updates, plus the DefenseTeamTable's upstream tables. With boxscores the
+    tables are rebuilt from them, otherwise loaded. """
+    refresh = "force" if boxscores is not None else False
+    defense = DefenseTeamTable(season, refresh=refresh, boxscores=boxscores)
+    tables = [defense, defense.off_table, defense.score_table]
+    for table_class in [OffenseTable, AdvancedPassingTable, AdvancedRushingTable, AdvancedReceivingTable]:
+        tables.append(table_class(season, refresh=refresh, boxscores=boxscores))
+    return tables
+
+
+def assert_same_rows(table, expected, keys):
+    """ Asserts two tables hold the same rows, index included, once both are sorted by keys """
+    table, expected = [pickle.loads(pickle.dumps(frame.sort_values(keys, kind='mergesort'))) for frame in [table, expected]]
+    pd.testing.assert_frame_equal(table, expected, check_exact=True)
+
+
+def bench_append(days=7):
+    """ Builds each cached season's tables from all but its last days of games, appends those games with
+    append_season and rebuilds the tables from every game. Asserts the appended tables hold the same rows as the
+    rebuilt ones, that a refresh against the full season then loads them rather than rebuilding, and that appending
+    the same games again changes nothing. Times the append against the rebuild. Tables are written under scratch
+    season folders that are removed afterwards. """
+
+    for season in cached_seasons():
+        games = season_games(season)
+        dates = pd.to_datetime([fbs.scorebox['date'] for fbs in games])
+        recent = dates > dates.max() - pd.Timedelta(days=days)
+        earlier = [fbs for fbs, new in zip(games, recent) if not new]
+        week = [fbs for fbs, new in zip(games, recent) if new]
+        appended, rebuilt = f"{season}-append", f"{season}-rebuild"
+        try:
+            season_tables(appended, earlier)
+            start = time.perf_counter()
+            append_season(appended, week, games)
+            append_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            expected = season_tables(rebuilt, games)
+            rebuild_seconds = time.perf_counter() - start
+
+            for table, reference in zip(season_tables(appended), expected):
+                assert_same_rows(table.table, reference.table, table.KEYS)
+            assert not any(table.rebuilt for table in [
+                table_class(appended, refresh=True, boxscores=games) for table_class in SEASON_TABLES
+            ])
+            append_season(appended, week, games)
+            for table, reference in zip(season_tables(appended), expected):
+                assert_same_rows(table.table, reference.table, table.KEYS)
+            print(f"append {season}: {len(week)} new games onto {len(earlier)}  append {append_seconds:6.2f}s  "
+                  f"rebuild {rebuild_seconds:6.2f}s ({rebuild_seconds / append_seconds:4.1f}x)  same rows, "
+                  f"fingerprints current, idempotent")
+        finally:
+            for key in [appended, rebuilt]:
+                shutil.rmtree(f"{CACHE_DIRECTORY}/{key}", ignore_errors=True)
+
+def bench_registry(weeks=17):
+    """ Creates the three feature space objects once per week, as BacktestPredictionsTable.build does, with the table
+    registry cleared before every week (each table loaded and concatenated again) and with it kept warm. Asserts a
+    registry whose budget fits a single table returns the same tables while evicting, and that a table changed on disk
+    is reloaded. Prints the hit and miss counts. """
+
+    seasons = cached_seasons()
+    for label, clear in [("cold", True), ("warm", False)]:
+        registry.clear()
+        hits, misses = registry.hits, registry.misses
+        start = time.perf_counter()
+        for _ in range(weeks):
+            if clear:
+                registry.clear()
+            spaces = [feature_class(seasons=seasons, refresh=False) for feature_class in FEATURE_SPACES]
+        seconds = time.perf_counter() - start
+        print(f"registry {label}: {weeks} weeks x {len(spaces)} feature spaces {seconds:6.2f}s  "
+              f"{registry.hits - hits} hits  {registry.misses - misses} misses  "
+              f"{registry.stats()['bytes'] / 2 ** 20:6.1f}MB held")
+
+    small = TableRegistry(budget=1)
+    for name in ["offense", "defenseTeam", "offense"]:
+        pd.testing.assert_frame_equal(small.seasons(name, seasons), registry.seasons(name, seasons))
+    assert small.stats()['tables'] == 1 and small.evictions == small.misses - 1, small.stats()
+
+    stem = f"{CACHE_DIRECTORY}/{seasons[0]}/score"
+    table = registry.load(stem)
+    fingerprint = read_fingerprint(stem)
+    write_fingerprint(stem, "changed")
+    try:
+        misses = registry.misses
+        registry.load(stem)
+        assert registry.misses == misses + 1
+    finally:
+        write_fingerprint(stem, fingerprint)
+    print(f"registry: eviction under a one-table budget and reload on a changed fingerprint ok  {registry.stats()}")
+
+
+def bench_build():
+    """ Force-rebuilds every season table of the cached seasons one after another in this process, then with
+    build_tables on one worker and on BUILD_WORKERS workers. Asserts the parallel builds reproduce the serial tables
+    and prints the wall-clock time of each next to the summed build time of the tables. """
+
+    seasons = cached_seasons()
+    start = time.perf_counter()
+    for season in seasons:
+        for name, table_class in SEASON_TABLE_NAMES.items():
+            table_class(season, refresh="force", boxscores=season_boxscores(season))
+    serial = time.perf_counter() - start
+    expected = {(name, season): pickle.loads(pickle.dumps(load_table(f"{CACHE_DIRECTORY}/{season}/{name}")))
+                for season in seasons for name in SEASON_TABLE_NAMES}
+    print(f"build serial: {len(expected)} tables {serial:6.2f}s")
+
+    for workers in sorted({1, BUILD_WORKERS}):
+        start = time.perf_counter()
+        results = build_tables(seasons, refresh="force", max_workers=workers)
+        wall = time.perf_counter() - start
+        assert all(rebuilt for rebuilt, _ in results.values()) and set(results) == set(expected)
+        for (name, season), table in expected.items():
+            loaded = pickle.loads(pickle.dumps(load_table(f"{CACHE_DIRECTORY}/{season}/{name}")))
+            pd.testing.assert_frame_equal(loaded, table, check_exact=True)
+        busy = sum(seconds for _, seconds in results.values())
+        print(f"build {workers} workers: wall {wall:6.2f}s  summed table builds {busy:6.2f}s "
+              f"({serial / wall:4.1f}x serial)  identical")
+
+
+def bench_incremental(days=7):
+    """ Builds the feature spaces with the last cached season missing its last days of games, appends those games and
+    refreshes the feature spaces, which extends them past their high-water mark. Asserts the extended tables equal a
+    full rebuild. Then builds gameday matchups a week after the mark from the cached per-source states and from the
+    full history, asserting both give the same features. The last season is staged under a scratch season folder and
+    the feature spaces are rebuilt from the cached seasons afterwards. """
+
+    seasons = cached_seasons()
+    games = season_games(seasons[-1])
+    dates = pd.to_datetime([fbs.scorebox['date'] for fbs in games])
+    recent = dates > dates.max() - pd.Timedelta(days=days)
+    scratch = seasons[-1] + 1000
+    feature_seasons = seasons[:-1] + [scratch]
+    try:
+        season_tables(scratch, [fbs for fbs, new in zip(games, recent) if not new])
+        for feature_class in FEATURE_SPACES:
+            feature_class(seasons=feature_seasons, refresh="force")
+        append_season(scratch, [fbs for fbs, new in zip(games, recent) if new])
+
+        for feature_class in FEATURE_SPACES:
+            start = time.perf_counter()
+            extended = feature_class(seasons=feature_seasons, refresh=True)
+            incremental = time.perf_counter() - start
+            start = time.perf_counter()
+            rebuilt = feature_class(seasons=feature_seasons, refresh="force")
+            full = time.perf_counter() - start
+            assert extended.extended and not rebuilt.extended
+            pd.testing.assert_frame_equal(pickle.loads(pickle.dumps(extended.table)),
+                                          pickle.loads(pickle.dumps(rebuilt.table)), check_exact=True)
+
+            matchups = rebuilt.default_matchups()
+            gameday = matchups[matchups.date == matchups.date.max()][['name', 'date', 'opp']]
+            gameday = gameday.assign(date=gameday.date + pd.Timedelta(days=7))
+            start = time.perf_counter()
+            features = feature_class(seasons=feature_seasons, refresh=False).features(gameday)
+            state = time.perf_counter() - start
+            start = time.perf_counter()
+            space = feature_class(seasons=feature_seasons, refresh=False)
+            expected = space.asof_features(gameday, space.sources())
+            history = time.perf_counter() - start
+            pd.testing.assert_frame_equal(features, expected, check_exact=True)
+            print(f"incremental {feature_class.__name__:<32} extend {incremental:6.2f}s  rebuild {full:6.2f}s  "
+                  f"identical;  gameday {len(gameday)} matchups from state {state * 1e3:7.1f}ms  "
+                  f"from history {history * 1e3:7.1f}ms  identical")
+    finally:
+        shutil.rmtree(f"{CACHE_DIRECTORY}/{scratch}", ignore_errors=True)
+        for feature_class in FEATURE_SPACES:
+            feature_class(seasons=seasons, refresh="force")
+
+
+def bench_models(weeks=3):
+    """ Trains the models of the last weeks of the cached seasons into a scratch model registry, then gets them again.
+    Asserts the reloaded models predict exactly what the trained ones do, that warm-started models grow by
+    MODEL_WARM_TREES trees each week, and prints train and reload times along with training on one core against
+    all of them. """
+
+    seasons = cached_seasons()
+    spaces = [feature_class(seasons=seasons, refresh=False) for feature_class in FEATURE_SPACES]
+    directory = tempfile.mkdtemp()
+    try:
+        for space in spaces:
+            cutoffs = sorted(space.table.date.unique())[-weeks:]
+            test = space.table[space.table.date >= cutoffs[0]]
+            for warm_start in [False, True]:
+                trained, start = ModelRegistry(directory), time.perf_counter()
+                predictions = [trained.get(space, cutoff, warm_start).predict(test) for cutoff in cutoffs]
+                train = time.perf_counter() - start
+                loaded, start = ModelRegistry(directory), time.perf_counter()
+                reloaded = [loaded.get(space, cutoff, warm_start) for cutoff in cutoffs]
+                load = time.perf_counter() - start
+                assert trained.trained == loaded.loaded == len(cutoffs) and loaded.trained == 0
+                for expected, model in zip(predictions, reloaded):
+                    np.testing.assert_array_equal(model.predict(test), expected)
+                if warm_start:
+                    trees = [model.regressor.get_params()[model.SIZE] for model in reloaded]
+                    assert np.all(np.diff(trees) == MODEL_WARM_TREES), trees
+                print(f"models {space.name:<28} {'warm' if warm_start else 'cold'} {len(cutoffs)} cutoffs  "
+                      f"train {train:6.2f}s  reload {load:6.2f}s  identical")
+
+            train = space.table[space.table.date < cutoffs[-1]]
+            model = FootballRandomForestModel(train)
+            for jobs in [1, -1]:
+                start = time.perf_counter()
+                RandomForestRegressor(**model.params, n_jobs=jobs).fit(model.X, model.Y)
+                print(f"models {space.name:<28} n_jobs={jobs:<3} fit {time.perf_counter() - start:6.2f}s  "
+                      f"on {os.cpu_count()} cores")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_backends(weeks=6):
+    """ Backtests every model backend on each feature space over its last weeks: a model trained on the rows before
+    each week predicts that week. Prints the training time, the prediction latency per week and the mean absolute
+    error and root mean squared error against the scored DraftKings points, summed over the weeks. """
+
+    seasons = cached_seasons()
+    for feature_class in FEATURE_SPACES:
+        space = feature_class(seasons=seasons, refresh=False)
+        cutoffs = sorted(space.table.date.unique())[-weeks:]
+        for backend, model_class in MODEL_CLASSES.items():
+            train = predict = 0
+            errors = []
+            for cutoff in cutoffs:
+                start = time.perf_counter()
+                model = model_class(space.table[space.table.date < cutoff])
+                model.train()
+                train += time.perf_counter() - start
+                test = space.table[space.table.date == cutoff]
+                start = time.perf_counter()
+                predictions = model.predict(test)
+                predict += time.perf_counter() - start
+                errors.append(predictions - test.Y.to_numpy())
+            errors = np.concatenate(errors)
+            print(f"backends {space.name:<32} {backend:<8} {len(space.table.columns):4d} columns  "
+                  f"train {train / len(cutoffs):6.2f}s/week  predict {predict / len(cutoffs) * 1e3:7.1f}ms/week  "
+                  f"MAE {np.abs(errors).mean():6.3f}  RMSE {np.sqrt(np.square(errors).mean()):6.3f}  "
+                  f"over {len(errors)} matchups")
+
+
+def bench_slate(late=20, inactive=5):
+    """ Scores a gameday slate a week after the last cached games with a SlatePredictor, holding out late players of
+    each position group. Asserts the predictions equal building each feature space on the slate's matchups and
+    predicting with its model, as BacktestPredictionsTable.build did. Then re-scores after a salary change, and after
+    inactive players are dropped and the late players added, printing the time of each step. """
+
+    seasons = cached_seasons()
+    slate = []
+    for group, feature_class in SlatePredictor.GROUPS.items():
+        matchups = feature_class(seasons=seasons, refresh=False).default_matchups()
+        matchups = matchups[matchups.date == matchups.date.max()][['name', 'date', 'opp']].drop_duplicates('name')
+        slate.append(matchups.assign(**{'Roster Position': "RB/FLEX" if group == "PP" else group}))
+    slate = pd.concat(slate, ignore_index=True)
+    date = slate.date.max() + pd.Timedelta(days=7)
+    slate = slate.assign(date=date, Salary=5000)
+    late_players = slate.groupby('Roster Position').tail(late).index
+
+    start = time.perf_counter()
+    predictor = SlatePredictor(seasons=seasons, date=date)
+    load = time.perf_counter() - start
+    start = time.perf_counter()
+    predictions = predictor.predict(slate.drop(late_players))
+    score = time.perf_counter() - start
+    start = time.perf_counter()
+    repriced = predictor.predict(slate.drop(late_players).assign(Salary=5200))
+    reprice = time.perf_counter() - start
+    swapped = slate.drop(slate.drop(late_players).sample(inactive, random_state=0).index)
+    start = time.perf_counter()
+    final = predictor.predict(swapped)
+    swap = time.perf_counter() - start
+
+    pd.testing.assert_series_equal(repriced, predictions)
+    for group, feature_class in SlatePredictor.GROUPS.items():
+        space = feature_class(seasons=seasons, refresh=False)
+        model = models.get(space, date)
+        players = swapped[SlatePredictor.group(swapped['Roster Position']) == group]
+        space.build(matchups=players[['name', 'date', 'opp']], add_y=False)
+        np.testing.assert_array_equal(final[players.index].to_numpy(), model.predict(space.table))
+    states = sum(state is not None for state in predictor.states.values())
+    print(f"slate: {len(slate)} players  {states}/{len(predictor.states)} groups from as-of states  load {load:6.2f}s  score {len(predictions)} {score * 1e3:7.1f}ms  "
+          f"re-price {reprice * 1e3:7.1f}ms  drop {inactive} add {len(late_players)} late {swap * 1e3:7.1f}ms  "
+          f"identical to building the feature spaces")
+
+
+def legacy_model_parse(data):
+    """ FootballRandomForestModel.parse before the FeatureMatrix: a dataframe with the key columns dropped, missing
+    values filled and the target popped, handed to sklearn through .values """
+    Y = None
+    X = data.drop(columns=['name', 'date', 'opp']).fillna(0)
+    if 'Y' in X.columns:
+        Y = X['Y']
+        del X['Y']
+    return X.values, Y, X.columns
+
+
+def peak(fn):
+    """ Calls fn. Returns its result, wall-clock seconds and peak traced allocation in megabytes """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak_bytes / 2 ** 20
+
+
+def bench_matrix(copies=16, weeks=6):
+    """ Parses each feature space stacked copies times into what the random forest fits on (float32 after sklearn's
+    check_array), through the legacy dataframe parse and through a FeatureMatrix, printing time and peak memory and
+    asserting sklearn takes the FeatureMatrix array without a copy. Then parses the training rows of the last weeks
+    walk-forward, re-parsing the frame every week against taking rows of one FeatureMatrix. Asserts a forest trained
+    and predicting through either gives identical predictions. """
+
+    seasons = cached_seasons()
+    for feature_class in FEATURE_SPACES:
+        space = feature_class(seasons=seasons, refresh=False)
+        table = stacked_seasons([(None, space.table)], copies)
+        (X, _, _), legacy, legacy_mb = peak(lambda: legacy_model_parse(table))
+        _, convert, convert_mb = peak(lambda: check_array(X, dtype=np.float32))
+        matrix, typed, typed_mb = peak(lambda: FeatureMatrix.from_frame(table))
+        assert check_array(matrix.values, dtype=np.float32) is matrix.values
+        np.testing.assert_array_equal(matrix.values, X.astype(np.float32))
+
+        cutoffs = sorted(table.date.unique())[-weeks:]
+        start = time.perf_counter()
+        for cutoff in cutoffs:
+            check_array(legacy_model_parse(table[table.date < cutoff])[0], dtype=np.float32)
+        reparse = time.perf_counter() - start
+        start = time.perf_counter()
+        for cutoff in cutoffs:
+            matrix.take((table.date < cutoff).to_numpy())
+        take = time.perf_counter() - start
+        print(f"matrix {space.name:<32} {copies}x {X.shape[0]:7d} rows  legacy parse {legacy:6.3f}s {legacy_mb:7.1f}MB "
+              f"+ sklearn copy {convert:6.3f}s {convert_mb:7.1f}MB  FeatureMatrix {typed:6.3f}s {typed_mb:7.1f}MB "
+              f"no copy;  {weeks} weeks walk-forward re-parse {reparse:6.3f}s  take {take:6.3f}s")
+
+        X, Y, _ = legacy_model_parse(space.table)
+        legacy_model = RandomForestRegressor(n_estimators=20, random_state=0).fit(X, Y)
+        model = FootballRandomForestModel(space.table, n_estimators=20)
+        model.train()
+        np.testing.assert_array_equal(model.predict(space.table), legacy_model.predict(X))
+
+
+def bench_sweep(folds=3):
+    """ Runs a small walk-forward sweep of both backends over two as-of windows into a scratch results table, then
+    runs it again to show every fold is picked up from the results table. Asserts a forest fold of the sweep scores
+    exactly what a FootballRandomForestModel trained on the feature space rows before its cutoff does, and that the
+    shared memory is released. Prints the sweep time and the best combination per group. """
+
+    seasons = cached_seasons()
+    grid = {"forest": {"n_estimators": [20, 50], "max_depth": [None, 8]}, "boosting": {"max_iter": [50, 100]}}
+    windows = [3, 5]
+    directory = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        results = sweep(seasons, grid, windows, folds, directory=directory)
+        seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        resumed = sweep(seasons, grid, windows, folds, directory=directory)
+        resume = time.perf_counter() - start
+        assert len(results) == len(resumed) == len(SlatePredictor.GROUPS) * len(windows) * 6 * folds
+        assert not glob.glob("/dev/shm/psm_*"), glob.glob("/dev/shm/psm_*")
+
+        row = results[(results.backend == "forest") & (results.window == 3)].iloc[0]
+        space = SlatePredictor.GROUPS[row.group](seasons=seasons, refresh=False, window=3)
+        space.build()
+        model = FootballRandomForestModel(space.table[space.table.date < row.cutoff], **json.loads(row.params))
+        model.train()
+        test = space.table[space.table.date == row.cutoff]
+        assert np.abs(model.predict(test) - test.Y.to_numpy()).mean() == row.mae
+
+        print(f"sweep: {len(results)} folds on {BUILD_WORKERS} workers {seconds:6.2f}s  "
+              f"({results.seconds.sum():6.2f}s of training)  resumed from the results table {resume:6.2f}s")
+        print(sweep_summary(results).groupby('group').head(1).to_string(index=False))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def backtest_matchups(seasons, weeks):
+    """ Returns backtest matchups of the last weeks game dates of the cached seasons: the quarterbacks, position
+    players and defenses that played on each date, with year, week and Roster Position columns """
+    offense, defense = registry.seasons("offense", seasons), registry.seasons("defenseTeam", seasons)
+    frames = []
+    for week, date in enumerate(sorted(offense.date.unique())[-weeks:]):
+        games = offense[offense.date == date]
+        frames += [
+            games[games.pass_att > 10].assign(**{'Roster Position': "QB"}),
+            games[games.pass_att <= 1].assign(**{'Roster Position': "RB/FLEX"}),
+            defense[defense.date == date].assign(**{'Roster Position': "DST"}),
+        ]
+        frames[-3:] = [frame.assign(year=pd.Timestamp(date).year, week=week + 1) for frame in frames[-3:]]
+    return pd.concat(frames)[['name', 'date', 'opp', 'year', 'week', 'Roster Position']]
+
+
+def legacy_backtest(seasons, matchups):
+    """ BacktestPredictionsTable.build before the walk-forward engine: per week, creates the three feature spaces
+    again, trains their forests one after another and builds the week's features on its matchups """
+    out = {}
+    for nm, players in matchups.groupby(['year', 'week']):
+        date = players.date.iloc[0]
+        predictions = []
+        for group, feature_class in SlatePredictor.GROUPS.items():
+            space = feature_class(seasons=seasons, refresh=False)
+            model = FootballRandomForestModel(space.table[space.table.date < date])
+            model.train()
+            space.build(matchups=players[SlatePredictor.group(players['Roster Position']) == group], add_y=False)
+            predictions.append(pd.Series(dict(zip(space.table['name'].values, model.predict(space.table)))))
+        out[nm] = pd.concat(predictions)
+    return pd.DataFrame(out).stack().stack(0)
+
+
+def bench_walk_forward(weeks=6):
+    """ Backtests the last weeks of the cached seasons with the legacy per-week loop and with walk_forward into a
+    scratch model registry, cold (every model trained on the pool) and warm (every model loaded). Asserts both give
+    the same predictions table and prints walk_forward's per-week timing. """
+
+    seasons = cached_seasons()
+    matchups = backtest_matchups(seasons, weeks)
+    start = time.perf_counter()
+    expected = legacy_backtest(seasons, matchups)
+    legacy = time.perf_counter() - start
+    directory = tempfile.mkdtemp()
+    try:
+        for label in ["cold", "warm"]:
+            start = time.perf_counter()
+            out, timings = walk_forward(seasons, matchups, model_registry=ModelRegistry(directory))
+            seconds = time.perf_counter() - start
+            table = pd.DataFrame(out).stack().stack(0)
+            pd.testing.assert_series_equal(table.sort_index(), expected.sort_index(), check_exact=True)
+            print(f"walk_forward {label}: {len(matchups)} matchups over {weeks} weeks  legacy {legacy:6.2f}s  "
+                  f"engine {seconds:6.2f}s on {BUILD_WORKERS} workers  identical")
+            print(timings.round(3).to_string())
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+BENCHMARKS = {
+    "parse": bench_parse,
+    "floatify": bench_floatify,
+    "team_table": bench_team_table,
+    "defense_team": bench_defense_team,
+    "cache_load": bench_cache_load,
+    "refresh": bench_refresh,
+    "asof": bench_asof,
+    "features": bench_features,
+    "memory": bench_memory,
+    "append": bench_append,
+    "registry": bench_registry,
+    "build": bench_build,
+    "incremental": bench_incremental,
+    "models": bench_models,
+    "backends": bench_backends,
+    "slate": bench_slate,
+    "matrix": bench_matrix,
+    "sweep": bench_sweep,
+    "walk_forward": bench_walk_forward,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -3,6 +3,41 @@ from os.path import expanduser
 
 PROJECT_DIRECTORY =  os.path.join(expanduser("~"), "teachableDFS")
 CACHE_DIRECTORY = os.path.join(PROJECT_DIRECTORY, "cache/database")
+HTML_CACHE_DIRECTORY = os.path.join(PROJECT_DIRECTORY, "cache/html")
+MODEL_DIRECTORY = os.path.join(PROJECT_DIRECTORY, "cache/models")
+SWEEP_DIRECTORY = os.path.join(PROJECT_DIRECTORY, "cache/sweeps")
+SHARD_SIZE = 64  # games buffered per boxscore shard
+CACHE_FORMAT = "columns"  # "columns" (memory-mapped .npy folders) or "pickle"
+COLUMN_CACHE_VERSION = 1  # bump when the layout of a columnar table folder changes
+COMPACT_DTYPES = False  # build tables with categorical identifiers over a shared dictionary and float32 stats
+REFRESH_STALE_ONLY = True  # refresh=True rebuilds a cached table only if its inputs changed; refresh="force" always does
+BUILD_WORKERS = os.cpu_count()  # processes build_tables builds season tables on
+ASOF_WINDOW = 5  # most recent games the as-of features of the feature spaces average
+MODEL_PARAMS = {"n_estimators": 100, "random_state": 0}  # RandomForestRegressor hyperparameters of the models
+BOOSTING_PARAMS = {"max_iter": 100, "learning_rate": 0.1, "early_stopping": False, "random_state": 0}  # HistGradientBoostingRegressor hyperparameters
+MODEL_BACKENDS = {}  # model backend, "forest" or "boosting", of a feature space by name; "forest" when missing
+MODEL_JOBS = -1  # cores a model trains and predicts on, -1 for all of them
+MODEL_WARM_TREES = 20  # trees a warm-started model adds when it is extended to a later training cutoff
+SWEEP_WINDOWS = [3, 5, 8]  # as-of windows a hyperparameter sweep tries
+SWEEP_GRID = {  # hyperparameter grid a sweep tries for each model backend
+    "forest": {"n_estimators": [100, 200], "max_depth": [None, 12], "min_samples_leaf": [1, 5]},
+    "boosting": {"max_iter": [100, 200], "learning_rate": [0.05, 0.1], "max_leaf_nodes": [15, 31]},
+}
+SWEEP_FOLDS = 6  # last game dates of a feature space a sweep holds out, each trained on the games before it
+TABLE_REGISTRY_BUDGET = 2 * 2 ** 30  # bytes of loaded tables the table registry keeps before evicting the least used
+
+BASE_URL = "https://www.pro-football-reference.com"
+
+# Scraping - sports-reference blocks clients that make more than ~20 requests a minute, so the per-host rate is the
+# real limit on network throughput. Extra fetch workers let the waiting on several pages overlap, and parsing runs
+# on its own pool of PARSE_WORKERS processes.
+SCRAPE_WORKERS = 8
+PARSE_WORKERS = os.cpu_count()
+REQUESTS_PER_SECOND = 0.33
+MAX_RETRIES = 3
+REQUEST_TIMEOUT = (5.0, 30.0)  # (connect, read) seconds
+RETRY_BACKOFF = 2.0
+HTML_PARSER = "html.parser"  # "lxml" is several times faster when installed
 
 SEASON_START_DATES = {
     2018: "2018.10.10",
@@ -16,3 +51,12 @@ class DailyFantasyDataScienceError(Exception):
     def __init__(self):
         self.message = "Attempted to access file in the /cache/ folder. If /cache/ doesn't exist run os.makedirs(CACHE_DIRECTORY) to create the empty folder. See the 'Welcome' lesson for more information"
         super().__init__(self.message)
+
+
+class StaleCacheError(DailyFantasyDataScienceError):
+    """Exception raised when a cached table was written in a layout this code no longer reads """
+
+    def __init__(self, path):
+        super().__init__()
+        self.message = f"{path} was written with a different cache layout. Rebuild the table with refresh=True"
+        self.args = (self.message,)
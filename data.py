@@ -1,45 +1,82 @@
 import os
+import glob
+import json
+import pickle
+import shutil
+import inspect
+import hashlib
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import pandas as pd
 import numpy as np
 
 from tqdm import tqdm
+from pandas.api.types import CategoricalDtype, infer_dtype
 
-from config import CACHE_DIRECTORY, DailyFantasyDataScienceError
+from config import CACHE_DIRECTORY, SHARD_SIZE, CACHE_FORMAT, COLUMN_CACHE_VERSION, REFRESH_STALE_ONLY, COMPACT_DTYPES
+from config import SEASON_START_DATES, TABLE_REGISTRY_BUDGET, BUILD_WORKERS, ASOF_WINDOW
+from config import DailyFantasyDataScienceError, StaleCacheError
 from maps import team_map_inv
+from web import load_boxscores
 
 
 class FootballTable(object):
     """ Archetypal class for feature spaces. Contains functionality that is useful for all downstream classes """
 
-    def __init__(self, name, seasons, refresh=False):
+    # Names of the season tables the feature space is built from. Bump VERSION when a change outside the class body
+    # (a helper it calls) changes what build produces.
+    UPSTREAM = []
+    VERSION = 1
+
+    def __init__(self, name, seasons, refresh=False, window=ASOF_WINDOW):
         """
             Required Inputs: 
                 name: Name of the feature space
                 seasons: List of season to load feature sets for
             Optional Inputs:
-                refresh: Boolean determining if the feature space should be refreshed/built
+                refresh: Boolean determining if the feature space should be refreshed/built. With REFRESH_STALE_ONLY
+                    a cached feature space whose inputs are unchanged is loaded instead; "force" always rebuilds
+                window: Number of most recent games the as-of features average
         """
 
         self.name = name
         self.seasons = seasons
-
-        if refresh:
-            self.build()
-            self.cache()
+        self.window = window
+        self.stem = table_stem(name)
+        self.asof_indexes = {}
+        self.input_fingerprint = table_fingerprint(self, self.inputs()) if refresh else None
+        self.rebuilt = bool(refresh) and is_stale(self.stem, self.input_fingerprint, refresh)
+        self.extended = False
+
+        if self.rebuilt:
+            self.refresh_table(incremental=refresh != "force")
         else:
             self.load()
 
+    def inputs(self):
+        """ Returns what the feature space is built from: its seasons, the start date of the first season, the as-of
+        window and the fingerprints of the upstream season tables """
+        return [self.seasons, SEASON_START_DATES.get(min(self.seasons)), self.window] + [
+            cached_fingerprint(name, season) for name in self.UPSTREAM for season in self.seasons
+        ]
+
     def cache(self):
-        """ Stores the feature space object as a pickle in the corresponding season folder """
+        """ Stores the feature space object in the cache folder (see save_table) along with its fingerprint """
         try:
-            self.table.to_pickle(f"{CACHE_DIRECTORY}/{self.name}.pkl")
+            save_table(self.table, self.stem)
+            write_fingerprint(self.stem, self.input_fingerprint)
         except FileNotFoundError:
             raise DailyFantasyDataScienceError()
 
-    def load(self):
-        """ Loads a feature space object as a pickle in the corresponding season folder """
+    def load(self, columns=None):
+        """ Loads a feature space object from the cache folder. The whole table is shared read-only through the table
+        registry; takes an optional list of columns to read on their own instead. """
+        if columns is None:
+            self.table = registry.load(self.stem)
+            return
         try:
-            self.table = pd.read_pickle(f"{CACHE_DIRECTORY}/{self.name}.pkl")
+            self.table = load_table(self.stem, columns)
         except FileNotFoundError:
             raise DailyFantasyDataScienceError()
 
@@ -47,45 +84,339 @@ class FootballTable(object):
         """ Placeholder build function"""
         raise Exception("Override build function")
 
-    @staticmethod
-    def query_asof(table, name, date):
+    def default_matchups(self):
+        """ Placeholder for the matchups build uses when none are passed """
+        raise Exception("Override default_matchups function")
+
+    def sources(self):
+        """ Placeholder for the (table, matchups column, prefix) sources of the features """
+        raise Exception("Override sources function")
+
+    def refresh_table(self, incremental=True):
+        """ Rebuilds the feature space and caches it. Features are as of past games only, so when the upstream rows
+        up to the high-water mark stored with the cached table are unchanged, the cached rows are kept and only the
+        default matchups after the mark are built and appended (extended is set). Then caches the per-source state of
+        every name (see asof_state) and the new high-water mark. """
+
+        mark = max(registry.seasons(name, self.seasons)['date'].max() for name in self.UPSTREAM)
+        watermark = read_watermark(self.stem) if incremental else None
+        if watermark is not None and watermark['shape'] == self.shape_fingerprint() \
+                and watermark['history'] == self.history(pd.Timestamp(watermark['date'])):
+            try:
+                cached = registry.load(self.stem)
+            except DailyFantasyDataScienceError:
+                cached = pd.DataFrame()
+            matchups = self.default_matchups()
+            self.build(matchups=matchups[matchups['date'] > pd.Timestamp(watermark['date'])])
+            new_rows = compact_table(self.table) if COMPACT_DTYPES else self.table
+            if len(cached.columns) and set(new_rows.columns) <= set(cached.columns):
+                self.table = concat_tables([cached, new_rows]) if len(new_rows) else cached
+                self.extended = True
+
+        if not self.extended:
+            self.build()
+            if COMPACT_DTYPES:
+                self.table = compact_table(self.table)
+        self.cache()
+        self.cache_state(mark)
+
+    def shape_fingerprint(self):
+        """ Returns the fingerprint of what decides the feature space's rows besides the upstream rows: its class,
+        code, dtype mode, start date and as-of window """
+        return fingerprint(
+            type(self).__name__, self.VERSION, code_fingerprint(type(self)), COMPACT_DTYPES, self.feature_space_start,
+            self.window
+        )
+
+    def history(self, mark):
+        """ Returns the sha1 of the upstream rows played on or before mark. A season table whose games all precede the
+        mark stands in with its fingerprint, so only the rows of the season the mark falls in are hashed. """
+        digest = hashlib.sha1()
+        for name in self.UPSTREAM:
+            for season in self.seasons:
+                stem = table_stem(name, season)
+                table = registry.load(stem)
+                if table['date'].max() < mark and read_fingerprint(stem) is not None:
+                    digest.update(read_fingerprint(stem).encode())
+                    continue
+                digest.update(frame_fingerprint(table[table['date'] <= mark]).encode())
+        return digest.hexdigest()
+
+    def cache_state(self, mark):
+        """ Caches the state of every name in each source as of the high-water mark (see AsofIndex.latest), and the
+        mark itself along with what the feature space was built from """
+        optional = []
+        for position, (table, _, _) in enumerate(self.sources()):
+            state, optional_columns = self.asof_index(table).latest()
+            save_table(state, f"{self.stem}_state{position}")
+            optional.append(optional_columns)
+        write_watermark(self.stem, {
+            "date": str(mark), "shape": self.shape_fingerprint(), "history": self.history(mark),
+            "fingerprint": self.input_fingerprint, "optional": optional,
+        })
+
+    def asof_state(self, matchups):
+        """ Returns the cached per-source states as (state, optional columns) pairs when they can answer the
+        matchups: every matchup is after the high-water mark and the upstream tables are the ones the states were
+        cached from. Otherwise returns None. """
+        watermark = read_watermark(self.stem)
+        if watermark is None or not len(matchups):
+            return None
+        if not (pd.to_datetime(matchups['date']) > pd.Timestamp(watermark['date'])).all():
+            return None
+        if watermark['fingerprint'] != table_fingerprint(self, self.inputs()):
+            return None
+        return [(registry.load(f"{self.stem}_state{position}"), optional)
+                for position, optional in enumerate(watermark['optional'])]
+
+    def features(self, matchups):
+        """ Takes a matchups dataframe. Returns the features of every matchup from the feature space's sources (see
+        asof_features), looked up in the cached per-source states when they can answer them rather than from the
+        full history. """
+        return self.asof_features(matchups, self.sources(), self.asof_state(matchups))
+
+    def asof_index(self, table):
+        """ Returns the AsofIndex of a table, building it the first time the table is queried """
+        if id(table) not in self.asof_indexes:
+            self.asof_indexes[id(table)] = (table, AsofIndex(table, self.window))
+        return self.asof_indexes[id(table)][1]
+
+    def asof_features(self, matchups, sources, states=None):
+        """ Takes a matchups dataframe with a date column and a list of (table, matchups column, prefix) sources. For
+        every matchup at once, averages each source table's last window games of the matchups column's name before the
+        date, as query_asof does for one. Takes optional per-source states (see asof_state) to answer from instead
+        of the tables. Returns a dataframe laid out like the per-matchup query_asof records glued together: the
+        prefixed columns of a record sorted in descending order, the first source to return a column taking
+        precedence, and columns in order of first appearance across the records. """
+
+        values, present = {}, {}
+        for source, (table, column, prefix) in enumerate(sources):
+            if states is None:
+                index = self.asof_index(table)
+                columns = index.columns
+                means, keep = index.query_frame(matchups[column].values, matchups['date'].values)
+            else:
+                columns = states[source][0].columns
+                means, keep = state_frame(*states[source], matchups[column].values)
+            for position, name in enumerate(columns):
+                label = prefix + name
+                if label not in values:
+                    values[label], present[label] = means[:, position], keep[:, position]
+                else:
+                    take = keep[:, position] & ~present[label]
+                    values[label] = np.where(take, means[:, position], values[label])
+                    present[label] = present[label] | keep[:, position]
+
+        labels = list(values)
+        presence = np.column_stack([present[label] for label in labels]) if labels else np.empty((len(matchups), 0))
+        patterns, first = np.unique(presence, axis=0, return_index=True)
+        order = []
+        for pattern in patterns[np.argsort(first)]:
+            record = sorted((label for label, has in zip(labels, pattern) if has), reverse=True)
+            order += [label for label in record if label not in order]
+
+        features = pd.DataFrame(
+            {label: np.where(present[label], values[label], np.nan) for label in order},
+            index=np.zeros(len(matchups), dtype=np.int64)
+        )
+        features.columns.name = 'index'
+        return features
+
+    def query_asof(self, table, name, date):
         """ Filters the table to only rows that match the name argument and only rows where the game took place before
-        the date argument. Returns a dataframe of the mean value of each column from the five most recent games. """
+        the date argument. Returns a dataframe of the mean value of each column from the window most recent games. The
+        lookup is answered from the table's AsofIndex rather than a scan of the table. """
+        return self.asof_index(table).query(name, date)
+
 
-        out = table[table.name == name].copy()
-        out = out[out['date'] < date].sort_values('date', ascending=True)
-        return out.fillna(0).tail(5).mean(numeric_only=True)
+class AsofIndex(object):
+    """ As-of lookups over a table with name and date columns. The numeric columns (missing values filled with 0) are
+    stored once as a single float array whose rows are grouped by name and sorted by date, so the games of a name
+    before a date are a binary search away. Results are memoized by (name, date): every player facing a defense on
+    a date asks for that same defense record.
+
+    Object columns holding numbers (like pts_allowed) are kept too. A scan only averages such a column when fillna
+    turns it numeric, i.e. when every earlier game of the name has a number or nothing in it, so a running count of
+    the non-numeric cells in each is stored to answer that per lookup. """
+
+    def __init__(self, table, window=5):
+        """
+            Required Inputs:
+                table: Dataframe with name and date columns
+            Optional Inputs:
+                window: Number of most recent games averaged by a query
+        """
+        self.window = window
+        codes, names = pd.factorize(table['name'])
+        dates = table['date'].to_numpy(dtype='datetime64[ns]')
+        order = np.lexsort((dates, codes))
+
+        columns, values, blockers = [], [], []
+        for position, (column_name, column) in enumerate(table.items()):
+            if isinstance(column.dtype, np.dtype) and column.dtype.kind in "biuf":
+                values.append(column.fillna(0).to_numpy(dtype=np.float64))
+            elif column.dtype == object:
+                numbers = object_numbers(column)
+                if not numbers.notna().any() and not column.isna().any():
+                    continue
+                values.append(numbers.fillna(0).to_numpy(dtype=np.float64))
+                blockers.append((len(columns), (numbers.isna() & column.notna()).to_numpy()[order]))
+            else:
+                continue
+            columns.append(column_name)
+
+        self.columns = pd.Index(columns)
+        self.names = names
+        self.codes = codes[order]
+        self.dates = dates[order]
+        self.values = np.ascontiguousarray(np.column_stack(values)[order]) if values else np.empty((len(table), 0))
+        self.optional = np.array([column for column, _ in blockers], dtype=int)
+        self.blocked = np.zeros((len(blockers), len(table) + 1), dtype=np.int64)
+        for row, (_, cells) in enumerate(blockers):
+            self.blocked[row, 1:] = np.cumsum(cells)
+        self.bounds = np.searchsorted(self.codes, np.arange(len(names) + 1))
+        self.ranges = {name: (self.bounds[code], self.bounds[code + 1]) for code, name in enumerate(names)}
+        self.memo = {}
+        self.rolled = None
+
+    def query(self, name, date):
+        """ Takes a name and a date. Returns a series of the mean of each numeric column over the name's last window
+        games before the date, nan when there are none. """
+
+        key = (name, date)
+        if key not in self.memo:
+            start, stop = self.ranges.get(name, (0, 0))
+            if pd.isna(date):
+                stop = start
+            else:
+                stop = start + np.searchsorted(self.dates[start:stop], pd.Timestamp(date).to_datetime64(), 'left')
+            games = self.values[max(start, stop - self.window):stop]
+            means = games.mean(axis=0) if len(games) else np.full(len(self.columns), np.nan)
+            keep = np.ones(len(self.columns), dtype=bool)
+            keep[self.optional] = (stop > start) & (self.blocked[:, stop] == self.blocked[:, start])
+            self.memo[key] = (means[keep], self.columns[keep])
+        means, columns = self.memo[key]
+        return pd.Series(means.copy(), index=columns)
+
+    def window_means(self):
+        """ Returns the mean of the numeric columns over every row's window: the row and the window - 1 rows of the
+        same name before it. The rows are summed oldest first, in the same order query sums them, so both give
+        bit-identical means. Computed once with one shifted, vectorized add per window slot. """
+
+        if self.rolled is None:
+            position = np.arange(len(self.codes)) - np.where(self.codes >= 0, self.bounds[self.codes], 0)
+            total = np.zeros_like(self.values)
+            for back in range(self.window - 1, -1, -1):
+                rows = np.flatnonzero(position >= back)
+                total[rows] += self.values[rows - back]
+            self.rolled = total / np.minimum(position + 1, self.window)[:, None]
+        return self.rolled
+
+    def latest(self):
+        """ Returns the state of every name after its last dated game: a dataframe indexed by name holding the means
+        query returns for any later date, nan in the columns it would leave out, and the list of optional columns. """
+        rows = np.flatnonzero((self.codes >= 0) & ~np.isnat(self.dates))
+        codes = self.codes[rows]
+        last = rows[np.append(codes[1:] != codes[:-1], True)] if len(rows) else rows
+        means = self.window_means()[last]
+        first = self.bounds[self.codes[last]]
+        kept = (self.blocked[:, last + 1] == self.blocked[:, first]).T
+        means[:, self.optional] = np.where(kept, means[:, self.optional], np.nan)
+        state = pd.DataFrame(means, index=self.names[self.codes[last]], columns=self.columns)
+        return state, [str(column) for column in self.columns[self.optional]]
+
+    def query_frame(self, names, dates):
+        """ Takes arrays of names and dates and answers every query at once: an as-of merge finds the last row of each
+        name before each date and the query takes that row's window mean. Returns a 2D array of the means (nan when
+        the name has no earlier games) and a boolean array of the same shape marking the columns query would
+        return. """
+
+        dates = pd.to_datetime(pd.Series(dates)).to_numpy(dtype='datetime64[ns]')
+        queries = pd.DataFrame({"code": self.names.get_indexer(names), "date": dates, "query": np.arange(len(dates))})
+        queries = queries[(queries.code >= 0) & queries.date.notna()].sort_values('date', kind='mergesort')
+        rows = pd.DataFrame({"code": self.codes, "date": self.dates, "row": np.arange(len(self.dates))})
+        rows = rows[(rows.code >= 0) & rows.date.notna()].sort_values('date', kind='mergesort')
+        matched = pd.merge_asof(queries, rows, on='date', by='code', allow_exact_matches=False).dropna(subset=['row'])
+
+        query, last = matched['query'].to_numpy(), matched['row'].to_numpy(dtype=np.int64)
+        means = np.full((len(dates), len(self.columns)), np.nan)
+        means[query] = self.window_means()[last]
+        keep = np.ones(means.shape, dtype=bool)
+        keep[:, self.optional] = False
+        first = self.bounds[self.codes[last]]
+        keep[np.ix_(query, self.optional)] = (self.blocked[:, last + 1] == self.blocked[:, first]).T
+        return means, keep
+
+
+def state_frame(state, optional, names):
+    """ Takes a per-source state (see AsofIndex.latest), its optional columns and an array of names. Returns the means
+    and keep arrays AsofIndex.query_frame would for those names at any date after the state's. """
+    rows = state.index.get_indexer(names)
+    found = rows >= 0
+    means = np.full((len(names), state.shape[1]), np.nan)
+    means[found] = state.to_numpy(dtype=np.float64)[rows[found]]
+    keep = ~np.isnan(means)
+    keep[~found] = ~state.columns.isin(optional)
+    return means, keep
+
+
+def object_numbers(column):
+    """ Takes an object column. Returns its int and float cells as floats, nan everywhere else """
+    if infer_dtype(column, skipna=True) in ("string", "empty"):
+        return pd.Series(np.nan, index=column.index)
+    is_number = column.map(
+        lambda value: isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool)
+    )
+    return column.where(is_number.astype(bool)).astype(np.float64)
 
 
 class ReferenceTable(object):
     """ Archetypal class for reference data. Contains functionality that is useful for all downstream classes """
 
+    # Names of the reference tables and paths of the files the table is built from. Bump VERSION when a change
+    # outside the class body changes what build produces.
+    UPSTREAM = []
+    REF_FILES = []
+    VERSION = 1
+
     def __init__(self, name, refresh=False):
         """
         Required Inputs: 
             name: Name of the feature space
         Optional Inputs:
-            refresh: Boolean determining if the reference tables should be refreshed/built
+            refresh: Boolean determining if the reference tables should be refreshed/built. With REFRESH_STALE_ONLY
+                a cached table whose inputs are unchanged is loaded instead; "force" always rebuilds
         """
 
         self.name = name
-        if refresh:
+        self.stem = table_stem(name)
+        self.input_fingerprint = table_fingerprint(self, self.inputs()) if refresh else None
+        self.rebuilt = bool(refresh) and is_stale(self.stem, self.input_fingerprint, refresh)
+
+        if self.rebuilt:
             self.build()
+            if COMPACT_DTYPES:
+                self.table = compact_table(self.table)
             self.cache()
         else:
             self.load()
 
+    def inputs(self):
+        """ Returns what the table is built from: the fingerprints of its upstream tables and reference files """
+        return [cached_fingerprint(name) for name in self.UPSTREAM] + [file_fingerprint(f) for f in self.REF_FILES]
+
     def cache(self):
-        """ Stores the reference object as a pickle in the corresponding season folder """ 
+        """ Stores the reference object in the cache folder (see save_table) along with its fingerprint """ 
         try:
-            self.table.to_pickle(f"{CACHE_DIRECTORY}/{self.name}.pkl")
+            save_table(self.table, self.stem)
+            write_fingerprint(self.stem, self.input_fingerprint)
         except FileNotFoundError:
             raise DailyFantasyDataScienceError()
 
-    def load(self):
-        """ Loads a reference object as a pickle in the corresponding season folder """ 
+    def load(self, columns=None):
+        """ Loads a reference object from the cache folder. Takes an optional list of columns to read. """ 
         try:
-            self.table = pd.read_pickle(f"{CACHE_DIRECTORY}/{self.name}.pkl")
+            self.table = load_table(self.stem, columns)
         except FileNotFoundError:
             raise DailyFantasyDataScienceError()
 
@@ -96,6 +427,14 @@ class ReferenceTable(object):
 
 class FootballBoxscoreTable(object):
     """ Archetypal class for stat tables. Contains functionality that is useful for all downstream classes """
+
+    # Names of the same-season tables this one is built from; a table without any is built from the boxscores. Bump
+    # VERSION when a change outside the class body (a helper it calls) changes what build produces.
+    UPSTREAM = []
+    VERSION = 1
+    # Columns identifying a row, and the game a row belongs to, when new games are appended
+    KEYS = ["name", "date"]
+    GAME_KEYS = ["team", "date"]
     
     def __init__(self, name, season, refresh=False, boxscores=None):
         """
@@ -103,74 +442,302 @@ class FootballBoxscoreTable(object):
                 name: Name of the table
                 season: Year of the season
             Optional Inputs:
-                refresh: Boolean determining if the table should be refreshed/built
-                boxscores: List of FootballBoxscore  objects
+                refresh: Boolean determining if the table should be refreshed/built. With REFRESH_STALE_ONLY a
+                    cached table whose inputs are unchanged is loaded instead; "force" always rebuilds
+                boxscores: List of FootballBoxscore objects or a BoxscoreShards object. Defaults to the season's
+                    shards when they exist
         """
         self.name = name
         self.season = season
+        self.stem = table_stem(name, season)
+        self.input_fingerprint = None
+        self.rebuilt = False
         
         if refresh:
+            if boxscores is None and BoxscoreShards(season).exists():
+                boxscores = BoxscoreShards(season)
             if boxscores is None:
                 raise Exception(f"Pass boxscores to refresh the {self.name} table.")
+            self.input_fingerprint = table_fingerprint(self, self.inputs(boxscores))
+            self.rebuilt = is_stale(self.stem, self.input_fingerprint, refresh)
+
+        if self.rebuilt:
             self.build(boxscores)
+            if COMPACT_DTYPES:
+                self.table = compact_table(self.table)
             self.cache()
         else:
             self.load()
 
+    def inputs(self, boxscores):
+        """ Takes the boxscores passed to refresh. Returns what the table is built from: the season and either the
+        fingerprints of its upstream tables or of the boxscores """
+        if self.UPSTREAM:
+            return [self.season] + [cached_fingerprint(name, self.season) for name in self.UPSTREAM]
+        return [self.season, boxscores_fingerprint(boxscores)]
+
     def build(self, boxscores):
         """ Placeholder build function"""
         raise Exception("Override build function")
 
     def cache(self):
-        """ Stores the table object as a pickle in the corresponding season folder """ 
-        if not os.path.exists(f"{CACHE_DIRECTORY}/{self.season}"):
-            os.makedirs(f"{CACHE_DIRECTORY}/{self.season}")
+        """ Stores the table object in the corresponding season folder (see save_table) along with its fingerprint """ 
+        os.makedirs(f"{CACHE_DIRECTORY}/{self.season}", exist_ok=True)
         try:  
-            self.table.to_pickle(f"{CACHE_DIRECTORY}/{self.season}/{self.name}.pkl")
+            save_table(self.table, self.stem)
+            write_fingerprint(self.stem, self.input_fingerprint)
         except FileNotFoundError:
             raise DailyFantasyDataScienceError()
 
-    def load(self):
-        """ loads the table object from a pickle in the corresponding season folder """
+    def load(self, columns=None):
+        """ loads the table object from the corresponding season folder. Takes an optional list of columns to read. """
         try:
-            self.table = pd.read_pickle(f"{CACHE_DIRECTORY}/{self.season}/{self.name}.pkl")
+            self.table = load_table(self.stem, columns)
         except FileNotFoundError:
             raise DailyFantasyDataScienceError()
 
+    def append(self, boxscores, season_boxscores=None):
+        """ Takes the boxscores of new or corrected games, as a list of FootballBoxscore objects or a BoxscoreShards
+        object, and adds them to the cached table without rebuilding the season. Only the new games are processed:
+        rows of a game already in the table are replaced and rows repeated in the new games are de-duplicated on KEYS.
+        The table is cached along with a fingerprint of the season's full boxscores when season_boxscores is passed,
+        so a later refresh against them loads the table, and otherwise with a fingerprint chained from the previous
+        one and the new games. Returns the rows built from the new games. """
+
+        if isinstance(boxscores, list) and not boxscores:
+            return self.table.iloc[:0]
+        table = self.table
+        self.build(boxscores)
+        new_rows = compact_table(self.table) if COMPACT_DTYPES else self.table
+        self.table = self.merge_rows(table, new_rows.drop_duplicates(self.KEYS, keep='last'))
+        self.input_fingerprint = self.appended_fingerprint(boxscores, season_boxscores)
+        self.cache()
+        return new_rows
+
+    def merge_rows(self, table, new_rows):
+        """ Takes the cached table and the rows of new games. Drops the cached rows of any game in new_rows and
+        appends new_rows. A range index is renumbered. Returns the merged dataframe. """
+
+        replaced = pd.MultiIndex.from_frame(table[self.GAME_KEYS]).isin(
+            pd.MultiIndex.from_frame(new_rows[self.GAME_KEYS])
+        )
+        merged = concat_tables([table[~replaced], new_rows])
+        return merged.reset_index(drop=True) if isinstance(table.index, pd.RangeIndex) else merged
+
+    def appended_fingerprint(self, boxscores, season_boxscores):
+        """ Returns the fingerprint to store with an appended table (see append) """
+        if self.UPSTREAM or season_boxscores is not None:
+            return table_fingerprint(self, self.inputs(season_boxscores))
+        return fingerprint(read_fingerprint(self.stem), boxscores_fingerprint(boxscores))
+
+
+# Shard name: (FootballBoxscore attribute, id of the div wrapping the table on the game webpage)
+SHARD_TABLES = {
+    "offense": ("all_player_offense", "all_player_offense"),
+    "advancedPassing": ("adv_player_passing", "all_passing_advanced"),
+    "advancedRushing": ("adv_player_rushing", "all_rushing_advanced"),
+    "advancedReceiving": ("adv_player_receive", "all_receiving_advanced"),
+    "teamStats": ("all_team_stats", "all_team_stats"),
+}
+
+
+def shard_directory(season):
+    """ Returns the folder that holds a season's boxscore shards """
+    return f"{CACHE_DIRECTORY}/{season}/shards"
+
+
+class BoxscoreShardWriter(object):
+    """ Streams parsed boxscores into per-table columnar shards. As each game arrives its rows are appended to one set
+    of column lists per table (plus a "score" table of scorebox data), and every shard_size games the buffered columns
+    are written out as a single dataframe per table. No per-game dataframes are created and memory stays flat no
+    matter how many games are written. Use as a context manager, or call close() to write the last partial shard. """
+
+    def __init__(self, season, shard_size=SHARD_SIZE, overwrite=True):
+        """
+            Required Inputs:
+                season: Year of the season
+            Optional Inputs:
+                shard_size: Number of games buffered before a shard is written
+                overwrite: Boolean determining if the season's existing shards are removed or appended to
+        """
+        self.season = season
+        self.shard_size = shard_size
+        self.directory = shard_directory(season)
+        if overwrite and os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
+        self.next_shard = len(BoxscoreShards(season).shard_files("score"))
+        self.games = 0
+        self.reset()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def reset(self):
+        """ Empties the column buffers """
+        self.buffers = {shard: {} for shard in ["score"] + list(SHARD_TABLES)}
+        self.rows = {shard: 0 for shard in self.buffers}
+
+    def append(self, url, scorebox, tables):
+        """ Takes a game url, its scorebox dictionary and its tables as returned by FootballBoxscore.extract_tables
+        and appends the game's rows to the buffers. Writes a shard every shard_size games. """
+
+        self.extend("score", {"game": [url], **{key: [value] for key, value in scorebox.items()}}, 1)
+        for shard, (_, table_div_id) in SHARD_TABLES.items():
+            headers, columns = tables[table_div_id]
+            n = len(headers)
+            rows = {"game": [url] * n, "date": [scorebox['date']] * n, "player": headers}
+            rows.update(columns)
+            self.extend(shard, rows, n)
+        self.games += 1
+        if self.games % self.shard_size == 0:
+            self.flush()
+
+    def append_boxscore(self, fbs):
+        """ Takes a scraped FootballBoxscore object and appends its rows, e.g. to convert an existing boxscore pickle """
+
+        tables = {}
+        for attribute, table_div_id in SHARD_TABLES.values():
+            frame = getattr(fbs, attribute)
+            tables[table_div_id] = (list(frame.index), {c: list(frame[c]) for c in frame.columns})
+        self.append(fbs.url, fbs.scorebox, tables)
+
+    def extend(self, shard, columns, n):
+        """ Appends n rows to a shard buffer. Columns seen for the first time are back-filled with nan and columns
+        missing from these rows are padded with nan. """
+
+        buffer = self.buffers[shard]
+        rows = self.rows[shard]
+        for name, values in columns.items():
+            buffer.setdefault(name, [np.nan] * rows).extend(values)
+        for values in buffer.values():
+            if len(values) < rows + n:
+                values.extend([np.nan] * (rows + n - len(values)))
+        self.rows[shard] = rows + n
+
+    def flush(self):
+        """ Writes the buffered rows of every table as the next shard and empties the buffers """
+
+        if not any(self.rows.values()):
+            return
+        for shard, buffer in self.buffers.items():
+            os.makedirs(f"{self.directory}/{shard}", exist_ok=True)
+            pd.DataFrame(buffer).to_pickle(f"{self.directory}/{shard}/{self.next_shard:05d}.pkl")
+        self.next_shard += 1
+        self.reset()
+
+    def close(self):
+        """ Writes the last partial shard """
+        self.flush()
+
+
+class BoxscoreShards(object):
+    """ Reader for the shards written by BoxscoreShardWriter. Can be passed as the boxscores argument of any
+    FootballBoxscoreTable in place of a list of FootballBoxscore objects. """
+
+    def __init__(self, season):
+        """
+            Required Inputs:
+                season: Year of the season
+        """
+        self.season = season
+        self.directory = shard_directory(season)
+
+    def exists(self):
+        """ Returns True if the season has any shards """
+        return len(self.shard_files("score")) > 0
+
+    def shard_files(self, shard):
+        """ Returns the sorted shard files of a table """
+        return sorted(glob.glob(f"{self.directory}/{shard}/*.pkl"))
+
+    def fingerprint(self):
+        """ Returns the sha1 of the names and contents of every shard file """
+        digest = hashlib.sha1()
+        for path in sorted(glob.glob(f"{self.directory}/*/*.pkl")):
+            digest.update(os.path.relpath(path, self.directory).encode())
+            with open(path, 'rb') as reader:
+                digest.update(reader.read())
+        return digest.hexdigest()
+
+    def read(self, shard):
+        """ Loads every shard of a table into one dataframe of raw rows, ordered by game url like a sorted list of
+        game links. """
+
+        files = self.shard_files(shard)
+        if not files:
+            raise DailyFantasyDataScienceError()
+        rows = pd.concat([pd.read_pickle(f) for f in files], ignore_index=True)
+        return rows.sort_values('game', kind='mergesort', ignore_index=True)
+
 
 class DefenseTeamTable(FootballBoxscoreTable):
     """ Table that stores team-level offense data. """
 
-    def __init__(self, season, refresh=False, boxscores=None):
-        self.off_table = OffenseTeamTable(season=season, refresh=refresh, boxscores=boxscores)
-        self.score_table = ScoreTable(season=season, refresh=refresh, boxscores=boxscores)
+    UPSTREAM = ["offenseTeam", "score"]
+    KEYS = ["team", "date"]
+
+    def __init__(self, season, refresh=False, boxscores=None, refresh_upstream=None):
+        """ The OffenseTeamTable and ScoreTable are refreshed along with this table unless refresh_upstream says
+        otherwise, e.g. False when they were just built (see build_tables) """
+        refresh_upstream = refresh if refresh_upstream is None else refresh_upstream
+        self.off_table = OffenseTeamTable(season=season, refresh=refresh_upstream, boxscores=boxscores)
+        self.score_table = ScoreTable(season=season, refresh=refresh_upstream, boxscores=boxscores)
         super(DefenseTeamTable, self).__init__("defenseTeam", season, refresh, boxscores)
 
     def build(self, boxscores):
         """ Takes components from the ScoreTable and OffenseTeamTable to create a new table, converts to a dataframe '
         """
+        self.table = self.defense_records(self.off_table.table, self.score_table.table)
+
+    def append(self, boxscores, season_boxscores=None):
+        """ Appends the new games to the OffenseTeamTable and ScoreTable, then recomputes the defense rows of the dates
+        they were played on only. Rows of other dates are kept as cached and the rows of each team keep counting up
+        from its cached rows. Returns the recomputed rows. """
+
+        dates = self.off_table.append(boxscores, season_boxscores)['date'].unique()
+        self.score_table.append(boxscores, season_boxscores)
+        if not len(dates):
+            return self.table.iloc[:0]
+        off, score = self.off_table.table, self.score_table.table
+        records = self.defense_records(off[off['date'].isin(dates)], score[score['date'].isin(dates)])
+        if COMPACT_DTYPES:
+            records = compact_table(records)
+
+        kept = self.table[~self.table['date'].isin(dates)]
+        team_rows = kept['team'].value_counts()
+        records.index = records.index + team_rows.reindex(records['team'].values).fillna(0).astype(int).values
+        self.table = concat_tables([kept, records]).sort_values('date', kind='mergesort')
+        self.input_fingerprint = self.appended_fingerprint(boxscores, season_boxscores)
+        self.cache()
+        return records
+
+    # Points allowed breakpoints and the DK score of each bin: (-inf, 6] -> 7, (6, 13] -> 4, ..., (34, inf) -> -4
+    PTS_ALLOWED_BINS = np.array([6.0, 13.0, 20.0, 27.0, 34.0])
+    PTS_ALLOWED_SCORES = np.array([7.0, 4.0, 1.0, 0.0, -1.0, -4.0])
+    SHUTOUT_SCORE = 10.0
 
-        off_team_table = self.off_table.table.copy()
-        teams = off_team_table.team.unique()
-        def_team_table = []
-
-        for team in teams:
-            def_team = off_team_table[off_team_table.team == team].copy()[['team', 'date', 'opp']]
-            def_table = def_team.join(off_team_table.set_index(['date', 'team']), on=['date', 'opp'], rsuffix=".2")
-            def_table = def_table.reset_index()
-            del def_table['index']
-            del def_table['opp.2']
-            def_team_table.append(def_table)
-
-        def_team_table = pd.concat(def_team_table)
+    @staticmethod
+    def defense_records(off_team_table, score_table):
+        """ Takes an OffenseTeamTable table and a ScoreTable table. Joins every team's rows to its opponent's offense
+        rows on date in a single keyed join, so a team's defense stats are the offense stats it allowed. Rows are
+        grouped by team in order of first appearance and then sorted by date. Returns the dataframe. """
+
+        team_rank = pd.factorize(off_team_table['team'])[0]
+        def_keys = off_team_table[['team', 'date', 'opp']].iloc[np.argsort(team_rank, kind='stable')]
+        def_team_table = def_keys.join(off_team_table.set_index(['date', 'team']), on=['date', 'opp'], rsuffix=".2")
+        def_team_table.index = def_team_table.groupby('team', sort=False).cumcount().values
+        del def_team_table['opp.2']
         del def_team_table['player']
         def_team_table = def_team_table.drop_duplicates(["team", "date"]).sort_values('date')
         def_team_table['name'] = def_team_table['team']  # for asof queries
 
-        inverted_home_table = self.score_table.table[['date', 'home', 'home_score']].rename(
+        inverted_home_table = score_table[['date', 'home', 'home_score']].rename(
             columns={'home': "opp", 'home_score': "pts_allowed"}
         )
-        inverted_away_table = self.score_table.table[['date', 'away', 'away_score']].rename(
+        inverted_away_table = score_table[['date', 'away', 'away_score']].rename(
                 columns={'away': "opp", 'away_score': "pts_allowed"}
             )
         
@@ -180,14 +747,14 @@ class DefenseTeamTable(FootballBoxscoreTable):
 
         def_team_table = def_team_table.join(score_ref, on=['date', 'opp'])
 
-        def_team_table['DKScore_pts'] = def_team_table['pts_allowed'].apply(lambda x: self.score_pts_allowed(x))
+        def_team_table['DKScore_pts'] = DefenseTeamTable.score_pts_allowed_array(def_team_table['pts_allowed'])
         def_team_table['DKScore'] = (
             def_team_table['sacks_allowed'] 
             + 2.0 * def_team_table['pass_int'] 
             + 2.0 * def_team_table['fumbles_lost'] 
             + def_team_table['DKScore_pts']
         )
-        self.table = def_team_table
+        return def_team_table
 
     @staticmethod
     def score_pts_allowed(pts):
@@ -207,77 +774,90 @@ class DefenseTeamTable(FootballBoxscoreTable):
         else:
             return -4.0
 
+    @staticmethod
+    def score_pts_allowed_array(pts):
+        """ Takes a series or array of points allowed by a defense. Returns score_pts_allowed of each as an array,
+        looked up from the points allowed bins in one pass. A missing score falls in the last bin. """
+        pts = pd.to_numeric(pd.Series(pts)).to_numpy(dtype=np.float64)
+        scores = DefenseTeamTable.PTS_ALLOWED_SCORES[
+            np.searchsorted(DefenseTeamTable.PTS_ALLOWED_BINS, pts, side='left')
+        ]
+        return np.where(pts == 0.0, DefenseTeamTable.SHUTOUT_SCORE, scores)
+
 
 class OffenseTeamTable(FootballBoxscoreTable):
     """ Table that stores team-level offense data. """
 
+    KEYS = ["team", "date"]
+
+    # Compound team stat column: names of its dash-separated parts
+    COMPOUND_COLUMNS = {
+        "Cmp-Att-Yd-TD-INT": ["pass_cmp", "pass_att", "pass_yd", "pass_td", "pass_int"],
+        "Fourth Down Conv.": ["fouth_conv_succ", "fouth_conv_att"],
+        "Fumbles-Lost": ["fumbles", "fumbles_lost"],
+        "Penalties-Yards": ["penalty_count", "penalty_yds"],
+        "Rush-Yds-TDs": ["rush_att", "rush_yds", "rush_tds"],
+        "Sacked-Yards": ["sacks_allowed", "sacks_allowed_yds"],
+        "Third Down Conv.": ["third_conv_succ", "third_conv_att"],
+    }
+
     def __init__(self, season, refresh=False, boxscores=None):
         super(OffenseTeamTable, self).__init__("offenseTeam", season, refresh, boxscores)
 
     def build(self, boxscores):
-        """ Takes a list of FootballBoxscore objects, processes data and converts to a dataframe """
+        """ Takes a list of FootballBoxscore objects or a BoxscoreShards object, processes data and converts to a
+        dataframe """
 
-        team_records = []
-        for fbs in tqdm(boxscores):
-            team_records.append(self.team_records_from_boxscore(fbs))
-        table_df = self.build_team_table(pd.concat(team_records))
+        team_table = self.team_records(boxscore_rows(boxscores, "teamStats"), boxscore_rows(boxscores, "score"))
+        table_df = self.build_team_table(team_table)
         table_df = floatify(table_df, string_columns=['date', 'team', 'opp', "Time of Possession"])
         table_df['name'] = table_df['team']  # for asof queries
         self.table = table_df
 
     @staticmethod
-    def team_records_from_boxscore(fbs):
-        """ Takes a boxscore, generates a dataframe such that the rows correspond to teams and the columns
-        contain stats related to team offensive performance. Returns the dataframe. """
-
-        # Row 1
-        home_stats_df = fbs.all_team_stats['home_stat'].copy()
-        home_stats_df['team'] = team_map_inv[fbs.scorebox['home_team']]
-        home_stats_df['date'] = pd.Timestamp(fbs.scorebox['date'])
-        home_stats_df['opp'] = team_map_inv[fbs.scorebox['away_team']]
-        # Row 2
-        vis_stats_df = fbs.all_team_stats['vis_stat'].copy()
-        vis_stats_df['team'] = team_map_inv[fbs.scorebox['away_team']]
-        vis_stats_df['date'] = pd.Timestamp(fbs.scorebox['date'])
-        vis_stats_df['opp'] = team_map_inv[fbs.scorebox['home_team']]
-        table = pd.concat([home_stats_df, vis_stats_df], axis=1).T
+    def team_records(stats, games):
+        """ Takes the raw team stat rows and scorebox rows of a set of games. Generates a dataframe such that the rows
+        correspond to teams (home then away for each game) and the columns contain stats related to team offensive
+        performance. Returns the dataframe. """
+
+        game_order = games['game'].values
+        home_stats_df = stats.pivot(index='game', columns='player', values='home_stat').reindex(game_order)
+        home_stats_df['team'] = games['home_team'].map(team_map_inv.__getitem__).values
+        home_stats_df['date'] = game_dates(games)
+        home_stats_df['opp'] = games['away_team'].map(team_map_inv.__getitem__).values
+        vis_stats_df = stats.pivot(index='game', columns='player', values='vis_stat').reindex(game_order)
+        vis_stats_df['team'] = home_stats_df['opp'].values
+        vis_stats_df['date'] = home_stats_df['date'].values
+        vis_stats_df['opp'] = home_stats_df['team'].values
+
+        n_games = len(game_order)
+        interleaved = np.column_stack([np.arange(n_games), np.arange(n_games) + n_games]).ravel()
+        table = pd.concat([home_stats_df, vis_stats_df]).iloc[interleaved]
+        table.index = ['home_stat', 'vis_stat'] * n_games
+        table.columns.name = None
 
         return table
 
+    @staticmethod
+    def team_records_from_boxscore(fbs):
+        """ Takes a boxscore. Returns its team_records, with the stat columns in the order of the boxscore's team
+        stats table. """
+        records = OffenseTeamTable.team_records(boxscore_rows([fbs], "teamStats"), boxscore_rows([fbs], "score"))
+        return records[list(fbs.all_team_stats.index) + ['team', 'date', 'opp']]
+
     @staticmethod
     def build_team_table(team_table):
         """ Takes a dataframe of home and away team stats. Cleans up time-related columns and splits up compound 
         columns. Returns the new dataframe. """
 
-        team_table["Time of Possession"] = team_table["Time of Possession"].apply(
-            lambda x: float(x.split(":")[0]) + float(x.split(":")[1]) / 60
-        )
-        t1 = team_table["Cmp-Att-Yd-TD-INT"].apply(
-            lambda x: pd.Series(dict(zip(["pass_cmp", "pass_att", "pass_yd", "pass_td", "pass_int"], x.split("-"))))
-        )
-        t2 = team_table["Fourth Down Conv."].apply(
-            lambda x: pd.Series(dict(zip(["fouth_conv_succ", "fouth_conv_att"],x.split("-"))))
-        )
-        t3 = team_table["Fumbles-Lost"].apply(
-            lambda x: pd.Series(dict(zip(["fumbles", "fumbles_lost"], x.split("-"))))
-        )
-        t4 = team_table["Penalties-Yards"].apply(
-            lambda x: pd.Series(dict(zip(["penalty_count", "penalty_yds"],x.split("-"))))
-        )
-        t5 = team_table["Rush-Yds-TDs"].apply(
-            lambda x: pd.Series(dict(zip(["rush_att", "rush_yds", "rush_tds"], x.split("-"))))
-        )
-        t6 = team_table["Sacked-Yards"].apply(
-            lambda x: pd.Series(dict(zip(["sacks_allowed", "sacks_allowed_yds"], x.split("-"))))
-        )
-        t7 = team_table["Third Down Conv."].apply(
-            lambda x: pd.Series(dict(zip(["third_conv_succ", "third_conv_att"], x.split("-"))))
-        )
-        t8 = team_table[
+        possession = team_table["Time of Possession"].str.split(":", expand=True).astype(float)
+        compound = split_compound(team_table, OffenseTeamTable.COMPOUND_COLUMNS)
+        simple = team_table[
             ["First Downs", "Net Pass Yards", "Time of Possession", 'Total Yards', 'Turnovers', 'team', 'date', 'opp']
-        ]
+        ].copy()
+        simple["Time of Possession"] = possession[0] + possession[1] / 60
 
-        return pd.concat([t1, t2, t3, t4, t5, t6, t7, t8], axis=1)
+        return pd.concat([compound, simple], axis=1)
 
 
 class OffenseTable(FootballBoxscoreTable):
@@ -287,16 +867,14 @@ class OffenseTable(FootballBoxscoreTable):
         super(OffenseTable, self).__init__("offense", season, refresh, boxscores)
 
     def build(self, boxscores):
-        """ Takes a list of FootballBoxscore objects, processes data and converts to a dataframe """
-
-        table = []
-        for fbs in tqdm(boxscores):
-            record = floatify(fbs.all_player_offense.copy())
-            record['date'] = pd.Timestamp(fbs.scorebox['date'])
-            teams = record.team.unique()
-            record['opp'] = record.team.apply(lambda x: teams[1] if x == teams[0] else teams[0])
-            table.append(record)
-        table = pd.concat(table)
+        """ Takes a list of FootballBoxscore objects or a BoxscoreShards object, processes data and converts to a
+        dataframe """
+
+        rows = boxscore_rows(boxscores, "offense")
+        table = player_table(rows)
+        first = rows.team.groupby(rows.game, sort=False).transform('first')
+        second = rows.team.where(rows.team != first).groupby(rows.game, sort=False).transform('first')
+        table['opp'] = np.where(rows.team == first, second, first)
         table['name'] = table.player.str.upper().str.replace(" ", "")
         table['DKScore'] = (
             (table.pass_td * 4.0) + (0.04 * table.pass_yds) + (3.0 * (table.pass_yds > 300.))
@@ -314,13 +892,9 @@ class AdvancedPassingTable(FootballBoxscoreTable):
         super(AdvancedPassingTable, self).__init__("advancedPassing", season, refresh, boxscores)
 
     def build(self, boxscores):
-        """ Takes a list of FootballBoxscore objects, processes data and converts to a dataframe """
-        table = []
-        for fbs in tqdm(boxscores):
-            t = floatify(fbs.adv_player_passing.copy())
-            t['date'] = pd.Timestamp(fbs.scorebox['date'])
-            table.append(t)
-        self.table = pd.concat(table)
+        """ Takes a list of FootballBoxscore objects or a BoxscoreShards object, processes data and converts to a
+        dataframe """
+        self.table = player_table(boxscore_rows(boxscores, "advancedPassing"))
         self.table['name'] = self.table.player.str.upper().str.replace(" ", "")
 
 
@@ -330,13 +904,9 @@ class AdvancedRushingTable(FootballBoxscoreTable):
         super(AdvancedRushingTable, self).__init__("advancedRushing", season, refresh, boxscores)
 
     def build(self, boxscores):
-        """ Takes a list of FootballBoxscore objects, processes data and converts to a dataframe """
-        table = []
-        for fbs in tqdm(boxscores):
-            t = floatify(fbs.adv_player_rushing.copy())
-            t['date'] = pd.Timestamp(fbs.scorebox['date'])
-            table.append(t)
-        self.table = pd.concat(table)
+        """ Takes a list of FootballBoxscore objects or a BoxscoreShards object, processes data and converts to a
+        dataframe """
+        self.table = player_table(boxscore_rows(boxscores, "advancedRushing"))
         self.table['name'] = self.table.player.str.upper().str.replace(" ", "")
 
 
@@ -346,41 +916,686 @@ class AdvancedReceivingTable(FootballBoxscoreTable):
         super(AdvancedReceivingTable, self).__init__("advancedReceiving", season, refresh, boxscores)
 
     def build(self, boxscores):
-        """ Takes a list of FootballBoxscore objects, processes data and converts to a dataframe """
-        table = []
-        for fbs in tqdm(boxscores):
-            t = floatify(fbs.adv_player_receive.copy())
-            t['date'] = pd.Timestamp(fbs.scorebox['date'])
-            table.append(t)
-        self.table = pd.concat(table)
+        """ Takes a list of FootballBoxscore objects or a BoxscoreShards object, processes data and converts to a
+        dataframe """
+        self.table = player_table(boxscore_rows(boxscores, "advancedReceiving"))
         self.table['name'] = self.table.player.str.upper().str.replace(" ", "")
 
 
 class ScoreTable(FootballBoxscoreTable):
     """ Table that stores game-level characteristic data. """
 
+    KEYS = ["home", "date"]
+    GAME_KEYS = ["home", "date"]
+
     def __init__(self, season, refresh=False, boxscores=None):
         super(ScoreTable, self).__init__("score", season, refresh, boxscores)
 
     def build(self, boxscores):
-        """ Takes a list of FootballBoxscore objects, processes data and converts to a dataframe """
-        table = []
-        for fbs in tqdm(boxscores):
-            table.append(pd.Series({"home": team_map_inv[fbs.scorebox['home_team']],
-                                    "away": team_map_inv[fbs.scorebox['away_team']],
-                                    "home_score": fbs.scorebox['home_team_score'],
-                                    "away_score": fbs.scorebox['away_team_score'],
-                                    "date": pd.Timestamp(fbs.scorebox['date'])}))
-        self.table = pd.concat(table, axis=1).T
-
-def floatify(table, string_columns=['team']):
-    """ Takes a dataframe and an optional list of columns. Converts all columns in the string_columns list and converts
-    them from strings to floats. If the cell contents are empty return the numpy nan value. Returns the converted 
-    dataframe. """
-
-    off_float = table[[c for c in table.columns if not c in string_columns]] \
-        .applymap(lambda x: np.nan if x == "" else float(x.replace("%", ""))).copy()
+        """ Takes a list of FootballBoxscore objects or a BoxscoreShards object, processes data and converts to a
+        dataframe """
+        games = boxscore_rows(boxscores, "score")
+        self.table = pd.DataFrame({"home": games['home_team'].map(team_map_inv.__getitem__),
+                                   "away": games['away_team'].map(team_map_inv.__getitem__),
+                                   "home_score": games['home_team_score'].astype(object),
+                                   "away_score": games['away_team_score'].astype(object),
+                                   "date": game_dates(games)})
+
+
+def append_season(season, boxscores, season_boxscores=None):
+    """ Takes a season, the boxscores of its new or corrected games and optionally the season's full boxscores (see
+    FootballBoxscoreTable.append). Appends the games to every cached table of the season. Returns the tables. """
+
+    tables = [DefenseTeamTable(season), OffenseTable(season), AdvancedPassingTable(season),
+              AdvancedRushingTable(season), AdvancedReceivingTable(season)]
+    for table in tables:
+        table.append(boxscores, season_boxscores)
+    return tables
+
+
+# Parallel builds. build_tables runs every (table, season) build on a pool of processes, submitting each build as soon
+# as the same-season tables it is built from are done.
+
+SEASON_TABLES = {
+    "score": ScoreTable,
+    "offenseTeam": OffenseTeamTable,
+    "defenseTeam": DefenseTeamTable,
+    "offense": OffenseTable,
+    "advancedPassing": AdvancedPassingTable,
+    "advancedRushing": AdvancedRushingTable,
+    "advancedReceiving": AdvancedReceivingTable,
+}
+
+worker_boxscores = {}
+
+
+def build_boxscores(season):
+    """ Returns a season's BoxscoreShards if it has any, otherwise its cached list of FootballBoxscore objects, or None
+    if it has neither. The boxscores are loaded once per build worker. """
+    if season not in worker_boxscores:
+        shards = BoxscoreShards(season)
+        worker_boxscores[season] = shards if shards.exists() else (load_boxscores(season) or None)
+    return worker_boxscores[season]
+
+
+def build_table(name, season, refresh):
+    """ Refreshes one season table in a build worker. Upstream tables are only loaded, as build_tables builds them
+    first. Returns whether the table was rebuilt and the seconds it took. """
+    start = time.perf_counter()
+    table_class = SEASON_TABLES[name]
+    upstream = {"refresh_upstream": False} if table_class.UPSTREAM else {}
+    table = table_class(season, refresh=refresh, boxscores=build_boxscores(season), **upstream)
+    return table.rebuilt, time.perf_counter() - start
+
+
+def build_tables(seasons, names=None, refresh=True, max_workers=BUILD_WORKERS):
+    """ Takes a list of seasons and optionally the names of the tables to build (keys of SEASON_TABLES, default all of
+    them; the tables they are built from are added). Refreshes every (table, season) on a pool of max_workers processes,
+    starting each table once its upstream tables of the same season are done. Each worker loads a season's boxscores
+    once. Returns {(name, season): (rebuilt, seconds)}. """
+
+    wanted = set(SEASON_TABLES) if names is None else set(names)
+    while True:
+        upstream = {up for name in wanted for up in SEASON_TABLES[name].UPSTREAM} - wanted
+        if not upstream:
+            break
+        wanted |= upstream
+    waiting = {
+        (name, season): {(up, season) for up in SEASON_TABLES[name].UPSTREAM}
+        for season in seasons for name in SEASON_TABLES if name in wanted
+    }
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as pool, tqdm(total=len(waiting)) as progress:
+        pending = {}
+        while waiting or pending:
+            for job in [job for job, upstream in waiting.items() if not upstream]:
+                del waiting[job]
+                pending[pool.submit(build_table, *job, refresh)] = job
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = pending.pop(future)
+                results[job] = future.result()
+                for upstream in waiting.values():
+                    upstream.discard(job)
+                progress.update()
+    return results
+
+
+def boxscore_rows(boxscores, shard):
+    """ Takes a list of FootballBoxscore objects or a BoxscoreShards object and the name of a shard table ("score" or
+    a key of SHARD_TABLES). Returns the raw rows of that table for every game as one dataframe with game and date
+    columns, the row header as a player column and the unconverted cell contents. """
+
+    if isinstance(boxscores, BoxscoreShards):
+        return boxscores.read(shard)
+
+    frames = []
+    for fbs in tqdm(boxscores):
+        if shard == "score":
+            frames.append(pd.DataFrame([{"game": fbs.url, **fbs.scorebox}]))
+            continue
+        frame = getattr(fbs, SHARD_TABLES[shard][0]).copy()
+        frame.insert(0, 'player', frame.index)
+        frame.insert(0, 'date', fbs.scorebox['date'])
+        frame.insert(0, 'game', fbs.url)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def game_dates(rows):
+    """ Takes raw rows with a scorebox date column and returns the dates as timestamps, parsing each date once """
+    return rows['date'].map({date: pd.Timestamp(date) for date in rows['date'].unique()}).values
+
+
+def player_table(rows):
+    """ Takes raw player rows from boxscore_rows. Converts the stat columns to floats, adds the game date and numbers
+    the rows of each game from zero, as converting each game on its own would. Returns the dataframe. """
+
+    table = floatify(rows.drop(columns=['game', 'date']).set_index('player'))
+    table['date'] = game_dates(rows)
+    table.index = rows.groupby('game', sort=False).cumcount().values
+    return table
+
+
+def split_compound(table, spec):
+    """ Takes a dataframe and a {compound column: [part names]} spec. Joins the compound columns of each row and
+    splits all of them with a single regular expression, so a part may carry its own minus sign: "20--5-0" in
+    Rush-Yds-TDs is 20 rushes for -5 yards and no touchdowns. A value that does not have the expected number of parts
+    leaves nan in that column's parts only. Returns a dataframe of the parts as strings, in spec order. """
+
+    number = r"(-?\d+(?:\.\d+)?)"
+    pattern = r"\|".join(f"(?:{'-'.join([number] * len(parts))}|[^|]*)" for parts in spec.values())
+    joined = table[list(spec)[0]].astype(str)
+    for column in list(spec)[1:]:
+        joined = joined + "|" + table[column].astype(str)
+    split = joined.str.extract(f"^{pattern}$")
+    split.columns = [part for parts in spec.values() for part in parts]
+    return split
+
+
+def floatify(table, string_columns=['team'], dtype=np.float64):
+    """ Takes a dataframe and an optional list of columns. Converts all columns not in the string_columns list
+    from strings to floats of the given dtype (see to_float). Returns the converted dataframe with the index moved to a
+    player column. """
+
+    off_float = pd.DataFrame(
+        {c: to_float(table[c], dtype) for c in table.columns if not c in string_columns}, index=table.index
+    )
     off_string = table[string_columns].copy()
     table = pd.concat([off_string, off_float], axis=1)
     table = table.reset_index().rename(columns={'index': 'player'})
     return table
+
+
+def to_float(column, dtype=np.float64):
+    """ Takes a column of stat strings and converts it to floats in one vectorized pass. Percent signs are stripped and
+    empty cells become the numpy nan value. Stat columns hold few distinct values, so each distinct value is parsed
+    once and broadcast back through its factorized codes. Returns a series of the given dtype. """
+
+    codes, uniques = pd.factorize(column)
+    lookup = np.append(np.array([parse_stat(value) for value in uniques], dtype=np.float64), np.nan)
+    return pd.Series(lookup[codes], index=column.index, name=column.name).astype(dtype, copy=False)
+
+
+def parse_stat(value):
+    """ Converts a single stat cell to a float. Empty strings become nan and percent signs are stripped. """
+    if not isinstance(value, str):
+        return float(value)
+    if value == "":
+        return np.nan
+    return float(value.replace("%", ""))
+
+
+# Columnar table cache. A table is stored as a folder holding a schema.json and one .npy file per block: numeric,
+# boolean and datetime columns of the same dtype share a 2D array laid out exactly like a pandas block, so they are
+# memory-mapped back in without a copy. String and categorical columns are stored as integer codes plus their distinct
+# values, object columns of floats as a float array, and anything else is pickled on its own.
+
+def save_table(table, stem, table_format=CACHE_FORMAT):
+    """ Takes a table and its cache path without an extension. Writes the table to stem.cols in the columnar format
+    when table_format is "columns" and the table can be stored that way, otherwise to stem.pkl. The copy in the other
+    format is removed so a later load can never pick up a stale one. """
+
+    if table_format == "columns" and columnar_supported(table):
+        write_columns(table, f"{stem}.cols")
+        if os.path.exists(f"{stem}.pkl"):
+            os.remove(f"{stem}.pkl")
+    else:
+        table.to_pickle(f"{stem}.pkl")
+        shutil.rmtree(f"{stem}.cols", ignore_errors=True)
+
+
+def load_table(stem, columns=None):
+    """ Takes a cache path without an extension and an optional list of columns. Reads the columnar copy if there is
+    one and falls back to the pickle. Raises FileNotFoundError if neither exists. Returns the table. """
+
+    if os.path.isdir(f"{stem}.cols"):
+        return read_columns(f"{stem}.cols", columns)
+    table = pd.read_pickle(f"{stem}.pkl")
+    return table if columns is None else table[columns]
+
+
+def columnar_supported(table):
+    """ Returns True if a table can be written by write_columns: a dataframe with unique string column names and a
+    flat index """
+    return (
+        isinstance(table, pd.DataFrame)
+        and not isinstance(table.index, pd.MultiIndex)
+        and not isinstance(table.columns, pd.MultiIndex)
+        and table.columns.is_unique
+        and all(isinstance(name, str) for name in table.columns)
+    )
+
+
+def block_dtype(column):
+    """ Returns the numpy dtype a column is stored under in a shared block, or None if it needs its own encoding """
+    dtype = column.dtype
+    return dtype.str if isinstance(dtype, np.dtype) and dtype.kind in "fiubMm" else None
+
+
+def write_columns(table, directory):
+    """ Takes a dataframe and a folder path. Writes the table as a columnar folder next to the path and moves it into
+    place, so readers only ever see a complete folder. """
+
+    tmp_directory = f"{directory}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.mkdir(tmp_directory)
+
+    blocks = {}
+    encoded = []
+    for position, (name, column) in enumerate(table.items()):
+        dtype = block_dtype(column)
+        if dtype is None:
+            encoded.append(dict(encode_column(column, tmp_directory, str(position)), position=position))
+        else:
+            blocks.setdefault(dtype, []).append(position)
+
+    block_specs = []
+    for number, (dtype, positions) in enumerate(blocks.items()):
+        values = np.empty((len(positions), len(table)), dtype=np.dtype(dtype))
+        for row, position in enumerate(positions):
+            values[row] = table.iloc[:, position].to_numpy()
+        np.save(f"{tmp_directory}/block{number}.npy", values)
+        block_specs.append({"file": f"block{number}", "positions": positions})
+
+    if isinstance(table.index, pd.RangeIndex):
+        index = {"kind": "range", "start": table.index.start, "stop": table.index.stop, "step": table.index.step}
+    else:
+        index = encode_column(table.index.to_series(index=np.arange(len(table))), tmp_directory, "index")
+    index["name"] = table.index.name
+
+    schema = {"version": COLUMN_CACHE_VERSION, "rows": len(table), "columns": list(table.columns),
+              "columns_name": table.columns.name, "index": index, "blocks": block_specs, "encoded": encoded}
+    with open(f"{tmp_directory}/schema.json", 'w') as writer:
+        json.dump(schema, writer, default=str)
+
+    if os.path.exists(directory):
+        old_directory = f"{directory}.{os.getpid()}.old"
+        os.replace(directory, old_directory)
+        os.replace(tmp_directory, directory)
+        shutil.rmtree(old_directory)
+    else:
+        os.replace(tmp_directory, directory)
+
+
+def encode_column(column, directory, prefix):
+    """ Takes a series that cannot go in a shared block, a folder and a file prefix. Writes the column in the most
+    compact encoding that reproduces it exactly. Returns the schema entry describing how to read it back. """
+
+    if isinstance(column.dtype, CategoricalDtype):
+        np.save(f"{directory}/{prefix}.codes.npy", column.cat.codes.to_numpy())
+        categories = column.cat.categories
+        if categories.dtype == object and infer_dtype(categories) == "string":
+            np.save(f"{directory}/{prefix}.values.npy", np.array(list(categories), dtype=str))
+        else:
+            np.save(f"{directory}/{prefix}.values.npy", categories.to_numpy(), allow_pickle=True)
+        return {"kind": "category", "file": prefix, "ordered": bool(column.cat.ordered)}
+
+    if isinstance(column.dtype, np.dtype) and column.dtype.kind in "fiubMm":
+        np.save(f"{directory}/{prefix}.npy", column.to_numpy())
+        return {"kind": "array", "file": prefix}
+
+    if column.dtype == object:
+        missing = column[column.isna()]
+        nan_only = all(isinstance(value, float) for value in missing)
+        if nan_only and infer_dtype(column, skipna=True) == "string":
+            codes, uniques = pd.factorize(column)
+            np.save(f"{directory}/{prefix}.codes.npy", codes.astype(np.int32))
+            np.save(f"{directory}/{prefix}.values.npy", np.array(list(uniques), dtype=str))
+            return {"kind": "string", "file": prefix}
+        if nan_only and infer_dtype(column, skipna=False) == "floating":
+            np.save(f"{directory}/{prefix}.npy", column.to_numpy(dtype=np.float64))
+            return {"kind": "object_float", "file": prefix}
+
+    column.reset_index(drop=True).to_pickle(f"{directory}/{prefix}.pkl")
+    return {"kind": "pickle", "file": prefix}
+
+
+def read_columns(directory, columns=None):
+    """ Takes a folder written by write_columns and an optional list of columns. Memory-maps the shared blocks
+    copy-on-write, so the numeric columns of the returned dataframe are views of the files and only the pages that are
+    read are ever loaded; writes to the dataframe stay private to this process. Only the files holding the requested
+    columns are opened. Raises StaleCacheError if the folder was written with a different layout version. Returns
+    the dataframe. """
+
+    try:
+        with open(f"{directory}/schema.json", 'r') as reader:
+            schema = json.load(reader)
+    except FileNotFoundError:
+        raise StaleCacheError(directory)
+    if schema.get("version") != COLUMN_CACHE_VERSION:
+        raise StaleCacheError(directory)
+
+    names = schema["columns"] if columns is None else list(columns)
+    missing = [name for name in names if name not in schema["columns"]]
+    if missing:
+        raise KeyError(f"{missing} not in {directory}")
+    wanted = {schema["columns"].index(name): placement for placement, name in enumerate(names)}
+    mmap_mode = 'c' if schema["rows"] else None
+
+    arrays = [None] * len(names)
+    for spec in schema["blocks"]:
+        rows = [row for row, position in enumerate(spec["positions"]) if position in wanted]
+        if not rows:
+            continue
+        values = np.load(f"{directory}/{spec['file']}.npy", mmap_mode=mmap_mode)
+        for row in rows:
+            arrays[wanted[spec["positions"][row]]] = values[row]
+    for spec in schema["encoded"]:
+        if spec["position"] in wanted:
+            arrays[wanted[spec["position"]]] = decode_column(spec, directory, mmap_mode)
+
+    index = schema["index"]
+    if index["kind"] == "range":
+        index = pd.RangeIndex(index["start"], index["stop"], index["step"], name=index["name"])
+    else:
+        index = pd.Index(decode_column(index, directory, None), name=index["name"])
+
+    return frame_from_arrays(arrays, pd.Index(names, name=schema["columns_name"]), index)
+
+
+def frame_from_arrays(arrays, columns, index):
+    """ Takes a list of 1d numpy or pandas extension arrays, the column labels and the row index. Returns a dataframe
+    over the arrays themselves: pandas neither copies nor consolidates them, so memory-mapped arrays stay mapped. """
+    frame = pd.DataFrame(dict(enumerate(arrays)), index=index, copy=False)
+    frame.columns = columns
+    return frame
+
+
+def decode_column(spec, directory, mmap_mode):
+    """ Takes a schema entry written by encode_column and its folder. Returns the column values as a numpy array or a
+    pandas extension array. """
+
+    path = f"{directory}/{spec['file']}"
+    if spec["kind"] == "array":
+        return np.load(f"{path}.npy", mmap_mode=mmap_mode)
+    if spec["kind"] == "object_float":
+        return np.load(f"{path}.npy").astype(object)
+    if spec["kind"] in ("string", "category"):
+        codes = np.load(f"{path}.codes.npy")
+        uniques = np.load(f"{path}.values.npy", allow_pickle=True)
+        if uniques.dtype.kind == "U":
+            uniques = uniques.astype(object)
+        if spec["kind"] == "category":
+            return pd.Categorical.from_codes(codes, uniques, ordered=spec["ordered"])
+        values = uniques.take(codes) if len(uniques) else np.full(len(codes), np.nan, dtype=object)
+        values[codes < 0] = np.nan
+        return values
+    column = pd.read_pickle(f"{path}.pkl")
+    return column.to_numpy() if isinstance(column.dtype, np.dtype) else column.array
+
+
+# Fingerprints. Every cached table is stored with a sidecar {stem}.fingerprint holding the sha1 of its class source,
+# VERSION and inputs (upstream fingerprints, reference files, boxscores, parameters). A refresh compares it with the
+# fingerprint of the current inputs and rebuilds only on a mismatch.
+
+def table_stem(name, season=None):
+    """ Returns the cache path, without an extension, of a table and optionally its season """
+    return f"{CACHE_DIRECTORY}/{name}" if season is None else f"{CACHE_DIRECTORY}/{season}/{name}"
+
+
+def fingerprint(*parts):
+    """ Returns the sha1 of the JSON serialization of parts """
+    return hashlib.sha1(json.dumps(parts, default=str, sort_keys=True).encode()).hexdigest()
+
+
+def frame_fingerprint(frame):
+    """ Returns the sha1 of a dataframe's column names and values, leaving out the index """
+    digest = hashlib.sha1(json.dumps([str(column) for column in frame.columns]).encode())
+    digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def file_fingerprint(path):
+    """ Returns the sha1 of a file's contents, or None if the file does not exist """
+    try:
+        with open(path, 'rb') as reader:
+            return hashlib.sha1(reader.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+code_fingerprints = {}
+
+
+def code_fingerprint(cls):
+    """ Returns the sha1 of a class's source code, or None when the source is not available (e.g. a class defined in
+    an interactive session). The source is read once per class, as finding it means parsing the whole module. """
+    if cls not in code_fingerprints:
+        try:
+            code_fingerprints[cls] = fingerprint(inspect.getsource(cls))
+        except (OSError, TypeError):
+            code_fingerprints[cls] = None
+    return code_fingerprints[cls]
+
+
+def boxscores_fingerprint(boxscores):
+    """ Takes a list of FootballBoxscore objects or a BoxscoreShards object. Returns a fingerprint of the games: the url
+    and page sha1 of each boxscore, or the pickled boxscore when it has no sha """
+    if isinstance(boxscores, BoxscoreShards):
+        return boxscores.fingerprint()
+    return fingerprint([
+        (fbs.url, getattr(fbs, 'sha', None) or hashlib.sha1(pickle.dumps(fbs)).hexdigest()) for fbs in boxscores
+    ])
+
+
+def table_fingerprint(table, inputs):
+    """ Takes a table object and its inputs. Returns the fingerprint of the table's class, code, inputs, dtype mode and
+    columnar cache layout version """
+    return fingerprint(
+        type(table).__name__, table.VERSION, code_fingerprint(type(table)), COMPACT_DTYPES, COLUMN_CACHE_VERSION, inputs
+    )
+
+
+def read_fingerprint(stem):
+    """ Returns the fingerprint stored with a cached table, or None if there is none """
+    try:
+        with open(f"{stem}.fingerprint", 'r') as reader:
+            return reader.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def write_fingerprint(stem, value):
+    """ Stores a cached table's fingerprint. A value of None removes it, so the table counts as stale. """
+    if value is None:
+        if os.path.exists(f"{stem}.fingerprint"):
+            os.remove(f"{stem}.fingerprint")
+        return
+    with open(f"{stem}.fingerprint.tmp", 'w') as writer:
+        writer.write(value)
+    os.replace(f"{stem}.fingerprint.tmp", f"{stem}.fingerprint")
+
+
+def read_watermark(stem):
+    """ Returns the high-water mark record stored with a cached feature space, or None if there is none """
+    try:
+        with open(f"{stem}.watermark", 'r') as reader:
+            return json.load(reader)
+    except FileNotFoundError:
+        return None
+
+
+def write_watermark(stem, watermark):
+    """ Stores a cached feature space's high-water mark record """
+    with open(f"{stem}.watermark.tmp", 'w') as writer:
+        json.dump(watermark, writer)
+    os.replace(f"{stem}.watermark.tmp", f"{stem}.watermark")
+
+
+def cached_fingerprint(name, season=None):
+    """ Returns the fingerprint stored with a cached table, looked up by table name and optionally season """
+    return read_fingerprint(table_stem(name, season))
+
+
+def is_stale(stem, input_fingerprint, refresh):
+    """ Takes a cache path, the fingerprint of the current inputs and the refresh argument. Returns True if the table
+    must be rebuilt: refresh is "force", REFRESH_STALE_ONLY is off, the table is not cached, its columnar folder was
+    written with another layout version or cannot be read, or its stored fingerprint differs. """
+    if refresh == "force" or not REFRESH_STALE_ONLY:
+        return True
+    if os.path.isdir(f"{stem}.cols"):
+        try:
+            with open(f"{stem}.cols/schema.json", 'r') as reader:
+                if json.load(reader).get("version") != COLUMN_CACHE_VERSION:
+                    return True
+        except (OSError, ValueError):
+            return True
+    elif not os.path.exists(f"{stem}.pkl"):
+        return True
+    return read_fingerprint(stem) != input_fingerprint
+
+
+# Compact dtypes. With COMPACT_DTYPES set, built tables keep identifier columns as categoricals over one shared
+# dictionary and float columns as float32.
+
+IDENTIFIER_COLUMNS = ["name", "player", "team", "opp", "home", "away"]
+
+
+class IdentifierDictionary(object):
+    """ Process-wide dictionary of player and team identifiers. Compact tables store their identifier columns as
+    categoricals over it, and concat_tables re-encodes tables against its current categories so that the seasons of a
+    table stay categorical when they are concatenated. Values are only ever appended, so codes never change. """
+
+    def __init__(self):
+        self.values = []
+        self.seen = set()
+        self.dtype = CategoricalDtype([])
+
+    def update(self, values):
+        """ Appends the values that are not in the dictionary yet """
+        new = [value for value in pd.unique(np.asarray(values, dtype=object))
+               if not pd.isna(value) and value not in self.seen]
+        if new:
+            self.values += new
+            self.seen.update(new)
+            self.dtype = CategoricalDtype(self.values)
+
+    def encode(self, column):
+        """ Takes an identifier column of strings or categories. Returns it as a categorical over the dictionary """
+        self.update(column.cat.categories if isinstance(column.dtype, CategoricalDtype) else column)
+        return column.astype(self.dtype)
+
+
+identifiers = IdentifierDictionary()
+
+
+def compact_table(table):
+    """ Takes a table. Returns a copy with identifier columns as categoricals over the shared IdentifierDictionary and
+    float columns, and object columns that only hold numbers, as float32. Other columns are left alone. """
+
+    columns = {}
+    for name, column in table.items():
+        if name in IDENTIFIER_COLUMNS and (column.dtype == object or isinstance(column.dtype, CategoricalDtype)):
+            columns[name] = identifiers.encode(column)
+        elif isinstance(column.dtype, np.dtype) and column.dtype.kind == "f":
+            columns[name] = column.astype(np.float32)
+        elif column.dtype == object and infer_dtype(column) in ("floating", "integer", "mixed-integer-float", "empty"):
+            columns[name] = column.astype(np.float32)
+        else:
+            columns[name] = column
+    compact = pd.DataFrame(columns, index=table.index)
+    compact.columns.name = table.columns.name
+    return compact
+
+
+def concat_tables(tables):
+    """ Concatenates a list of tables, such as the seasons of a stat table. Categorical identifier columns are first
+    re-encoded against the shared dictionary's current categories, which pd.concat needs to keep them categorical. """
+
+    categorical = [
+        name for name in IDENTIFIER_COLUMNS
+        if any(name in table and isinstance(table[name].dtype, CategoricalDtype) for table in tables)
+    ]
+    if not categorical:
+        return pd.concat(tables)
+    for table in tables:
+        for name in categorical:
+            if name in table:
+                identifiers.update(table[name].cat.categories if isinstance(table[name].dtype, CategoricalDtype)
+                                   else table[name])
+    return pd.concat([
+        table.astype({name: identifiers.dtype for name in categorical if name in table}) for table in tables
+    ])
+
+
+# Table registry. Loaded tables are shared across the process: each cached table, and each concatenation of a table's
+# seasons, is loaded once and handed out read-only to every caller until its fingerprint changes or it is evicted.
+
+class TableRegistry(object):
+    """ Process-wide cache of loaded tables. Entries are checked against the table fingerprints stored in the cache
+    folder on every lookup, so a refreshed or appended table is reloaded, and the least recently used entries are
+    evicted once the tables held exceed the memory budget. Every lookup returns a shallow copy over the shared, frozen
+    arrays (see freeze): adding, replacing or deleting columns only changes the copy, and writing to a frozen column
+    in place raises instead of changing every caller's table. String columns stay writeable, so do not write to them
+    in place. """
+
+    def __init__(self, budget=TABLE_REGISTRY_BUDGET):
+        """
+            Optional Inputs:
+                budget: Bytes of tables kept before the least recently used are evicted
+        """
+        self.budget = budget
+        self.entries = OrderedDict()  # key: (version, table, bytes)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, version, load):
+        """ Takes a key, the current version of the table and a function that loads it. Returns the registered table,
+        loading it if it is missing or registered under another version. """
+
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[1].copy(deep=False)
+        self.misses += 1
+        self.discard(key)
+        table = freeze(load())
+        size = int(table.memory_usage(deep=True).sum())
+        self.entries[key] = (version, table, size)
+        self.bytes += size
+        while self.bytes > self.budget and len(self.entries) > 1:
+            self.discard(next(iter(self.entries)))
+            self.evictions += 1
+        return table.copy(deep=False)
+
+    def discard(self, key):
+        """ Removes an entry if it is registered """
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def clear(self):
+        """ Removes every entry. The hit and miss counts are kept. """
+        self.entries.clear()
+        self.bytes = 0
+
+    def load(self, stem):
+        """ Takes the cache path of a table (see table_stem). Returns the table. """
+        try:
+            return self.get(stem, read_fingerprint(stem), lambda: load_table(stem))
+        except FileNotFoundError:
+            raise DailyFantasyDataScienceError()
+
+    def seasons(self, name, seasons):
+        """ Takes the name of a season table (e.g. "offense") and a list of seasons. Returns the seasons' tables
+        concatenated, loading each season table through the registry. """
+        stems = [table_stem(name, season) for season in seasons]
+        return self.get(
+            (name, tuple(seasons)), tuple(read_fingerprint(stem) for stem in stems),
+            lambda: concat_tables([self.load(stem) for stem in stems])
+        )
+
+    def stats(self):
+        """ Returns the lookup counts, the number of tables held and their bytes against the budget """
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "tables": len(self.entries),
+                "bytes": self.bytes, "budget": self.budget}
+
+
+def freeze(table):
+    """ Takes a dataframe. Returns a dataframe over read-only views of its numeric, datetime and categorical code
+    arrays, so a shared table cannot be modified in place. Nothing is copied. Object arrays are left writeable, as
+    pandas compares strings through buffers that reject read-only arrays. """
+    arrays = []
+    for _, column in table.items():
+        if isinstance(column.dtype, CategoricalDtype):
+            arrays.append(pd.Categorical.from_codes(read_only(column.cat.codes.to_numpy()), dtype=column.dtype))
+        elif isinstance(column.dtype, np.dtype) and column.dtype != object:
+            arrays.append(read_only(column.to_numpy()))
+        else:
+            arrays.append(column.array)
+    return frame_from_arrays(arrays, table.columns, table.index)
+
+
+def read_only(values):
+    """ Returns a read-only view of a numpy array """
+    values = values.view()
+    values.flags.writeable = False
+    return values
+
+
+registry = TableRegistry()
@@ -1,61 +1,273 @@
+import os
+import glob
+import json
+import time
+import pickle
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
-from sklearn.ensemble import RandomForestRegressor
-from data import FootballTable, OffenseTable, OffenseTeamTable, DefenseTeamTable
-from data import AdvancedPassingTable, AdvancedRushingTable, AdvancedReceivingTable
-from config import SEASON_START_DATES
+from threadpoolctl import threadpool_limits
+from sklearn.ensemble import RandomForestRegressor, HistGradientBoostingRegressor
+from sklearn.model_selection import ParameterGrid
+from data import FootballTable, registry, fingerprint, frame_fingerprint
+from data import read_fingerprint, table_fingerprint
+from config import SEASON_START_DATES, MODEL_DIRECTORY, MODEL_PARAMS, MODEL_JOBS, MODEL_WARM_TREES
+from config import BOOSTING_PARAMS, MODEL_BACKENDS, ASOF_WINDOW, BUILD_WORKERS
+from config import SWEEP_DIRECTORY, SWEEP_GRID, SWEEP_WINDOWS, SWEEP_FOLDS
 
-class FootballRandomForestModel(object):
-    """ Primary model training class """
+class FeatureMatrix(object):
+    """ The training columns of a feature space as a single C-contiguous array in a fixed column order, with the
+    target alongside. Built straight from the feature space's columns in the dtype the backend fits on, so sklearn
+    takes the array as is rather than converting and copying a dataframe on every train and predict. """
 
-    def __init__(self, train):
+    # Columns of a feature space that are not training columns
+    KEYS = ['name', 'date', 'opp', 'Y']
+
+    def __init__(self, values, columns, target=None):
+        """
+            Required Inputs:
+                values: C-contiguous 2d array of the training columns
+                columns: Index of the training column names
+            Optional Inputs:
+                target: array of the target variable
+        """
+        self.values = values
+        self.columns = columns
+        self.target = target
+
+    @classmethod
+    def from_frame(cls, frame, columns=None, dtype="float32"):
+        """ Takes a feature space dataframe, an optional column order and a dtype. Returns the FeatureMatrix of the
+        frame's training columns, or of the given columns with the ones the frame lacks as 0. Missing values,
+        of the target too, are filled with 0. """
+        if columns is None:
+            columns = frame.columns.drop(cls.KEYS, errors='ignore')
+        values = np.zeros((len(frame), len(columns)), dtype=dtype)
+        for position, column in enumerate(columns):
+            if column in frame.columns:
+                values[:, position] = frame[column].to_numpy()
+        np.copyto(values, 0, where=np.isnan(values))
+        target = frame['Y'].fillna(0).to_numpy(dtype=np.float64) if 'Y' in frame.columns else None
+        return cls(values, columns, target)
+
+    def take(self, rows):
+        """ Takes a boolean mask or positions of rows. Returns the FeatureMatrix of those rows """
+        return FeatureMatrix(
+            np.ascontiguousarray(self.values[rows]), self.columns, None if self.target is None else self.target[rows]
+        )
+
+
+class FootballModel(object):
+    """ Primary model training class. Subclasses name the regressor backend the model trains. """
+
+    PARAMS = {}  # default hyperparameters of the backend
+    SIZE = None  # hyperparameter counting the trees of the backend
+    DTYPE = "float32"  # dtype the backend fits on, the training columns are passed to it in
+
+    def __init__(self, train, jobs=MODEL_JOBS, **params):
         """
         Required Inputs: 
-            train: dataframe of training data
+            train: dataframe of training data, or its FeatureMatrix
+        Optional Inputs:
+            jobs: cores the backend trains and predicts on, where it takes a number of jobs
+            params: hyperparameters of the backend, by default PARAMS
         """
         X, Y, C = self.parse(train)
         self.X = X
         self.Y = Y
         self.C = C
+        self.jobs = jobs
+        self.params = {**self.PARAMS, **params}
 
-    @staticmethod
-    def parse(data):
-        """ Takes a dataframe. Identifies the training columns, the target column, and the names of the training
-        columns. Returns those as X, Y and C respectively. """
-        Y = None
-        X = data.fillna(0)
-        if 'Y' in X.columns:
-            Y = X['Y']
-            del X['Y']
-        del X['name']
-        del X['date']
-        del X['opp']
-        C = X.columns
-        X = X.values
-        return X, Y, C
+    def __getstate__(self):
+        """ Pickles the fitted model without its training data """
+        state = self.__dict__.copy()
+        state['X'], state['Y'] = None, None
+        return state
+
+    @classmethod
+    def parse(cls, data):
+        """ Takes a dataframe or FeatureMatrix. Identifies the training columns, the target column, and the names of
+        the training columns. Returns those as X, Y and C respectively, X being a C-contiguous array of DTYPE. """
+        if not isinstance(data, FeatureMatrix):
+            data = FeatureMatrix.from_frame(data, dtype=cls.DTYPE)
+        return data.values, data.target, data.columns
+
+    def estimator(self):
+        """ Returns an unfitted regressor of the backend """
+        raise Exception("Override estimator function")
 
     def train(self):
-        """ Invokes the fit method of the random forest model. """
-        self.rfr = RandomForestRegressor(n_estimators=100, random_state=0)
-        self.rfr.fit(self.X, self.Y)
+        """ Invokes the fit method of the backend regressor. """
+        self.regressor = self.estimator()
+        self.regressor.fit(self.X, self.Y)
+
+    def add_trees(self, model, trees=MODEL_WARM_TREES):
+        """ Takes a trained model of the same backend, e.g. one trained up to an earlier week. Keeps its trees and
+        fits trees more of them on this model's training data with warm_start, in place of training from scratch. """
+        self.regressor = model.regressor
+        size = self.regressor.get_params()[self.SIZE]
+        self.regressor.set_params(warm_start=True, **{self.SIZE: size + trees})
+        self.regressor.fit(self.X, self.Y)
 
     def predict(self, test):
-        """ Takes a dataframe. Identifies the training columns, the target column, and the names of the training
-        columns. Generates predictions from the training columns. """
-        X, _, _ = self.parse(test)
-        return self.rfr.predict(X)
+        """ Takes a dataframe, or a FeatureMatrix in the training column order. Aligns a dataframe's columns to the
+        training columns, filling missing ones with 0. Generates predictions from the training columns. """
+        if not isinstance(test, FeatureMatrix):
+            test = FeatureMatrix.from_frame(test, self.C, self.DTYPE)
+        return self.regressor.predict(test.values)
+
+
+class FootballRandomForestModel(FootballModel):
+    """ Random forest model, trained on jobs cores """
+
+    PARAMS = MODEL_PARAMS
+    SIZE = "n_estimators"
+
+    def estimator(self):
+        """ Returns an unfitted RandomForestRegressor """
+        return RandomForestRegressor(**self.params, n_jobs=self.jobs)
+
+
+class FootballGradientBoostingModel(FootballModel):
+    """ Histogram gradient boosting model. The training columns are binned into at most 255 histogram bins per
+    column, so the split search scales with the bins rather than the rows. """
+
+    PARAMS = BOOSTING_PARAMS
+    SIZE = "max_iter"
+    DTYPE = "float64"
+
+    def estimator(self):
+        """ Returns an unfitted HistGradientBoostingRegressor """
+        return HistGradientBoostingRegressor(**self.params)
+
+
+MODEL_CLASSES = {"forest": FootballRandomForestModel, "boosting": FootballGradientBoostingModel}
+
+
+class ModelRegistry(object):
+    """ Trained models stored on disk. A model is keyed by its feature space (the position group), training cutoff
+    date, a fingerprint of the feature space rows before the cutoff and its hyperparameters, and is loaded instead of
+    trained whenever the key matches. """
+
+    def __init__(self, directory=MODEL_DIRECTORY):
+        """
+            Optional Inputs:
+                directory: Folder the models are stored in
+        """
+        self.directory = directory
+        self.loaded = 0
+        self.trained = 0
+
+    def get(self, feature_space, cutoff, warm_start=False, backend=None, **params):
+        """ Takes a feature space object and a cutoff date. Returns a model trained on the feature space rows before
+        the cutoff, loaded from disk when it was trained before. The backend is a key of MODEL_CLASSES, by default the
+        feature space's entry in MODEL_BACKENDS. Takes optional hyperparameters of the backend. With warm_start a
+        model missing from disk is grown from the latest stored warm-started model of an earlier cutoff by
+        MODEL_WARM_TREES trees rather than trained from scratch. """
+
+        backend = self.backend(feature_space, backend)
+        model_class = MODEL_CLASSES[backend]
+        cutoff = pd.Timestamp(cutoff)
+        params = {**model_class.PARAMS, **params}
+        train = feature_space.table[feature_space.table.date < cutoff]
+        path = self.path(feature_space.name, backend, params, cutoff, train, warm_start)
+        model = self.load(path)
+        if model is not None:
+            return model
+
+        model = model_class(train, **params)
+        previous = self.previous(os.path.dirname(path), cutoff, feature_space.table, model) if warm_start else None
+        if previous is not None:
+            model.add_trees(previous)
+        else:
+            model.train()
+        self.trained += 1
+        self.store(path, model)
+        return model
+
+    @staticmethod
+    def backend(feature_space, backend=None):
+        """ Returns the backend of a feature space's models: backend if passed, otherwise its entry in MODEL_BACKENDS
+        """
+        backend = backend or MODEL_BACKENDS.get(feature_space.name, "forest")
+        if backend not in MODEL_CLASSES:
+            raise Exception(f"Unknown model backend {backend}, expected one of {list(MODEL_CLASSES)}")
+        return backend
+
+    def path(self, name, backend, params, cutoff, train, warm_start=False):
+        """ Takes a feature space name, a backend, its full hyperparameters, a cutoff date and the training rows before
+        it. Returns the file the model is stored in. """
+        key = fingerprint(params, MODEL_CLASSES[backend].DTYPE, warm_start and MODEL_WARM_TREES)
+        folder = os.path.join(self.directory, name, backend, key[:16])
+        return os.path.join(folder, f"{cutoff:%Y%m%d}_{frame_fingerprint(train)[:16]}.pkl")
+
+    def load(self, path):
+        """ Returns the model stored in a file, or None if there is none """
+        if not os.path.exists(path):
+            return None
+        self.loaded += 1
+        with open(path, 'rb') as reader:
+            return pickle.load(reader)
+
+    @staticmethod
+    def store(path, model):
+        """ Stores a trained model in a file, replacing the file at once """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", 'wb') as writer:
+            pickle.dump(model, writer)
+        os.replace(f"{path}.tmp", path)
+
+    @staticmethod
+    def previous(folder, cutoff, table, model):
+        """ Takes a folder, a cutoff date, the feature space table and the untrained model of the cutoff. Returns the
+        stored model of the latest earlier cutoff that can be grown into it: trained on the same training columns with
+        the same hyperparameters, on exactly the rows the table has before its cutoff. Returns None if there is none,
+        e.g. after the feature set or the upstream data changed. """
+        earlier = [path for path in glob.glob(os.path.join(folder, "*.pkl"))
+                   if os.path.basename(path)[:8] < f"{cutoff:%Y%m%d}"]
+        for path in sorted(earlier, reverse=True):
+            stamp, data = os.path.basename(path)[:-len(".pkl")].split("_")
+            if frame_fingerprint(table[table.date < pd.Timestamp(stamp)])[:16] != data:
+                continue
+            with open(path, 'rb') as reader:
+                previous = pickle.load(reader)
+            if list(previous.C) == list(model.C) and previous.params == model.params:
+                return previous
+        return None
+
+
+models = ModelRegistry()
 
 class QuarterbackFeatureSpaceTable(FootballTable):
     """ Class for generating feature spaces for quarterbacks. Feature spaces are derived from the OffenseTable, 
     DefenseTeamTable, and AdvancedPassingTable. """
 
-    def __init__(self, seasons, refresh=True):
+    UPSTREAM = ["offense", "defenseTeam", "advancedPassing"]
 
-        self.offense_table = pd.concat([OffenseTable(season).table for season in seasons])
-        self.defense_table = pd.concat([DefenseTeamTable(season).table for season in seasons])
-        self.adv_passing_table = pd.concat([AdvancedPassingTable(season).table for season in seasons])
+    def __init__(self, seasons, refresh=True, window=ASOF_WINDOW):
+
+        self.offense_table = registry.seasons("offense", seasons)
+        self.defense_table = registry.seasons("defenseTeam", seasons)
+        self.adv_passing_table = registry.seasons("advancedPassing", seasons)
         self.feature_space_start = pd.Timestamp(SEASON_START_DATES[min(seasons)])
-        super(QuarterbackFeatureSpaceTable, self).__init__("QuarterbackFeatureSpaceTable", seasons, refresh)
+        super(QuarterbackFeatureSpaceTable, self).__init__("QuarterbackFeatureSpaceTable", seasons, refresh, window)
+
+    def default_matchups(self):
+        """ Returns the games of every quarterback with more than 10 pass attempts since the feature space start """
+        matchups = self.offense_table[self.offense_table.pass_att > 10]
+        matchups = matchups[['name', 'date', 'opp', 'DKScore']]
+        return matchups[matchups.date > self.feature_space_start]
+
+    def sources(self):
+        """ Returns the (table, matchups column, prefix) sources of the features """
+        return [
+            (self.offense_table, 'name', "o_"),
+            (self.adv_passing_table, 'name', "o_"),
+            (self.defense_table, 'opp', "d_"),
+        ]
 
     def build(self, matchups=None, add_y=True):
         """ Takes an optional matchups dataframe of player-games to generate feature spaces for. If matchups is not
@@ -66,25 +278,9 @@ class QuarterbackFeatureSpaceTable(FootballTable):
         """
 
         if matchups is None:
-            matchups = self.offense_table[self.offense_table.pass_att > 10].copy()
-            matchups = matchups[['name', 'date', 'opp', 'DKScore']]
-            matchups = matchups[matchups.date > self.feature_space_start]
-
-        records = []
-        for _, x in tqdm(matchups.iterrows()):
-            reg = self.query_asof(self.offense_table, x['name'], x['date'])
-            adv = self.query_asof(self.adv_passing_table, x['name'], x['date'])
-            offense_record = pd.concat([reg, adv])
-            defense_record = self.query_asof(self.defense_table, x['opp'], x['date'])
-            offense_record.index = ["o_" + i for i in offense_record.index]
-            defense_record.index = ["d_" + i for i in defense_record.index]
-            full_rec = pd.concat([offense_record, defense_record])
-            full_rec = full_rec.reset_index() \
-                .drop_duplicates('index') \
-                .set_index('index') \
-                .sort_values('index', ascending=False)
-            records.append(full_rec)
-        self.table = pd.concat(records, axis=1).T
+            matchups = self.default_matchups()
+
+        self.table = self.features(matchups)
 
         if add_y:
             self.table['Y'] = matchups['DKScore'].values
@@ -97,14 +293,33 @@ class PositionPlayerFeatureSpaceTable(FootballTable):
     """ Class for generating feature spaces for position players. Feature spaces are derived from the OffenseTable, 
     DefenseTeamTable, AdvancedRushingTable and AdvancedReceivingTable. """
 
-    def __init__(self, seasons, refresh=True):
+    UPSTREAM = ["offense", "defenseTeam", "advancedRushing", "advancedReceiving"]
+
+    def __init__(self, seasons, refresh=True, window=ASOF_WINDOW):
 
-        self.offense_table = pd.concat([OffenseTable(season).table for season in seasons])
-        self.defense_table = pd.concat([DefenseTeamTable(season).table for season in seasons])
-        self.adv_rush_table = pd.concat([AdvancedRushingTable(season).table for season in seasons])
-        self.adv_recv_table = pd.concat([AdvancedReceivingTable(season).table for season in seasons])
+        self.offense_table = registry.seasons("offense", seasons)
+        self.defense_table = registry.seasons("defenseTeam", seasons)
+        self.adv_rush_table = registry.seasons("advancedRushing", seasons)
+        self.adv_recv_table = registry.seasons("advancedReceiving", seasons)
         self.feature_space_start = pd.Timestamp(SEASON_START_DATES[min(seasons)])
-        super(PositionPlayerFeatureSpaceTable, self).__init__("PositionPlayerFeatureSpaceTable", seasons, refresh)
+        super(PositionPlayerFeatureSpaceTable, self).__init__(
+            "PositionPlayerFeatureSpaceTable", seasons, refresh, window
+        )
+
+    def default_matchups(self):
+        """ Returns the games of every player with at most one pass attempt since the feature space start """
+        matchups = self.offense_table[self.offense_table.pass_att <= 1]
+        matchups = matchups[['name', 'date', 'opp', 'DKScore']]
+        return matchups[matchups.date > self.feature_space_start]
+
+    def sources(self):
+        """ Returns the (table, matchups column, prefix) sources of the features """
+        return [
+            (self.offense_table, 'name', "o_"),
+            (self.adv_rush_table, 'name', "o_"),
+            (self.adv_recv_table, 'name', "o_"),
+            (self.defense_table, 'opp', "d_"),
+        ]
 
     def build(self, matchups=None, add_y=True):
         """ Takes an optional matchups dataframe of player-games to generate feature spaces for. If matchups is not
@@ -115,27 +330,9 @@ class PositionPlayerFeatureSpaceTable(FootballTable):
         """
 
         if matchups is None:
-            matchups = self.offense_table[self.offense_table.pass_att <= 1].copy()
-            matchups = matchups[['name', 'date', 'opp', 'DKScore']]
-            matchups = matchups[matchups.date > self.feature_space_start]
-        records = []
-
-        for _, x in tqdm(matchups.iterrows()):
-            reg = self.query_asof(self.offense_table, x['name'], x['date'])
-            adv_rush = self.query_asof(self.adv_rush_table, x['name'], x['date'])
-            adv_recv = self.query_asof(self.adv_recv_table, x['name'], x['date'])
-            offense_record = pd.concat([reg, adv_rush, adv_recv])
-            defense_record = self.query_asof(self.defense_table, x['opp'], x['date'])
-            offense_record.index = ["o_" + i for i in offense_record.index]
-            defense_record.index = ["d_" + i for i in defense_record.index]
-            full_rec = pd.concat([offense_record, defense_record])
-            full_rec = full_rec.reset_index() \
-                .drop_duplicates('index') \
-                .set_index('index') \
-                .sort_values('index', ascending=False)
-            records.append(full_rec)
-
-        self.table = pd.concat(records, axis=1).T
+            matchups = self.default_matchups()
+
+        self.table = self.features(matchups)
         if add_y:
             self.table['Y'] = matchups['DKScore'].values
         self.table['name'] = matchups['name'].values
@@ -144,14 +341,28 @@ class PositionPlayerFeatureSpaceTable(FootballTable):
 
 
 class DefenseFeatureSpaceTable(FootballTable):
-    def __init__(self, seasons, refresh=True,):
+    UPSTREAM = ["offenseTeam", "defenseTeam"]
+
+    def __init__(self, seasons, refresh=True, window=ASOF_WINDOW):
         """ Class for generating feature spaces for a team's defence. Feature spaces are derived from the 
         OffenseTeamTable, and DefenseTeamTable. """
 
-        self.offense_table = pd.concat([OffenseTeamTable(season).table for season in seasons])
-        self.defense_table = pd.concat([DefenseTeamTable(season).table for season in seasons])
+        self.offense_table = registry.seasons("offenseTeam", seasons)
+        self.defense_table = registry.seasons("defenseTeam", seasons)
         self.feature_space_start = pd.Timestamp(SEASON_START_DATES[min(seasons)])
-        super(DefenseFeatureSpaceTable, self).__init__("DefenseFeatureSpaceTable", seasons, refresh)
+        super(DefenseFeatureSpaceTable, self).__init__("DefenseFeatureSpaceTable", seasons, refresh, window)
+
+    def default_matchups(self):
+        """ Returns the games of every defense since the feature space start """
+        matchups = self.defense_table[['name', 'date', 'opp', 'DKScore']]
+        return matchups[matchups.date > self.feature_space_start]
+
+    def sources(self):
+        """ Returns the (table, matchups column, prefix) sources of the features """
+        return [
+            (self.defense_table, 'name', "teamDef_"),
+            (self.offense_table, 'opp', "oppOff_"),
+        ]
 
     def build(self, matchups=None, add_y=True):
         """ Takes an optional matchups dataframe of player-games to generate feature spaces for. If matchups is not
@@ -161,26 +372,280 @@ class DefenseFeatureSpaceTable(FootballTable):
         """
 
         if matchups is None:
-            matchups = self.defense_table.copy()
-            matchups = matchups[['name', 'date', 'opp', 'DKScore']]
-            matchups = matchups[matchups.date > self.feature_space_start]
-
-        records = []
-        for _, x in tqdm(matchups.iterrows()):
-            team_defense_record = self.query_asof(self.defense_table, x['name'], x['date'])
-            opp_offense_record = self.query_asof(self.offense_table, x['opp'], x['date'])
-            team_defense_record.index = ["teamDef_" + i for i in team_defense_record.index]
-            opp_offense_record.index = ["oppOff_" + i for i in opp_offense_record.index]
-            full_rec = pd.concat([team_defense_record, opp_offense_record])
-            full_rec = full_rec.reset_index() \
-                .drop_duplicates('index') \
-                .set_index('index') \
-                .sort_values('index', ascending=False)
-            records.append(full_rec)
-        self.table = pd.concat(records, axis=1).T
+            matchups = self.default_matchups()
+
+        self.table = self.features(matchups)
 
         if add_y:
             self.table['Y'] = matchups['DKScore'].values
         self.table['name'] = matchups['name'].values
         self.table['date'] = matchups['date'].values
-        self.table['opp'] = matchups['opp'].values
\ No newline at end of file
+        self.table['opp'] = matchups['opp'].values
+
+
+class SlatePredictor(object):
+    """ Long-lived gameday scorer. Loads the feature spaces, their models and the per-player as-of states once, then
+    scores salary slates on its date. Predictions are remembered per player and opponent, so scoring the slate again
+    after late salary or inactive changes only builds features for players it has not seen. """
+
+    # Feature space of each group of the Roster Position column, position players being every other position
+    GROUPS = {"QB": QuarterbackFeatureSpaceTable, "DST": DefenseFeatureSpaceTable, "PP": PositionPlayerFeatureSpaceTable}
+
+    def __init__(self, seasons, date, warm_start=False):
+        """
+            Required Inputs:
+                seasons: list of years of seasons the feature spaces and models are built from
+                date: Timestamp of the slate, models are trained on the games before it
+            Optional Inputs:
+                warm_start: Boolean determining if missing models are grown from earlier ones (see ModelRegistry.get)
+        """
+        self.date = pd.Timestamp(date)
+        self.spaces, self.models, self.states = {}, {}, {}
+        for group, feature_class in self.GROUPS.items():
+            space = feature_class(seasons=seasons, refresh=False)
+            self.spaces[group] = space
+            self.models[group] = models.get(space, self.date, warm_start)
+            self.states[group] = space.asof_state(pd.DataFrame({'date': [self.date]}))
+        self.predictions = {}
+
+    @staticmethod
+    def group(positions):
+        """ Takes a Roster Position series. Returns the feature space group of each player """
+        return positions.map(lambda position: position if position in ("QB", "DST") else "PP")
+
+    def predict(self, slate):
+        """ Takes a slate dataframe with name, opp and Roster Position columns, e.g. DKSalariesExample.csv prepared
+        as in the gameday notebook. Returns the predicted points of every row as a series named pred, aligned to the
+        slate's index. Rows dropped from the slate (inactives) are simply not scored. """
+
+        keys = list(zip(self.group(slate['Roster Position']), slate['name'], slate['opp']))
+        missing = pd.DataFrame([key for key in dict.fromkeys(keys) if key not in self.predictions],
+                               columns=['group', 'name', 'opp'])
+        for group, matchups in missing.groupby('group'):
+            space = self.spaces[group]
+            matchups = matchups.assign(date=self.date)
+            features = space.asof_features(matchups, space.sources(), self.states[group])
+            for name, opp, value in zip(matchups['name'], matchups['opp'], self.models[group].predict(features)):
+                self.predictions[group, name, opp] = value
+        return pd.Series([self.predictions[key] for key in keys], index=slate.index, dtype=np.float64, name='pred')
+
+
+class SharedFeatureMatrix(object):
+    """ A FeatureMatrix and the dates of its rows copied once into shared memory, so the workers of a sweep map the
+    same pages rather than each unpickling its own copy. spec() is what is sent to the workers (see attach_matrix). """
+
+    def __init__(self, matrix, dates):
+        """
+            Required Inputs:
+                matrix: FeatureMatrix with a target
+                dates: array of the date of each row of the matrix
+        """
+        self.columns = matrix.columns
+        self.blocks, self.arrays = {}, {}
+        arrays = {"values": matrix.values, "target": matrix.target, "dates": np.asarray(dates, dtype='datetime64[ns]')}
+        for key, array in arrays.items():
+            self.blocks[key] = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            self.arrays[key] = np.ndarray(array.shape, array.dtype, buffer=self.blocks[key].buf)
+            self.arrays[key][...] = array
+
+    def spec(self):
+        """ Returns the picklable description of the shared arrays: their column names and each array's shared memory
+        name, shape and dtype """
+        return {
+            "columns": list(self.columns),
+            "arrays": {key: (self.blocks[key].name, array.shape, array.dtype.str) for key, array in self.arrays.items()}
+        }
+
+    def close(self):
+        """ Releases and removes the shared memory """
+        self.arrays = {}
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+
+
+worker_matrices = {}
+
+
+def attach_matrix(spec):
+    """ Takes the spec of a SharedFeatureMatrix. Returns its FeatureMatrix and row dates as views of the shared memory,
+    attached once per sweep worker. """
+    key = spec["arrays"]["values"][0]
+    if key not in worker_matrices:
+        blocks, arrays = [], {}
+        for name, (block_name, shape, dtype) in spec["arrays"].items():
+            blocks.append(shared_memory.SharedMemory(name=block_name))
+            arrays[name] = np.ndarray(shape, dtype, buffer=blocks[-1].buf)
+        matrix = FeatureMatrix(arrays["values"], pd.Index(spec["columns"]), arrays["target"])
+        worker_matrices[key] = (blocks, matrix, arrays["dates"])
+    return worker_matrices[key][1:]
+
+
+def fold_model(matrix, rows, backend, params, jobs):
+    """ Trains a model of a backend with hyperparameters on rows of a FeatureMatrix, on jobs cores in a worker """
+    with threadpool_limits(jobs):
+        model = MODEL_CLASSES[backend](matrix.take(rows), jobs=jobs, **params)
+        model.train()
+    return model
+
+
+def sweep_fold(spec, backend, params, cutoff, jobs):
+    """ Trains a model of a backend with hyperparameters on the rows of a shared feature matrix before the cutoff date
+    and scores it on the rows of the cutoff date, on jobs cores. Returns the row counts, mean absolute error, root mean
+    squared error and seconds taken. """
+    start = time.perf_counter()
+    matrix, dates = attach_matrix(spec)
+    train, test = dates < cutoff.to_datetime64(), dates == cutoff.to_datetime64()
+    model = fold_model(matrix, train, backend, params, jobs)
+    test = matrix.take(test)
+    with threadpool_limits(jobs):
+        errors = model.predict(test) - test.target
+    return {
+        "train_rows": int(train.sum()), "test_rows": len(errors), "mae": np.abs(errors).mean(),
+        "rmse": np.sqrt(np.square(errors).mean()), "seconds": time.perf_counter() - start
+    }
+
+
+def walk_forward_fold(spec, backend, params, cutoff, jobs):
+    """ Trains the model of one week of a walk-forward backtest on the rows of a shared feature matrix before the
+    cutoff date, on jobs cores. Returns the model and the seconds taken. """
+    start = time.perf_counter()
+    matrix, dates = attach_matrix(spec)
+    model = fold_model(matrix, dates < cutoff.to_datetime64(), backend, params, jobs)
+    return model, time.perf_counter() - start
+
+
+def sweep(seasons, grid=SWEEP_GRID, windows=SWEEP_WINDOWS, folds=SWEEP_FOLDS, groups=None, name="sweep",
+          directory=SWEEP_DIRECTORY, max_workers=BUILD_WORKERS):
+    """ Walk-forward hyperparameter sweep. Takes a list of seasons. For each feature space of groups (keys of
+    SlatePredictor.GROUPS, default all) and each as-of window, builds the feature space's matrix once into shared
+    memory. Each of the last folds game dates is a fold: trained on the games before it and scored on its games. Every
+    fold of every backend and hyperparameter combination of grid ({backend: {hyperparameter: [values]}}) runs on a pool
+    of max_workers processes, and each result is appended to the {directory}/{name}.csv results table as it finishes.
+    Folds already in the results table are skipped, so an interrupted sweep resumes. Returns the results table. """
+
+    path = os.path.join(directory, f"{name}.csv")
+    done = set(pd.read_csv(path)['task']) if os.path.exists(path) else set()
+    jobs = max(1, (os.cpu_count() or 1) // max_workers)
+    shared, tasks = [], []
+    try:
+        for group in groups or SlatePredictor.GROUPS:
+            for window in windows:
+                space = SlatePredictor.GROUPS[group](seasons=seasons, refresh=False, window=window)
+                if read_fingerprint(space.stem) != table_fingerprint(space, space.inputs()):
+                    space.build()
+                data = frame_fingerprint(space.table)
+                shared.append(SharedFeatureMatrix(FeatureMatrix.from_frame(space.table), space.table['date']))
+                for backend, options in grid.items():
+                    for params in ParameterGrid(options):
+                        for cutoff in sorted(space.table['date'].unique())[-folds:]:
+                            cutoff = pd.Timestamp(cutoff)
+                            task = fingerprint(group, window, backend, params, cutoff, data)
+                            if task not in done:
+                                row = {"task": task, "group": group, "window": window, "backend": backend,
+                                       "params": json.dumps(params, sort_keys=True), "cutoff": cutoff}
+                                tasks.append((row, (shared[-1].spec(), backend, params, cutoff, jobs)))
+
+        os.makedirs(directory, exist_ok=True)
+        with ProcessPoolExecutor(max_workers=max_workers) as pool, tqdm(total=len(tasks)) as progress:
+            pending = {pool.submit(sweep_fold, *arguments): row for row, arguments in tasks}
+            with open(path, 'a') as writer:
+                for future in as_completed(pending):
+                    pd.DataFrame([{**pending[future], **future.result()}]).to_csv(
+                        writer, header=writer.tell() == 0, index=False
+                    )
+                    writer.flush()
+                    progress.update()
+    finally:
+        for matrix in shared:
+            matrix.close()
+    return pd.read_csv(path, parse_dates=['cutoff'])
+
+
+def sweep_summary(results):
+    """ Takes a sweep results table. Returns the mean error and seconds of every feature space group, window, backend
+    and hyperparameter combination over its folds, best first within each group. """
+    summary = results.groupby(['group', 'window', 'backend', 'params'])[['mae', 'rmse', 'seconds']].mean()
+    return summary.reset_index().sort_values(['group', 'mae']).reset_index(drop=True)
+
+
+def walk_forward(seasons, matchups, max_workers=BUILD_WORKERS, model_registry=models):
+    """ Walk-forward backtest. Takes a list of seasons and a matchups dataframe with year, week, name, date, opp and
+    Roster Position columns, the week's date being the first date of its rows. Loads each feature space once. The
+    model of every week and position group, trained on the feature space rows before the week's date, is loaded from
+    the model registry or else trained on a pool of max_workers processes, each week's rows picked by a date mask
+    from the feature space's matrix in shared memory, and stored. Features of every week's players are built at once
+    per group. Returns {(year, week): predicted points by name} and a table of each week's players, models loaded and
+    trained, and seconds spent training, building features and predicting. """
+
+    matchups = matchups.reset_index(drop=True)
+    groups = SlatePredictor.group(matchups['Roster Position'])
+    weeks = dict(list(matchups.groupby(['year', 'week'])))
+    cutoffs = {week: pd.Timestamp(players.date.iloc[0]) for week, players in weeks.items()}
+    timings = pd.DataFrame(
+        0, index=pd.MultiIndex.from_tuples(list(weeks), names=['year', 'week']),
+        columns=['players', 'loaded', 'trained', 'train_seconds', 'feature_seconds', 'predict_seconds']
+    ).astype({'train_seconds': float, 'feature_seconds': float, 'predict_seconds': float})
+    jobs = max(1, (os.cpu_count() or 1) // max_workers)
+
+    spaces, backends, fitted, missing = {}, {}, {}, {}
+    for group, feature_class in SlatePredictor.GROUPS.items():
+        spaces[group] = space = feature_class(seasons=seasons, refresh=False)
+        backends[group] = backend = model_registry.backend(space)
+        for week in {week for week, players in weeks.items() if (groups[players.index] == group).any()}:
+            train = space.table[space.table.date < cutoffs[week]]
+            path = model_registry.path(space.name, backend, MODEL_CLASSES[backend].PARAMS, cutoffs[week], train)
+            start = time.perf_counter()
+            fitted[group, week] = model_registry.load(path)
+            if fitted[group, week] is None:
+                missing[group, week] = path
+            else:
+                timings.loc[week, 'loaded'] += 1
+                timings.loc[week, 'train_seconds'] += time.perf_counter() - start
+
+    shared = {}
+    try:
+        for group in {group for group, _ in missing}:
+            table = spaces[group].table
+            matrix = FeatureMatrix.from_frame(table, dtype=MODEL_CLASSES[backends[group]].DTYPE)
+            shared[group] = SharedFeatureMatrix(matrix, table['date'])
+        with ProcessPoolExecutor(max_workers=max_workers) as pool, tqdm(total=len(missing)) as progress:
+            pending = {
+                pool.submit(walk_forward_fold, shared[group].spec(), backends[group],
+                            MODEL_CLASSES[backends[group]].PARAMS, cutoffs[week], jobs): (group, week)
+                for group, week in missing
+            }
+            for future in as_completed(pending):
+                group, week = pending[future]
+                fitted[group, week], seconds = future.result()
+                model_registry.store(missing[group, week], fitted[group, week])
+                model_registry.trained += 1
+                timings.loc[week, 'trained'] += 1
+                timings.loc[week, 'train_seconds'] += seconds
+                progress.update()
+    finally:
+        for matrix in shared.values():
+            matrix.close()
+
+    points = np.full(len(matchups), np.nan)
+    for group, space in spaces.items():
+        rows = matchups[groups == group]
+        if not len(rows):
+            continue
+        start = time.perf_counter()
+        features = space.features(rows[['name', 'opp']].assign(
+            date=[cutoffs[week] for week in zip(rows['year'], rows['week'])]
+        ))
+        seconds = time.perf_counter() - start
+        for week, players in rows.groupby(['year', 'week']):
+            timings.loc[week, 'feature_seconds'] += seconds * len(players) / len(rows)
+            start = time.perf_counter()
+            points[players.index] = fitted[group, week].predict(features[rows.index.isin(players.index)])
+            timings.loc[week, 'predict_seconds'] += time.perf_counter() - start
+
+    predictions = {}
+    for week, players in weeks.items():
+        timings.loc[week, 'players'] = len(players)
+        week_points = pd.Series(points[players.index], index=players['name'].values)
+        predictions[week] = week_points[~week_points.index.duplicated(keep='last')]
+    return predictions, timings
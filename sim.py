@@ -1,4 +1,3 @@
-import requests
 import numpy as np
 import cvxpy as cp
 import pandas as pd
@@ -6,20 +5,21 @@ import pandas as pd
 from tqdm import tqdm
 from bs4 import BeautifulSoup
 
+from web import fetch
 from maps import team_map_2
-from data import ReferenceTable
-from model import QuarterbackFeatureSpaceTable, PositionPlayerFeatureSpaceTable, DefenseFeatureSpaceTable
-from model import FootballRandomForestModel
-from config import PROJECT_DIRECTORY
+from data import ReferenceTable, file_fingerprint
+from model import walk_forward
+from config import PROJECT_DIRECTORY, BUILD_WORKERS
 
 class HistoricalSalaryTable(ReferenceTable):
     """ Data standardization class for historic player salaries """
-    def __init__(self, seasons, refresh=True,  max_year=2020, max_week=11):
+    def __init__(self, seasons, refresh=True,  max_year=2020, max_week=11, offline=False):
         """ 
             Required Inputs:
                 seasons: list of years of seasons to pull historic salaries for
             Optional Inputs:
                 refresh: Boolean determining if payout table should be refreshed/built 
+                offline: Boolean determining if the salary pages should be read from the page cache
         """
         if max_week:
             assert max_year
@@ -29,16 +29,22 @@ class HistoricalSalaryTable(ReferenceTable):
         self.url_args = [
             (i +1, str(y)) for y in seasons for i in range(17) if not (( i + 1 > max_week) and (y==max_year))
         ]
+        self.offline = offline
         super(HistoricalSalaryTable, self).__init__("historicalSalary", refresh)
 
+    def inputs(self):
+        """ Returns the weeks of salaries the table is built from """
+        return super(HistoricalSalaryTable, self).inputs() + [self.url_args]
+
     def build(self):
         """ Pings the rotoguru site for each week within a season. Extracts salary data for players and stores in a 
         dataframe. """
 
         out = []
         for wk, yr in tqdm(self.url_args):
-            resp = requests.get(f"http://rotoguru1.com/cgi-bin/fyday.pl?week={wk}&year={yr}&game=dk&scsv=1")
-            soup = BeautifulSoup(resp.text, "html.parser")
+            url = f"http://rotoguru1.com/cgi-bin/fyday.pl?week={wk}&year={yr}&game=dk&scsv=1"
+            html = fetch(url, offline=self.offline)
+            soup = BeautifulSoup(html, "html.parser")
             rows = [ln.split(";") for ln in soup.find('pre').text.split("\n")]
             sal = pd.DataFrame(rows[1:], columns = rows[0])
             sal = sal.rename(columns={'Oppt': 'opp', 'Team': 'team', 'Pos': 'pos'})
@@ -59,6 +65,9 @@ class HistoricalSalaryTable(ReferenceTable):
 
 class PayoutTable(ReferenceTable):
     """ Data standardization class for competition payouts """
+
+    REF_FILES = [f"{PROJECT_DIRECTORY}/ref/payout.txt"]
+
     def __init__(self, refresh=False):
         """ 
             Optional Inputs:
@@ -83,9 +92,16 @@ class PayoutTable(ReferenceTable):
 
 class BacktestLinksTable(ReferenceTable):
     """ Data Standardization class for the results table """
+
+    REF_FILES = [f"{PROJECT_DIRECTORY}/ref/ResultLinks.csv"]
+
     def __init__(self, refresh=False):
         super(BacktestLinksTable, self).__init__("backtestLinksTable", refresh=refresh)
 
+    def contest_files(self):
+        """ Returns the paths of the contest standings csv files of every linked contest """
+        return [f"{PROJECT_DIRECTORY}/ref/Results/contest-standings-{gameid}.csv" for gameid in self.table['gameid']]
+
     def build(self):
         """ Reads the results links file, cleans up columns and stores as a dataframe. """
         links = pd.read_csv(f"{PROJECT_DIRECTORY}/ref/ResultLinks.csv")
@@ -98,11 +114,18 @@ class BacktestLinksTable(ReferenceTable):
 class BacktestStandingsTable(ReferenceTable):
     """ Data Standardization class for the contest standings table  """
 
+    UPSTREAM = ["payoutTable", "backtestLinksTable"]
+
     def __init__(self, refresh=True):
         self.payoutTable = PayoutTable(refresh=True)
         self.backtestTable = BacktestLinksTable(refresh=True)
         super(BacktestStandingsTable, self).__init__("historicalStandings", refresh=refresh)
 
+    def inputs(self):
+        """ Returns the upstream fingerprints and the contest standings files the table is built from """
+        contests = [file_fingerprint(path) for path in self.backtestTable.contest_files()]
+        return super(BacktestStandingsTable, self).inputs() + contests
+
     def build(self):
         """ Pulls the contest standings csv for each game within the BacktestLinksTable. Standardizes the data and then
         filters such that only entries at each payout level remain. """
@@ -126,10 +149,17 @@ class BacktestStandingsTable(ReferenceTable):
 class DoubleupStandingsTable(ReferenceTable):
     """ Data Standardization class for the double-up contest standings table  """
 
+    UPSTREAM = ["backtestLinksTable"]
+
     def __init__(self, refresh=True):
         self.backtestTable = BacktestLinksTable(refresh=True)
         super(DoubleupStandingsTable, self).__init__("doubleupStandings", refresh=refresh)
 
+    def inputs(self):
+        """ Returns the upstream fingerprints and the contest standings files the table is built from """
+        contests = [file_fingerprint(path) for path in self.backtestTable.contest_files()]
+        return super(DoubleupStandingsTable, self).inputs() + contests
+
     def build(self):
         """ Pulls the contest standings csv for each game within the BacktestLinksTable. Standardizes the data and then
         filters such only the entry that divides the competition between the top 40% and bottom 60% remains. """
@@ -153,11 +183,18 @@ class DoubleupStandingsTable(ReferenceTable):
 class BacktestPlayerPerformanceTable(ReferenceTable):
     """ Data Standardization class for the player salary tables """
 
+    UPSTREAM = ["backtestLinksTable", "historicalSalary"]
+
     def __init__(self, seasons, refresh=True):
         self.backtestTable = BacktestLinksTable(refresh=refresh)
         self.histSalaryTable = HistoricalSalaryTable(seasons=seasons, refresh=refresh)
         super(BacktestPlayerPerformanceTable, self).__init__("historicalPerformance", refresh=refresh)
 
+    def inputs(self):
+        """ Returns the upstream fingerprints and the contest standings files the table is built from """
+        contests = [file_fingerprint(path) for path in self.backtestTable.contest_files()]
+        return super(BacktestPlayerPerformanceTable, self).inputs() + contests
+
     def build(self):
         """ Cycles through historic competitions. For each competition loads the contest standings data and extracts
         player salary data. Standarizes the data such that it can be matched on player names. """
@@ -184,59 +221,30 @@ class BacktestPlayerPerformanceTable(ReferenceTable):
 
 class BacktestPredictionsTable(ReferenceTable):
     """ Model training and prediction generation class"""
+
+    UPSTREAM = [
+        "historicalPerformance", "QuarterbackFeatureSpaceTable", "PositionPlayerFeatureSpaceTable",
+        "DefenseFeatureSpaceTable"
+    ]
+
     def __init__(self, seasons, refresh=True):
         self.seasons = seasons
         self.btPerf = BacktestPlayerPerformanceTable(seasons=seasons, refresh=refresh)
         super(BacktestPredictionsTable, self).__init__("backtestPredictions", refresh=refresh)
 
-    def build(self, matchups=None):
+    def inputs(self):
+        """ Returns the upstream fingerprints and the seasons the predictions are trained on """
+        return super(BacktestPredictionsTable, self).inputs() + [self.seasons]
+
+    def build(self, matchups=None, max_workers=BUILD_WORKERS):
         """ Takes an optional dataframe of matchups, otherwise uses the player performance table. For each week of
-        matches trains a model on all possible previous weeks. That model is then used to make the upcoming weeks
-        predictions. Stores predictions in a multi-index dataframe."""
+        matches trains a model on all possible previous weeks, the weeks trained in parallel on max_workers processes
+        (see walk_forward). That model is then used to make the upcoming weeks predictions. Stores predictions in a
+        multi-index dataframe and the time spent on each week in timings."""
 
         if matchups is None:
             matchups = self.btPerf.table
-        out = {}
-        for nm, players in matchups.groupby(['year', 'week']):
-            qb_matchups = players[players['Roster Position'] == 'QB'][['name', 'date', 'opp']].copy()
-            df_matchups = players[players['Roster Position'] == 'DST'][['name', 'date', 'opp']].copy()
-            pp_matchups = players[
-                (players['Roster Position'] != 'DST') & (players['Roster Position'] != 'QB')][['name', 'date', 'opp']
-            ].copy()
-
-            date = players.date.iloc[0]
-
-            qb_fs = QuarterbackFeatureSpaceTable(seasons=self.seasons, refresh=False)
-            pp_fs = PositionPlayerFeatureSpaceTable(seasons=self.seasons, refresh=False)
-            df_fs = DefenseFeatureSpaceTable(seasons=self.seasons, refresh=False)
-
-            # Select a feature space before the date
-            qb_train = qb_fs.table[qb_fs.table.date < date].copy()
-            pp_train = pp_fs.table[pp_fs.table.date < date].copy()
-            df_train = df_fs.table[df_fs.table.date < date].copy()
-
-            qb_model = FootballRandomForestModel(qb_train)
-            pp_model = FootballRandomForestModel(pp_train)
-            df_model = FootballRandomForestModel(df_train)
-            qb_model.train()
-            pp_model.train()
-            df_model.train()
-
-            # Build a feature space with matchups on the date 
-            qb_fs.build(matchups=qb_matchups, add_y=False)
-            qb_test = qb_fs.table
-            pp_fs.build(matchups=pp_matchups, add_y=False)
-            pp_test = pp_fs.table
-            df_fs.build(matchups=df_matchups, add_y=False)
-            df_test = df_fs.table
-            qb_pred = qb_model.predict(qb_test)
-            pp_pred = pp_model.predict(pp_test)
-            df_pred = df_model.predict(df_test)
-            predictions = pd.concat([
-                pd.Series(dict(zip(qb_test['name'].values, qb_pred))),
-                pd.Series(dict(zip(pp_test['name'].values, pp_pred))),
-                pd.Series(dict(zip(df_test['name'].values, df_pred)))])
-            out[nm] = predictions
+        out, self.timings = walk_forward(self.seasons, matchups, max_workers)
         self.table = pd.DataFrame(out).stack().stack(0)
 
 
@@ -0,0 +1,397 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data
+from config import StaleCacheError
+from bench import assert_same_rows, check_asof, legacy_asof_features, legacy_defense_records, season_tables
+from data import AsofIndex, DefenseTeamTable, FootballTable, OffenseTeamTable, SEASON_TABLES, registry
+from data import append_season, freeze
+from maps import team_map_inv
+from web import FootballBoxscore
+
+
+TEAMS = ["buf", "mia", "nwe", "nyj", "bal", "pit"]
+
+
+def synthetic_team_tables(rng, weeks):
+    """ Returns a random OffenseTeamTable table and ScoreTable table: every week the teams are paired off into games,
+    with one game left off some weeks as a bye. Scores include shutouts, a missing score and every points allowed bin """
+    offense, scores = [], []
+    for week in range(weeks):
+        date = pd.Timestamp("2020-09-13") + pd.Timedelta(weeks=week)
+        teams = rng.permutation(TEAMS)
+        games = [(teams[i], teams[i + 1]) for i in range(0, len(teams), 2)][:3 - week % 2]
+        for home, away in games:
+            home_score, away_score = rng.choice([0.0, 3.0, 10.0, 17.0, 24.0, 31.0, 45.0, np.nan], 2)
+            scores.append({'date': date, 'home': home, 'away': away, 'home_score': home_score,
+                           'away_score': away_score})
+            for team, opp in [(home, away), (away, home)]:
+                offense.append({
+                    'team': team, 'date': date, 'opp': opp, 'player': None,
+                    'pass_yds': float(rng.integers(100, 400)), 'rush_yds': float(rng.integers(20, 200)),
+                    'sacks_allowed': float(rng.integers(0, 6)), 'pass_int': float(rng.integers(0, 3)),
+                    'fumbles_lost': float(rng.integers(0, 3)),
+                })
+    return pd.DataFrame(offense), pd.DataFrame(scores)
+
+
+@pytest.mark.parametrize("seed, weeks", [(0, 1), (1, 6), (2, 17)])
+def test_defense_records_match_the_per_team_join(seed, weeks):
+    off_team_table, score_table = synthetic_team_tables(np.random.default_rng(seed), weeks)
+    pd.testing.assert_frame_equal(DefenseTeamTable.defense_records(off_team_table, score_table),
+                                  legacy_defense_records(off_team_table, score_table))
+
+
+def test_defense_records_are_the_opponents_offense():
+    off_team_table, score_table = synthetic_team_tables(np.random.default_rng(3), 4)
+    records = DefenseTeamTable.defense_records(off_team_table, score_table)
+    offense = off_team_table.set_index(['team', 'date'])
+    for _, row in records.iterrows():
+        assert row['pass_yds'] == offense.loc[(row['opp'], row['date']), 'pass_yds']
+    assert (records['name'] == records['team']).all()
+    assert records['date'].is_monotonic_increasing
+
+
+def test_freeze_shares_the_arrays_read_only():
+    table = pd.DataFrame({
+        'yds': [10.0, 20.0, 30.0], 'td': [0, 1, 2], 'date': pd.to_datetime(["2020-09-13", "2020-09-20", None]),
+        'team': pd.Categorical(["buf", "mia", "buf"]), 'name': ["A", "B", "C"],
+    })
+    frozen = freeze(table)
+    pd.testing.assert_frame_equal(frozen, table)
+    for column in ['yds', 'td', 'date']:
+        assert np.shares_memory(frozen[column].to_numpy(), table[column].to_numpy())
+        with pytest.raises(ValueError, match="read-only"):
+            frozen.loc[0, column] = frozen.loc[1, column]
+    with pytest.raises(ValueError, match="read-only"):
+        frozen.loc[0, 'team'] = "mia"
+    assert (frozen.name == "A").sum() == 1
+
+    copy = frozen.copy(deep=False)
+    copy['yds'] = copy['yds'] * 2
+    copy['new'] = 1
+    pd.testing.assert_frame_equal(frozen, table)
+
+
+def random_asof_table(rng, rows):
+    """ Returns a random table for as-of lookups: a few names (one missing), dates from a short list with NaT, float
+    columns with nan, int, bool and string columns, and an object column of mostly numbers """
+    names = np.array(["A", "B", "C", "D", None], dtype=object)
+    dates = pd.to_datetime(["2020-09-13", "2020-09-20", "2020-09-27", "2020-10-04", "2020-10-11", None])
+    return pd.DataFrame({
+        "name": names[rng.integers(0, len(names), rows)],
+        "date": dates[rng.integers(0, len(dates), rows)],
+        "team": rng.choice(["x", "y"], rows),
+        "yds": np.where(rng.random(rows) < 0.2, np.nan, rng.normal(50, 30, rows)),
+        "td": rng.integers(0, 4, rows),
+        "starter": rng.random(rows) < 0.5,
+        "pts": np.array([7.0, 14.0, np.nan, 21, "bye"], dtype=object)[rng.choice(5, rows, p=[.3, .3, .2, .15, .05])],
+    })
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_asof_index_matches_the_scan(seed):
+    rng = np.random.default_rng(seed)
+    assert check_asof([random_asof_table(rng, int(rng.integers(0, 40))) for _ in range(50)]) > 0
+
+
+def test_asof_index_window():
+    table = pd.DataFrame({'name': ["A"] * 8, 'date': pd.date_range("2020-09-13", periods=8, freq="7D"),
+                          'yds': np.arange(8.0)})
+    index = AsofIndex(table)
+    assert index.query("A", pd.Timestamp("2020-09-13")).isna().all()
+    assert index.query("A", pd.Timestamp("2020-09-21"))['yds'] == 0.5
+    assert index.query("A", pd.Timestamp("2021-01-01"))['yds'] == 5.0
+
+
+class SyntheticFeatureSpace(FootballTable):
+    """ A feature space over tables passed in rather than loaded from the cache """
+
+    def __init__(self, window=5):
+        self.window = window
+        self.asof_indexes = {}
+
+
+def synthetic_feature_sources(rng, rows=60):
+    """ Returns random (table, matchups column, prefix) sources shaped like a position player feature space's: two
+    player tables sharing a column and prefix, and a defense table looked up by opponent. Returns the player table
+    too, whose rows are the matchups. """
+    players = np.array(["P0", "P1", "P2", "P3", None], dtype=object)
+    dates = pd.to_datetime(["2020-09-13", "2020-09-20", "2020-09-27", "2020-10-04", "2020-10-11", "2020-10-18", None])
+    offense = pd.DataFrame({
+        'name': players[rng.integers(0, len(players), rows)],
+        'date': dates[rng.integers(0, len(dates), rows)],
+        'opp': rng.choice(TEAMS[:3], rows),
+        'rush_yds': np.where(rng.random(rows) < 0.2, np.nan, rng.normal(50, 30, rows)),
+        'td': rng.integers(0, 3, rows),
+        'pts': np.array([7.0, 14.0, np.nan, "bye"], dtype=object)[rng.choice(4, rows, p=[.4, .3, .2, .1])],
+    })
+    receiving = pd.DataFrame({
+        'name': players[rng.integers(0, len(players), rows // 2)],
+        'date': dates[rng.integers(0, len(dates), rows // 2)],
+        'rec': rng.integers(0, 8, rows // 2).astype(float),
+        'rush_yds': rng.normal(10, 5, rows // 2),
+    })
+    defense = pd.DataFrame({
+        'name': rng.choice(TEAMS[:3], rows // 3),
+        'date': dates[rng.integers(0, len(dates) - 1, rows // 3)],
+        'sacks': rng.integers(0, 5, rows // 3).astype(float),
+        'rush_yds': rng.normal(100, 30, rows // 3),
+    })
+    sources = [(offense, 'name', "o_"), (receiving, 'name', "o_"), (defense, 'opp', "d_")]
+    return sources, offense
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_asof_features_match_the_per_matchup_loop(seed):
+    sources, offense = synthetic_feature_sources(np.random.default_rng(seed))
+    matchups = offense.dropna(subset=['name', 'date'])[['name', 'date', 'opp']]
+    features = SyntheticFeatureSpace().asof_features(matchups, sources)
+    pd.testing.assert_frame_equal(features, legacy_asof_features(matchups, sources), check_exact=True)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_asof_features_from_the_latest_state_match_the_per_matchup_loop(seed):
+    sources, offense = synthetic_feature_sources(np.random.default_rng(seed))
+    feature_space = SyntheticFeatureSpace()
+    states = [feature_space.asof_index(table).latest() for table, _, _ in sources]
+    matchups = pd.DataFrame({'name': ["P0", "P1", "P2", "P3", "UNKNOWN"], 'opp': TEAMS[:3] + ["nyj", "buf"]})
+    matchups['date'] = pd.Timestamp("2020-11-01")
+    features = feature_space.asof_features(matchups, sources, states)
+    pd.testing.assert_frame_equal(features, legacy_asof_features(matchups, sources), check_exact=True)
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """ Points the table cache at a scratch folder and empties the table registry around the test """
+    monkeypatch.setattr(data, "CACHE_DIRECTORY", str(tmp_path))
+    registry.clear()
+    yield str(tmp_path)
+    registry.clear()
+
+
+OFFENSE_STATS = ['pass_cmp', 'pass_att', 'pass_yds', 'pass_td', 'pass_int', 'pass_sacked', 'pass_sacked_yds',
+                 'pass_long', 'pass_rating', 'rush_att', 'rush_yds', 'rush_td', 'rush_long', 'targets', 'rec',
+                 'rec_yds', 'rec_td', 'rec_long', 'fumbles', 'fumbles_lost']
+ADVANCED_STATS = {
+    'adv_player_passing': (['QB'], ['pass_cmp', 'pass_att', 'pass_yds', 'pass_drops', 'pass_drop_pct']),
+    'adv_player_rushing': (['QB', 'RB'], ['rush_att', 'rush_yds', 'rush_td', 'rush_yac']),
+    'adv_player_receive': (['RB', 'WR'], ['targets', 'rec', 'rec_yds', 'rec_td', 'rec_drop_pct']),
+}
+
+
+def stat_cell(rng, stat):
+    """ Returns a random stat cell as the game webpage has it: digits, a percentage or, now and then, empty """
+    if rng.random() < 0.05:
+        return ""
+    return f"{rng.uniform(0, 60):.1f}%" if stat.endswith("_pct") else str(int(rng.integers(0, 120)))
+
+
+def synthetic_boxscore(rng, date, home, away):
+    """ Returns a parsed FootballBoxscore of a random game between two teams (full names) on a date, laid out like
+    FootballBoxscore.parse leaves a real game webpage: a QB, RB and WR per team in the player tables, only the QB
+    passing, and the team stats as compound strings """
+    fbs = FootballBoxscore(f"http://stand-in/boxscores/{date:%Y%m%d}0{team_map_inv[home].lower()}.htm")
+    fbs.scorebox = {"home_team": home, "away_team": away, "home_team_score": float(rng.integers(0, 45)),
+                    "away_team_score": float(rng.integers(0, 45)), "date": date.strftime("%A %b %d, %Y")}
+    players = [(f"{team_map_inv[team]} {position}", team_map_inv[team], position)
+               for team in [away, home] for position in ['QB', 'RB', 'WR']]
+    fbs.all_player_offense = pd.DataFrame(
+        [[team] + ["0" if stat.startswith("pass_") and position != 'QB' else stat_cell(rng, stat)
+                   for stat in OFFENSE_STATS] for _, team, position in players],
+        index=[player for player, _, _ in players], columns=['team'] + OFFENSE_STATS, dtype=object
+    )
+    for attribute, (positions, stats) in ADVANCED_STATS.items():
+        rows = [(player, team) for player, team, position in players if position in positions]
+        setattr(fbs, attribute, pd.DataFrame(
+            [[team] + [stat_cell(rng, stat) for stat in stats] for _, team in rows],
+            index=[player for player, _ in rows], columns=['team'] + stats, dtype=object
+        ))
+
+    def team_stats():
+        numbers = lambda count: "-".join(str(int(n)) for n in rng.integers(0, 40, count))
+        return [str(int(rng.integers(5, 30))), numbers(3), numbers(5), numbers(2), str(int(rng.integers(50, 400))),
+                str(int(rng.integers(100, 500))), numbers(2), str(int(rng.integers(0, 4))), numbers(2), numbers(2),
+                numbers(2), f"{int(rng.integers(20, 40))}:{int(rng.integers(0, 60)):02d}"]
+    fbs.all_team_stats = pd.DataFrame(
+        {'vis_stat': team_stats(), 'home_stat': team_stats()},
+        index=["First Downs", "Rush-Yds-TDs", "Cmp-Att-Yd-TD-INT", "Sacked-Yards", "Net Pass Yards", "Total Yards",
+               "Fumbles-Lost", "Turnovers", "Penalties-Yards", "Third Down Conv.", "Fourth Down Conv.",
+               "Time of Possession"],
+        dtype=object
+    )
+    return fbs
+
+
+def synthetic_season(rng, weeks, start="2020-09-13"):
+    """ Returns the FootballBoxscore objects of weeks of random games between six teams, every team playing once a
+    week """
+    teams = list(team_map_inv)[:6]
+    games = []
+    for week in range(weeks):
+        date = pd.Timestamp(start) + pd.Timedelta(weeks=week)
+        order = rng.permutation(teams)
+        games += [synthetic_boxscore(rng, date, order[i], order[i + 1]) for i in range(0, len(order), 2)]
+    return games
+
+
+@pytest.mark.parametrize("seed", range(2))
+def test_append_season_matches_a_rebuild(cache, seed):
+    games = synthetic_season(np.random.default_rng(seed), weeks=4)
+    earlier, week = games[:-3], games[-3:]
+    season_tables("appended", earlier)
+    append_season("appended", week, games)
+    expected = season_tables("rebuilt", games)
+    for table, reference in zip(season_tables("appended"), expected):
+        assert_same_rows(table.table, reference.table, table.KEYS)
+
+    assert not any(table_class("appended", refresh=True, boxscores=games).rebuilt
+                   for table_class in SEASON_TABLES.values())
+
+    append_season("appended", week, games)
+    for table, reference in zip(season_tables("appended"), expected):
+        assert_same_rows(table.table, reference.table, table.KEYS)
+
+
+def mixed_table(rows=6):
+    """ Returns a table with a column of every kind the columnar cache stores differently """
+    rng = np.random.default_rng(0)
+    table = pd.DataFrame({
+        'yds': rng.normal(50, 30, rows), 'yds32': rng.normal(50, 30, rows).astype(np.float32),
+        'td': rng.integers(0, 4, rows), 'starter': rng.random(rows) < 0.5,
+        'date': pd.to_datetime(["2020-09-13", None] + ["2020-09-20"] * (rows - 2)),
+        'rest': pd.to_timedelta(rng.integers(0, 10, rows), unit="D"),
+        'team': pd.Categorical(rng.choice(["buf", "mia"], rows)),
+        'name': np.array(["A", None] + ["B"] * (rows - 2), dtype=object),
+        'pts_allowed': np.array([7.0, np.nan] + [14.0] * (rows - 2), dtype=object),
+        'mixed': np.array([1, "bye"] + [2.5] * (rows - 2), dtype=object),
+    })
+    table.columns.name = "stat"
+    return table
+
+
+def in_memory(table):
+    """ Returns a table with its memory-mapped arrays read in, as exact frame comparisons check the array classes """
+    return pickle.loads(pickle.dumps(table))
+
+
+@pytest.mark.parametrize("index", [None, ["r0", "r1", "r2", "r3", "r4", "r5"]])
+def test_columnar_cache_round_trip(tmp_path, index):
+    table = mixed_table()
+    if index is not None:
+        table.index = pd.Index(index, name="row")
+    stem = str(tmp_path / "table")
+    data.save_table(table, stem)
+    assert os.path.isdir(f"{stem}.cols") and not os.path.exists(f"{stem}.pkl")
+    pd.testing.assert_frame_equal(in_memory(data.load_table(stem)), table, check_exact=True)
+    pd.testing.assert_frame_equal(in_memory(data.load_table(stem, ['name', 'yds', 'team'])),
+                                  table[['name', 'yds', 'team']], check_exact=True)
+
+    data.save_table(table.iloc[:0], str(tmp_path / "empty"))
+    pd.testing.assert_frame_equal(in_memory(data.load_table(str(tmp_path / "empty"))), table.iloc[:0],
+                                  check_exact=True)
+
+
+def test_columnar_cache_maps_numbers_copy_on_write(tmp_path):
+    table = mixed_table()
+    stem = str(tmp_path / "table")
+    data.save_table(table, stem)
+    loaded = data.load_table(stem)
+    base = loaded['yds'].to_numpy()
+    while not isinstance(base, np.memmap) and base.base is not None:
+        base = base.base
+    assert isinstance(base, np.memmap)
+    loaded.loc[0, 'yds'] = -1.0
+    assert loaded.loc[0, 'yds'] == -1.0
+    pd.testing.assert_frame_equal(in_memory(data.load_table(stem)), table, check_exact=True)
+
+
+def test_tables_the_columnar_cache_cannot_store_are_pickled(tmp_path):
+    stem = str(tmp_path / "table")
+    data.save_table(mixed_table(), stem)
+    table = pd.DataFrame([[1.0, 2.0]], columns=pd.MultiIndex.from_tuples([("a", "x"), ("a", "y")]))
+    data.save_table(table, stem)
+    assert os.path.exists(f"{stem}.pkl") and not os.path.exists(f"{stem}.cols")
+    pd.testing.assert_frame_equal(data.load_table(stem), table)
+
+
+def test_columnar_cache_of_another_version_is_stale(tmp_path, monkeypatch):
+    stem = str(tmp_path / "table")
+    data.save_table(mixed_table(), stem)
+    data.write_fingerprint(stem, "inputs")
+    assert not data.is_stale(stem, "inputs", True)
+    monkeypatch.setattr(data, "COLUMN_CACHE_VERSION", data.COLUMN_CACHE_VERSION + 1)
+    with pytest.raises(StaleCacheError):
+        data.load_table(stem)
+    assert data.is_stale(stem, "inputs", True)
+
+
+def test_unreadable_columnar_cache_is_stale(tmp_path):
+    stem = str(tmp_path / "table")
+    data.save_table(mixed_table(), stem)
+    data.write_fingerprint(stem, "inputs")
+    with open(f"{stem}.cols/schema.json", 'w') as writer:
+        writer.write("{")
+    assert data.is_stale(stem, "inputs", True)
+    os.remove(f"{stem}.cols/schema.json")
+    with pytest.raises(StaleCacheError):
+        data.load_table(stem)
+    assert data.is_stale(stem, "inputs", True)
+
+
+@pytest.mark.parametrize("table_format", ["columns", "pickle"])
+def test_is_stale(tmp_path, monkeypatch, table_format):
+    stem = str(tmp_path / "table")
+    assert data.is_stale(stem, "inputs", True)
+    data.save_table(mixed_table(), stem, table_format)
+    data.write_fingerprint(stem, "inputs")
+    assert not data.is_stale(stem, "inputs", True)
+    assert data.is_stale(stem, "changed inputs", True)
+    assert data.is_stale(stem, "inputs", "force")
+    monkeypatch.setattr(data, "REFRESH_STALE_ONLY", False)
+    assert data.is_stale(stem, "inputs", True)
+
+
+def test_refresh_rebuilds_only_the_tables_whose_inputs_changed(cache, monkeypatch):
+    games = synthetic_season(np.random.default_rng(0), weeks=2)
+    season_tables(2020, games)
+    assert not any(table_class(2020, refresh=True, boxscores=games).rebuilt for table_class in SEASON_TABLES.values())
+
+    corrected = synthetic_season(np.random.default_rng(1), weeks=2)
+    assert all(table_class(2020, refresh=True, boxscores=corrected).rebuilt for table_class in SEASON_TABLES.values())
+
+    monkeypatch.setattr(data, "COLUMN_CACHE_VERSION", data.COLUMN_CACHE_VERSION + 1)
+    tables = [table_class(2020, refresh=True, boxscores=corrected) for table_class in SEASON_TABLES.values()]
+    assert all(table.rebuilt for table in tables)
+    assert not any(table_class(2020, refresh=True, boxscores=corrected).rebuilt
+                   for table_class in SEASON_TABLES.values())
+
+
+def test_score_pts_allowed_array_matches_the_scalar_lookup():
+    pts = [0.0, 0.5, 6.0, 6.5, 7.0, 13.0, 14.0, 20.0, 21.0, 27.0, 28.0, 34.0, 35.0, 60.0, np.nan]
+    np.testing.assert_array_equal(DefenseTeamTable.score_pts_allowed_array(np.array(pts, dtype=object)),
+                                  [DefenseTeamTable.score_pts_allowed(value) for value in pts])
+    assert DefenseTeamTable.score_pts_allowed(0.0) == 10.0 and DefenseTeamTable.score_pts_allowed(35) == -4.0
+
+
+def legacy_team_records_from_boxscore(fbs):
+    """ The original OffenseTeamTable.team_records_from_boxscore, built from one boxscore's team stats table """
+    home_stats_df = fbs.all_team_stats['home_stat'].copy()
+    home_stats_df['team'] = team_map_inv[fbs.scorebox['home_team']]
+    home_stats_df['date'] = pd.Timestamp(fbs.scorebox['date'])
+    home_stats_df['opp'] = team_map_inv[fbs.scorebox['away_team']]
+    vis_stats_df = fbs.all_team_stats['vis_stat'].copy()
+    vis_stats_df['team'] = team_map_inv[fbs.scorebox['away_team']]
+    vis_stats_df['date'] = pd.Timestamp(fbs.scorebox['date'])
+    vis_stats_df['opp'] = team_map_inv[fbs.scorebox['home_team']]
+    return pd.concat([home_stats_df, vis_stats_df], axis=1).T
+
+
+def test_team_records_from_boxscore_matches_the_original():
+    for fbs in synthetic_season(np.random.default_rng(0), weeks=1):
+        pd.testing.assert_frame_equal(OffenseTeamTable.team_records_from_boxscore(fbs),
+                                      legacy_team_records_from_boxscore(fbs), check_exact=True)
@@ -0,0 +1,111 @@
+import pickle
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bench import FEATURE_SPACES, season_tables
+from data import append_season
+from config import MODEL_WARM_TREES
+from model import FeatureMatrix, FootballGradientBoostingModel, FootballRandomForestModel, ModelRegistry
+from test_data import cache, synthetic_season
+
+
+def synthetic_feature_space(rng, weeks=6, players=8):
+    """ Returns a random feature space table: a row per player and week with a few training columns, missing values
+    in them, and a target column Y that depends on the training columns """
+    dates = pd.date_range("2020-09-13", periods=weeks, freq="7D")
+    rows = weeks * players
+    table = pd.DataFrame({
+        'name': np.tile([f"P{player}" for player in range(players)], weeks),
+        'date': np.repeat(dates, players),
+        'opp': rng.choice(["buf", "mia", "nwe"], rows),
+        'o_pass_yds': rng.normal(200, 50, rows),
+        'o_rush_yds': np.where(rng.random(rows) < 0.1, np.nan, rng.normal(40, 20, rows)),
+        'd_pts_allowed': rng.integers(0, 40, rows).astype(float),
+    })
+    table['Y'] = table['o_pass_yds'] / 25 + table['o_rush_yds'].fillna(0) / 10 + rng.normal(0, 1, rows)
+    return table
+
+
+@pytest.mark.parametrize("model_class", [FootballRandomForestModel, FootballGradientBoostingModel])
+def test_missing_targets_are_filled_with_0(model_class):
+    table = synthetic_feature_space(np.random.default_rng(0))
+    table.loc[[3, 10], 'Y'] = np.nan
+    model = model_class(table, **{model_class.SIZE: 5})
+    model.train()
+    assert model.Y[3] == 0.0 and model.Y[10] == 0.0
+    assert np.isfinite(model.predict(table)).all()
+
+
+def test_feature_matrix_fills_missing_values():
+    table = synthetic_feature_space(np.random.default_rng(1))
+    table.loc[0, 'Y'] = np.nan
+    matrix = FeatureMatrix.from_frame(table, columns=pd.Index(['o_rush_yds', 'o_pass_yds', 'absent']))
+    assert list(matrix.columns) == ['o_rush_yds', 'o_pass_yds', 'absent']
+    assert matrix.values.flags.c_contiguous and not np.isnan(matrix.values).any()
+    assert (matrix.values[:, 2] == 0).all()
+    np.testing.assert_array_equal(matrix.target, table['Y'].fillna(0).to_numpy())
+
+
+@pytest.mark.parametrize("feature_class", FEATURE_SPACES)
+def test_extending_a_feature_space_matches_a_cold_build(cache, feature_class):
+    games = synthetic_season(np.random.default_rng(0), weeks=6)
+    season_tables(2020, games[:-3])
+    feature_class(seasons=[2020], refresh="force")
+    append_season(2020, games[-3:], games)
+
+    extended = feature_class(seasons=[2020], refresh=True)
+    rebuilt = feature_class(seasons=[2020], refresh="force")
+    assert extended.extended and not rebuilt.extended
+    assert rebuilt.table['date'].max() == pd.Timestamp(games[-1].scorebox['date'])
+    pd.testing.assert_frame_equal(pickle.loads(pickle.dumps(extended.table)),
+                                  pickle.loads(pickle.dumps(rebuilt.table)), check_exact=True)
+
+    matchups = rebuilt.default_matchups()
+    gameday = matchups[matchups.date == matchups.date.max()][['name', 'date', 'opp']]
+    gameday = gameday.assign(date=gameday.date + pd.Timedelta(days=7))
+    space = feature_class(seasons=[2020], refresh=False)
+    assert space.asof_state(gameday) is not None
+    pd.testing.assert_frame_equal(space.features(gameday), space.asof_features(gameday, space.sources()),
+                                  check_exact=True)
+
+
+def test_stored_models_predict_like_the_trained_ones(tmp_path):
+    space = SimpleNamespace(name="SyntheticFeatureSpace", table=synthetic_feature_space(np.random.default_rng(2)))
+    cutoff = pd.Timestamp("2020-10-11")
+    trained = ModelRegistry(str(tmp_path)).get(space, cutoff, n_estimators=10)
+    reloaded = ModelRegistry(str(tmp_path))
+    model = reloaded.get(space, cutoff, n_estimators=10)
+    assert reloaded.loaded == 1 and reloaded.trained == 0
+    assert model.X is None and model.Y is None
+    np.testing.assert_array_equal(model.predict(space.table), trained.predict(space.table))
+
+
+def test_warm_started_models_grow_the_stored_model(tmp_path):
+    space = SimpleNamespace(name="SyntheticFeatureSpace", table=synthetic_feature_space(np.random.default_rng(3)))
+    first, second = pd.Timestamp("2020-10-04"), pd.Timestamp("2020-10-18")
+    model_registry = ModelRegistry(str(tmp_path))
+    model_registry.get(space, first, warm_start=True, n_estimators=10)
+    grown = model_registry.get(space, second, warm_start=True, n_estimators=10)
+    assert model_registry.trained == 2
+    assert len(grown.regressor.estimators_) == 10 + MODEL_WARM_TREES
+
+    reloaded = ModelRegistry(str(tmp_path))
+    model = reloaded.get(space, second, warm_start=True, n_estimators=10)
+    assert reloaded.loaded == 1 and reloaded.trained == 0
+    np.testing.assert_array_equal(model.predict(space.table), grown.predict(space.table))
+
+    expected = FootballRandomForestModel(space.table[space.table.date < second], n_estimators=10)
+    expected.add_trees(reloaded.get(space, first, warm_start=True, n_estimators=10))
+    np.testing.assert_array_equal(model.predict(space.table), expected.predict(space.table))
+
+
+def test_warm_start_trains_from_scratch_when_the_earlier_rows_changed(tmp_path):
+    space = SimpleNamespace(name="SyntheticFeatureSpace", table=synthetic_feature_space(np.random.default_rng(4)))
+    first, second = pd.Timestamp("2020-10-04"), pd.Timestamp("2020-10-18")
+    ModelRegistry(str(tmp_path)).get(space, first, warm_start=True, n_estimators=10)
+    space.table.loc[0, 'o_pass_yds'] += 1
+    model = ModelRegistry(str(tmp_path)).get(space, second, warm_start=True, n_estimators=10)
+    assert len(model.regressor.estimators_) == 10
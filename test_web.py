@@ -0,0 +1,165 @@
+import time
+import threading
+import email.utils
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+import requests
+from bs4 import BeautifulSoup
+
+import web
+from web import FootballBoxscore, HttpSession, PageCache, RateLimiter, fetch, retry_after, uncomment_tables
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """ Answers each request with the next (status, headers) of the server's script, then 200 for good """
+
+    def do_GET(self):
+        script = self.server.script
+        status, headers = script.pop(0) if script else (200, {})
+        self.server.requests += 1
+        body = b"<html>ok</html>" if status == 200 else b"busy"
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    """ A local stand-in for the scraped site, serving the responses scripted on server.script """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.script, server.requests = [], 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """ Records the delays fetch backs off for instead of sleeping them """
+    delays = []
+    monkeypatch.setattr(web.time, "sleep", delays.append)
+    return delays
+
+
+def stand_in_fetch(server, tmp_path, **kwargs):
+    """ Fetches a page from the stand-in server with no rate limit, a scratch page cache and a fresh session """
+    url = f"http://127.0.0.1:{server.server_address[1]}/boxscores/game.htm"
+    return fetch(url, limiter=RateLimiter(None), cache=PageCache(str(tmp_path)), session=HttpSession(), **kwargs)
+
+
+def test_retries_with_exponential_backoff(server, tmp_path, sleeps):
+    server.script = [(503, {}), (500, {}), (429, {})]
+    assert stand_in_fetch(server, tmp_path, retries=3, backoff=0.5) == "<html>ok</html>"
+    assert server.requests == 4
+    assert sleeps == [0.5, 1.0, 2.0]
+
+
+def test_retry_after_seconds_take_precedence(server, tmp_path, sleeps):
+    server.script = [(429, {"Retry-After": "7"})]
+    stand_in_fetch(server, tmp_path, retries=2, backoff=0.5)
+    assert sleeps == [7.0]
+
+
+def test_retry_after_http_date(server, tmp_path, sleeps):
+    later = email.utils.formatdate(time.time() + 30, usegmt=True)
+    server.script = [(503, {"Retry-After": later})]
+    stand_in_fetch(server, tmp_path, retries=2, backoff=0.5)
+    assert len(sleeps) == 1 and 25 <= sleeps[0] <= 30
+
+
+def test_unparseable_retry_after_falls_back_to_backoff(server, tmp_path, sleeps):
+    server.script = [(503, {"Retry-After": "soon"}), (503, {"Retry-After": "soon"})]
+    stand_in_fetch(server, tmp_path, retries=2, backoff=0.5)
+    assert sleeps == [0.5, 1.0]
+
+
+def test_gives_up_after_the_retries(server, tmp_path, sleeps):
+    server.script = [(503, {})] * 3
+    with pytest.raises(requests.HTTPError):
+        stand_in_fetch(server, tmp_path, retries=2, backoff=0.5)
+    assert server.requests == 3
+    assert sleeps == [0.5, 1.0]
+
+
+def test_client_errors_are_not_retried(server, tmp_path, sleeps):
+    server.script = [(404, {})]
+    with pytest.raises(requests.HTTPError):
+        stand_in_fetch(server, tmp_path, retries=2, backoff=0.5)
+    assert server.requests == 1 and sleeps == []
+
+
+def test_retry_after():
+    assert retry_after(None, 4.0) == 4.0
+    assert retry_after("3", 4.0) == 3.0
+    assert retry_after("Wed, 21 Oct 2015 07:28:00 GMT", 4.0) == 0.0
+    assert retry_after("not a date", 4.0) == 4.0
+
+
+def malformed_parse(html):
+    """ Stands in for parse_page on a page whose scorebox does not parse """
+    if "malformed" in html:
+        raise IndexError("list index out of range")
+    return "sha", {}, {}
+
+
+def test_parse_failures_are_reported_per_game(monkeypatch, tmp_path):
+    cache = PageCache(str(tmp_path))
+    cache.put("http://stand-in/good.htm", "<html>good</html>")
+    cache.put("http://stand-in/bad.htm", "<html>malformed</html>")
+    monkeypatch.setattr(web, "page_cache", cache)
+    monkeypatch.setattr(web, "parse_page", malformed_parse)
+    urls = ["http://stand-in/good.htm", "http://stand-in/bad.htm", "http://stand-in/missing.htm"]
+    results = dict(web.fetch_and_parse(urls, max_workers=2, parse_workers=1, offline=True))
+    assert results["http://stand-in/good.htm"] == ("sha", {}, {})
+    assert isinstance(results["http://stand-in/bad.htm"], IndexError)
+    assert isinstance(results["http://stand-in/missing.htm"], web.PageNotCachedError)
+
+
+def test_unexpected_errors_cancel_the_pending_fetches(monkeypatch):
+    fetched = []
+
+    def failing_fetch(url, limiter=None, offline=False):
+        fetched.append(url)
+        if url.endswith("/0"):
+            raise RuntimeError("unexpected")
+        time.sleep(0.05)
+        return "<html></html>"
+
+    monkeypatch.setattr(web, "fetch", failing_fetch)
+    start = time.perf_counter()
+    with pytest.raises(RuntimeError):
+        list(web.fetch_and_parse([f"http://stand-in/{i}" for i in range(200)], max_workers=1, parse_workers=1))
+    assert len(fetched) < 200
+    assert time.perf_counter() - start < 5
+
+
+def stats_page(rows):
+    """ Returns a page with one commented-out stats table of the given (header, {data-stat: cell}) rows """
+    body = "".join(
+        f"<tr><th>{header}</th>" + "".join(f'<td data-stat="{stat}">{cell}</td>' for stat, cell in cells.items())
+        + "</tr>" for header, cells in rows
+    )
+    return f'<div id="all_player_offense"><!--<table id="player_offense"><tbody>{body}</tbody></table>--></div>'
+
+
+@pytest.mark.parametrize("rows", [
+    [("A", {"pass_yds": "250", "rush_yds": "12"}), ("B", {"rush_yds": "80", "rec": "3"})],
+    [("A", {"pass_yds": "250", "rush_yds": "12"}), ("Player", {"pass_yds": "Yds"}), ("", {"rec": "1"}),
+     ("B", {"rush_yds": "80", "rec": "3"}), ("A", {"rec": "5", "pass_yds": "300"})],
+    [("A", {"fumbles": "1"}), ("B", {"rec": "3"}), ("A", {"rec": "4"}), ("C", {"fumbles": "2", "td": "1"})],
+])
+def test_extract_tables_matches_parse_table(rows):
+    soup = BeautifulSoup(uncomment_tables(stats_page(rows)), "html.parser")
+    extracted = FootballBoxscore.table_frame(FootballBoxscore.extract_tables(soup), "all_player_offense")
+    legacy = FootballBoxscore.parse_table(BeautifulSoup(stats_page(rows), "html.parser"), "all_player_offense")
+    pd.testing.assert_frame_equal(extracted, legacy.astype(object))
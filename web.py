@@ -1,17 +1,270 @@
 import os
+import re
+import gzip
+import json
+import time
+import pickle
+import hashlib
+import datetime
+import email.utils
+import threading
 import requests
 
 import numpy as np
 import pandas as pd
 
 from bs4 import BeautifulSoup
+from tqdm import tqdm
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 
-def extract_team_links(year):
+from config import BASE_URL, SCRAPE_WORKERS, REQUESTS_PER_SECOND, MAX_RETRIES, RETRY_BACKOFF, HTML_CACHE_DIRECTORY
+from config import HTML_PARSER, CACHE_DIRECTORY, REQUEST_TIMEOUT, PARSE_WORKERS
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+HTML_COMMENT = re.compile(r"<!--(.*?)-->", re.DOTALL)
+
+
+class RateLimiter(object):
+    """ Thread-safe per-host rate limiter. Every request reserves the next free time slot for its host, so no matter
+    how many worker threads are fetching, a single host never sees more than requests_per_second requests. """
+
+    def __init__(self, requests_per_second=REQUESTS_PER_SECOND):
+        """
+            Optional Inputs:
+                requests_per_second: Maximum request rate for each host. None or 0 disables the limit
+        """
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        """ Blocks until the host of the url is allowed another request. """
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+rate_limiter = RateLimiter()
+
+
+class HttpSession(object):
+    """ Keep-alive session shared by every scraper. Connections to each host are pooled and reused across requests and
+    threads, responses are gzip-compressed on the wire, and every request gets a connect/read timeout. Each request's
+    latency and size is logged so stats() can show where scrape time goes. """
+
+    def __init__(self, pool_size=SCRAPE_WORKERS, timeout=REQUEST_TIMEOUT):
+        """
+            Optional Inputs:
+                pool_size: Number of kept-alive connections per host, should be at least the number of workers
+                timeout: (connect, read) timeout in seconds for every request
+        """
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+        self.log = []
+        self.lock = threading.Lock()
+
+    def get(self, url):
+        """ Requests the url on a pooled connection and logs the host, status, wall-clock latency, decoded body size
+        and bytes on the wire (when the server reports a Content-Length). Returns the response. """
+
+        start = time.perf_counter()
+        resp = self.session.get(url, timeout=self.timeout)
+        body = resp.content
+        record = {
+            "url": url,
+            "host": urlparse(url).netloc,
+            "status": resp.status_code,
+            "seconds": time.perf_counter() - start,
+            "bytes": len(body),
+            "wire_bytes": int(resp.headers.get("Content-Length", len(body))),
+        }
+        with self.lock:
+            self.log.append(record)
+        return resp
+
+    def stats(self):
+        """ Returns a dataframe summarising the logged requests per host: request count, total and mean latency,
+        the slowest request and the decoded and on-the-wire byte counts. """
+
+        log = pd.DataFrame(self.log, columns=["url", "host", "status", "seconds", "bytes", "wire_bytes"])
+        return log.groupby("host").agg(
+            requests=("url", "count"),
+            total_seconds=("seconds", "sum"),
+            mean_seconds=("seconds", "mean"),
+            max_seconds=("seconds", "max"),
+            bytes=("bytes", "sum"),
+            wire_bytes=("wire_bytes", "sum"),
+        )
+
+
+http_session = HttpSession()
+
+
+def write_atomic(path, payload):
+    """ Writes bytes to a temporary file first and then moves it into place, so readers never see a partially
+    written file """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as writer:
+        writer.write(payload)
+    os.replace(tmp_path, path)
+
+
+class PageNotCachedError(LookupError):
+    """ Exception raised when an offline fetch asks for a page that was never stored in the page cache """
+
+
+class PageCache(object):
+    """ Content-addressed store of raw webpages. Each page body is gzipped and stored once under the sha1 of its
+    contents; a small json index per url records which body was fetched on which date. Re-fetching an unchanged page
+    only adds an index entry, and any past version of a page can be read back without touching the network. """
+
+    def __init__(self, directory=HTML_CACHE_DIRECTORY):
+        """
+            Optional Inputs:
+                directory: Root folder of the cache. Bodies live in /objects/ and url indexes in /urls/
+        """
+        self.directory = directory
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def digest(text):
+        """ Returns the sha1 hex digest of a string """
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def object_path(self, sha):
+        """ Returns the path of the gzipped page body with the given digest """
+        return os.path.join(self.directory, "objects", sha[:2], f"{sha}.html.gz")
+
+    def index_path(self, url):
+        """ Returns the path of the json index for a url """
+        return os.path.join(self.directory, "urls", f"{self.digest(url)}.json")
+
+    def history(self, url):
+        """ Returns the list of {'url', 'date', 'sha'} index entries for a url, oldest first """
+        try:
+            with open(self.index_path(url), 'r') as reader:
+                return json.load(reader)
+        except FileNotFoundError:
+            return []
+
+    def put(self, url, html, date=None):
+        """ Stores the html fetched from url on the given date (defaults to today). Returns the content digest. """
+
+        sha = self.digest(html)
+        date = (date or datetime.date.today()).isoformat()
+        path = self.object_path(sha)
+        if not os.path.exists(path):
+            write_atomic(path, gzip.compress(html.encode('utf-8'), compresslevel=6))
+        with self.lock:
+            entries = self.history(url)
+            if not any(e['date'] == date and e['sha'] == sha for e in entries):
+                entries.append({"url": url, "date": date, "sha": sha})
+                write_atomic(self.index_path(url), json.dumps(entries).encode('utf-8'))
+        return sha
+
+    def urls(self):
+        """ Returns every url that has at least one stored page """
+        urls = []
+        for index_file in os.listdir(os.path.join(self.directory, "urls")):
+            with open(os.path.join(self.directory, "urls", index_file), 'r') as reader:
+                urls.append(json.load(reader)[0]['url'])
+        return urls
+
+    def get(self, url, date=None):
+        """ Returns the most recent stored html for url, or the most recent one fetched on or before the date
+        argument. Returns None if there is no such page. """
+
+        entries = self.history(url)
+        if date is not None:
+            entries = [e for e in entries if e['date'] <= date.isoformat()]
+        if not entries:
+            return None
+        with open(self.object_path(entries[-1]['sha']), 'rb') as reader:
+            return gzip.decompress(reader.read()).decode('utf-8')
+
+
+page_cache = PageCache()
+
+
+def uncomment_tables(html):
+    """ pro-football-reference ships most of its stat tables inside html comments and renders them with javascript.
+    Takes the page html and strips the comment markers around every comment that holds a table, so that a single
+    parse of the page sees all of the tables. Returns the new html. """
+
+    return HTML_COMMENT.sub(lambda m: m.group(1) if "<table" in m.group(1) else m.group(0), html)
+
+
+def retry_after(header, default):
+    """ Takes a Retry-After header value, in seconds or as an HTTP-date, and the backoff delay. Returns the seconds to
+    wait: the header's when it parses, otherwise the backoff delay. """
+    if header is None:
+        return default
+    try:
+        return max(0.0, float(header))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return default
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (date - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+def fetch(url, limiter=None, retries=MAX_RETRIES, backoff=RETRY_BACKOFF, cache=None, offline=False, session=None):
+    """ Takes a url and requests the page on the shared http session, waiting on the rate limiter before every
+    attempt. Connection errors, timeouts and throttling/server error responses are retried with exponential backoff
+    (a Retry-After header takes precedence). Every page fetched is stored in the page cache. In offline mode the page
+    is read from the cache instead and the network is never touched. Returns the page text, or raises the last error
+    once the retries are exhausted. """
+
+    cache = page_cache if cache is None else cache
+    if offline:
+        html = cache.get(url)
+        if html is None:
+            raise PageNotCachedError(f"{url} is not in the page cache")
+        return html
+
+    limiter = rate_limiter if limiter is None else limiter
+    session = http_session if session is None else session
+    for attempt in range(retries + 1):
+        limiter.wait(url)
+        try:
+            resp = session.get(url)
+            if resp.status_code not in RETRY_STATUS_CODES:
+                resp.raise_for_status()
+                cache.put(url, resp.text)
+                return resp.text
+            error = requests.HTTPError(f"{resp.status_code} response from {url}", response=resp)
+            delay = retry_after(resp.headers.get("Retry-After"), backoff * 2 ** attempt)
+        except requests.HTTPError:
+            raise
+        except requests.RequestException as exc:
+            error = exc
+            delay = backoff * 2 ** attempt
+        if attempt < retries:
+            time.sleep(delay)
+    raise error
+
+
+def extract_team_links(year, base_url=BASE_URL, limiter=None, offline=False):
     """ Takes a season year, requests the NFL Standings & Team Stats page for the given year and returns
     a list of links to each season + team landing page. """
     
-    resp = requests.get(f"https://www.pro-football-reference.com/years/{year}/")
-    soup = BeautifulSoup(resp.text, 'html.parser')
+    html = fetch(f"{base_url}/years/{year}/", limiter=limiter, offline=offline)
+    soup = BeautifulSoup(html, 'html.parser')
     nfc_div = soup.find(id="div_NFC")
     afc_div = soup.find(id="div_AFC")
     nfc_links = nfc_div.find_all('a')
@@ -20,30 +273,173 @@ def extract_team_links(year):
 
     return team_links
 
-def extract_boxscore_links(team_season_overview_suffix):
+def extract_boxscore_links(team_season_overview_suffix, base_url=BASE_URL, limiter=None, offline=False):
     """ Takes a string associated with a teams season overview url, requests access to the page 
     and extracts all hyperlink addresses associated with the boxscore hyperlinks. Returns a list of 
     hyperlink suffix strings for all of a team's games during a season. """
     
-    full_url = "https://www.pro-football-reference.com" + team_season_overview_suffix
-    resp = requests.get(full_url)
-    soup = BeautifulSoup(resp.text, 'html.parser')
+    full_url = base_url + team_season_overview_suffix
+    html = fetch(full_url, limiter=limiter, offline=offline)
+    soup = BeautifulSoup(html, 'html.parser')
     link_elements = [a for a in soup.find_all("a") if a.text == 'boxscore']
     links = [l['href'] for l in link_elements]
 
     return links
 
 
-def unique_game_links(year):
+def unique_game_links(year, max_workers=SCRAPE_WORKERS, base_url=BASE_URL, limiter=None, offline=False):
     """ Takes a year. Extracts each team's season overview url. For each team extracts all associated 
-    games they participated in during the season. Merges all game links and removes duplicates. 
-    Returns a list of url suffix strings. """
-    
-    all_boxscores = [extract_boxscore_links(url['href']) for url in extract_team_links(year)]
+    games they participated in during the season, fetching the team pages on a pool of max_workers threads.
+    Merges all game links and removes duplicates. Returns a list of url suffix strings. """
+
+    team_links = extract_team_links(year, base_url=base_url, limiter=limiter, offline=offline)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        all_boxscores = list(pool.map(
+            lambda url: extract_boxscore_links(url['href'], base_url=base_url, limiter=limiter, offline=offline),
+            team_links
+        ))
     flattened_list = np.hstack([np.array(b) for b in all_boxscores])
     unique_game_links = np.unique(flattened_list)
 
     return unique_game_links
+
+
+def scrape_boxscores(urls, max_workers=SCRAPE_WORKERS, parse_workers=PARSE_WORKERS, limiter=None, offline=False):
+    """ Takes a list of full game urls and scrapes them with fetch_and_parse: pages are fetched on a pool of
+    max_workers threads that share the per-host rate limiter and parsed on a pool of parse_workers processes. A game
+    that still fails after its retries is reported and left unpopulated, so downstream code can filter it out the same
+    way it does for a failed serial scrape. With offline=True every page is re-parsed from the page cache instead.
+    Returns a list of FootballBoxscore objects in url order. """
+
+    boxscores = {url: FootballBoxscore(url) for url in urls}
+    results = fetch_and_parse(
+        urls, max_workers=max_workers, parse_workers=parse_workers, limiter=limiter, offline=offline
+    )
+    for url, result in tqdm(results, total=len(boxscores)):
+        if isinstance(result, Exception):
+            print(f"Failed to scrape {url}: {result}")
+            continue
+        fbs = boxscores[url]
+        fbs.sha, scorebox, tables = result
+        fbs.load(scorebox, tables)
+
+    return list(boxscores.values())
+
+
+def scrape_season(year, max_workers=SCRAPE_WORKERS, parse_workers=PARSE_WORKERS, base_url=BASE_URL, limiter=None,
+                  offline=False):
+    """ Takes a season year. Collects the unique game links for the season and scrapes every boxscore concurrently.
+    With offline=True the whole season is re-parsed from the page cache. Returns a list of FootballBoxscore objects. """
+
+    links = unique_game_links(year, max_workers=max_workers, base_url=base_url, limiter=limiter, offline=offline)
+    return scrape_boxscores(
+        [base_url + link for link in links], max_workers=max_workers, parse_workers=parse_workers, limiter=limiter,
+        offline=offline
+    )
+
+
+
+def extract_schedule_links(year, base_url=BASE_URL, limiter=None, offline=False):
+    """ Takes a season year, requests the season's schedule & results page and returns a sorted list of the url
+    suffix of every boxscore on it. A single request covers every game that has been played so far. """
+
+    html = fetch(f"{base_url}/years/{year}/games.htm", limiter=limiter, offline=offline)
+    soup = BeautifulSoup(html, 'html.parser')
+    return sorted({a['href'] for a in soup.find_all("a") if a.text == 'boxscore'})
+
+
+def load_boxscores(year):
+    """ Loads the cached list of FootballBoxscore objects for a season. Returns an empty list if there is none. """
+    try:
+        with open(os.path.join(CACHE_DIRECTORY, f"{year}_box.pkl"), 'rb') as reader:
+            return pickle.load(reader)
+    except FileNotFoundError:
+        return []
+
+
+def save_boxscores(year, boxscores):
+    """ Stores a list of FootballBoxscore objects as the season's {year}_box.pkl """
+    write_atomic(os.path.join(CACHE_DIRECTORY, f"{year}_box.pkl"), pickle.dumps(boxscores))
+
+
+class GameManifest(object):
+    """ Persistent record of the boxscore links known for a season. Each link carries its scrape status ("pending",
+    "scraped" or "failed"), the sha1 of the page the stored boxscore was parsed from and the date it was last updated.
+    Stored as json next to the season's boxscore pickle. """
+
+    def __init__(self, year, directory=CACHE_DIRECTORY):
+        """
+            Required Inputs:
+                year: Year of the season
+            Optional Inputs:
+                directory: Folder the manifest is stored in
+        """
+        self.year = year
+        self.path = os.path.join(directory, f"{year}_manifest.json")
+        try:
+            with open(self.path, 'r') as reader:
+                self.games = json.load(reader)
+        except FileNotFoundError:
+            self.games = {}
+
+    def save(self):
+        """ Writes the manifest to disk """
+        write_atomic(self.path, json.dumps(self.games, indent=1, sort_keys=True).encode('utf-8'))
+
+    def add(self, links):
+        """ Takes a list of boxscore links and registers the unseen ones as pending. Returns the new links. """
+        new_links = [link for link in links if link not in self.games]
+        for link in new_links:
+            self.games[link] = {"status": "pending", "sha": None, "updated": None}
+        return new_links
+
+    def mark(self, link, status, sha=None):
+        """ Records the outcome of a scrape for a link """
+        self.games[link] = {"status": status, "sha": sha, "updated": datetime.date.today().isoformat()}
+
+    def to_scrape(self, recheck_days=0):
+        """ Returns the links that have not been scraped successfully, plus the scraped games played within the last
+        recheck_days days, whose pages may still pick up stat corrections. """
+
+        cutoff = datetime.date.today() - datetime.timedelta(days=recheck_days)
+        links = []
+        for link, game in sorted(self.games.items()):
+            played = datetime.datetime.strptime(link.split("/")[-1][:8], "%Y%m%d").date()
+            if game['status'] != "scraped" or (recheck_days and played >= cutoff):
+                links.append(link)
+        return links
+
+
+def refresh_season(year, max_workers=SCRAPE_WORKERS, parse_workers=PARSE_WORKERS, base_url=BASE_URL, limiter=None,
+                   recheck_days=0):
+    """ Takes a season year. Reads the season's schedule page, registers any new games in the season's GameManifest
+    and scrapes only the games that are new, previously failed or due a recheck. A re-fetched game whose page hash
+    matches the manifest is left alone. New and changed boxscores are merged into the cached {year}_box.pkl.
+    Returns the list of new or changed FootballBoxscore objects. """
+
+    manifest = GameManifest(year)
+    manifest.add(extract_schedule_links(year, base_url=base_url, limiter=limiter))
+    links = manifest.to_scrape(recheck_days=recheck_days)
+    boxscores = scrape_boxscores(
+        [base_url + link for link in links], max_workers=max_workers, parse_workers=parse_workers, limiter=limiter
+    )
+
+    updated = []
+    for link, fbs in zip(links, boxscores):
+        if "adv_player_passing" not in fbs.__dict__:
+            manifest.mark(link, "failed")
+        elif fbs.sha != manifest.games[link]['sha']:
+            manifest.mark(link, "scraped", fbs.sha)
+            updated.append(fbs)
+
+    if updated:
+        merged = {fbs.url: fbs for fbs in load_boxscores(year)}
+        merged.update({fbs.url: fbs for fbs in updated})
+        save_boxscores(year, [merged[url] for url in sorted(merged)])
+    manifest.save()
+
+    return updated
+
     
 class FootballBoxscore():
     """ Primary webscraping agent. Given a url to a game webpage several stat tables are extracted. 
@@ -62,6 +458,22 @@ class FootballBoxscore():
         All the the player-level data is stored in pandas dataframes, while the scorebox data is stored in a single dictionary.
     """
 
+    # (attribute, id of the div wrapping the table)
+    TABLES = (
+        ("all_team_stats", "all_team_stats"),
+        ("all_player_offense", "all_player_offense"),
+        ("all_player_defense", "all_player_defense"),
+        ("all_player_kicking", "all_kicking"),
+        ("adv_player_passing", "all_passing_advanced"),
+        ("adv_player_rushing", "all_rushing_advanced"),
+        ("adv_player_receive", "all_receiving_advanced"),
+        ("adv_player_defense", "all_defense_advanced"),
+        ("home_snap_counts", "all_home_snap_counts"),
+        ("away_snap_counts", "all_vis_snap_counts"),
+        ("home_drives", "all_home_drives"),
+        ("away_drvies", "all_vis_drives"),
+    )
+
     def __init__(self, url):
         """
             Required Inputs:
@@ -69,38 +481,94 @@ class FootballBoxscore():
         """
         self.url = url
 
-    def full_scrape(self):
-        """ Primary entry point of FootballBoxscore. """
-
-        resp = requests.get(self.url)
-        soup = BeautifulSoup(resp.text, "html.parser")
-        self.scorebox = self.parse_scorebox(soup)
-        self.all_team_stats = self.parse_table(soup, "all_team_stats")
-        self.all_player_offense = self.parse_table(soup, "all_player_offense")
-        self.all_player_defense = self.parse_table(soup, "all_player_defense")
-        self.all_player_kicking = self.parse_table(soup, "all_kicking")
-        self.adv_player_passing = self.parse_table(soup, "all_passing_advanced")
-        self.adv_player_rushing = self.parse_table(soup, "all_rushing_advanced")
-        self.adv_player_receive = self.parse_table(soup, "all_receiving_advanced")
-        self.adv_player_defense = self.parse_table(soup, "all_defense_advanced")
-        self.home_snap_counts = self.parse_table(soup, "all_home_snap_counts")
-        self.away_snap_counts = self.parse_table(soup, "all_vis_snap_counts")
-        self.home_drives = self.parse_table(soup, "all_home_drives")
-        self.away_drvies = self.parse_table(soup, "all_vis_drives")
+    def full_scrape(self, limiter=None, offline=False):
+        """ Primary entry point of FootballBoxscore. Requests the game webpage and parses it. With offline=True the
+        page is read from the page cache instead of the network. """
+
+        html = fetch(self.url, limiter=limiter, offline=offline)
+        self.sha = PageCache.digest(html)
+        self.parse(html)
+
+    def parse(self, html, parser=HTML_PARSER):
+        """ Takes the html of the game webpage and extracts the scorebox and every stat table into attributes. The
+        page is parsed exactly once; pass parser="lxml" for a faster backend if lxml is installed. """
+
+        self.load(*parse_boxscore(html, parser=parser))
+
+    def load(self, scorebox, tables):
+        """ Takes a scorebox dictionary and the column arrays of every table (see extract_tables) and stores them as
+        the scorebox and table dataframe attributes. """
+
+        self.scorebox = scorebox
+        for attribute, table_div_id in self.TABLES:
+            setattr(self, attribute, self.table_frame(tables, table_div_id))
         try:
-            self.home_starters = self.parse_table(soup, "all_home_starters")
-            self.away_starters = self.parse_table(soup, "all_vis_starters")
+            self.home_starters = self.table_frame(tables, "all_home_starters")
+            self.away_starters = self.table_frame(tables, "all_vis_starters")
         except AttributeError:
             print(f"No starter info {self.url}")
             self.home_starters = None
             self.away_starters = None
 
+    @staticmethod
+    def extract_tables(soup):
+        """ Takes a BeautifulSoup object of an uncommented game webpage. Walks every stats table on the page once and
+        collects its rows as column arrays. Returns a dictionary keyed by the id of the div wrapping each table, whose
+        values are (row headers, {data-stat: list of cell contents}) tuples. """
+
+        tables = {}
+        for table_soup in soup.find_all('table', id=True):
+            tbody = table_soup.find('tbody')
+            if tbody is None:
+                continue
+            headers, positions, columns, row_stats, repeated = [], {}, {}, [], False
+            for tr in tbody.find_all('tr', recursive=False):
+                th = tr.find('th', recursive=False)
+                if th is None or th.text == "" or th.text == "Player":
+                    continue
+                header = th.text
+                if header in positions:  # a repeated header replaces the earlier row, cells it lacks become NaN
+                    repeated = True
+                    for values in columns.values():
+                        values[positions[header]] = np.nan
+                else:
+                    positions[header] = len(headers)
+                    headers.append(header)
+                    row_stats.append(None)
+                    for values in columns.values():
+                        values.append(np.nan)
+                position = positions[header]
+                stats = []
+                for td in tr.find_all("td", recursive=False):
+                    values = columns.setdefault(td['data-stat'], [np.nan] * len(headers))
+                    values[position] = td.text
+                    stats.append(td['data-stat'])
+                row_stats[position] = stats
+            if repeated:  # columns in order of first appearance over the rows kept, as parse_table has them
+                columns = {stat: columns[stat] for stat in dict.fromkeys(s for stats in row_stats for s in stats)}
+            tables[f"all_{table_soup['id']}"] = (headers, columns)
+
+        return tables
+
+    @staticmethod
+    def table_frame(tables, table_div_id):
+        """ Takes the output of extract_tables and a table div id. Returns the table as a dataframe with one row per
+        header and one column per data-stat, matching the output of parse_table. """
+
+        if table_div_id not in tables:
+            raise AttributeError(f"No {table_div_id} table")
+        headers, columns = tables[table_div_id]
+        if not headers:
+            return pd.DataFrame({})
+        return pd.DataFrame(columns, index=headers, dtype=object)
+
     @staticmethod
     def parse_table(soup, table_div_id):
         """ Takes a BeautifulSoup object for the game stat webpage and the table id of the table 
         that is going to be scrapped. Parses through the table and creates a dictionary such that
         each header is a key and the cells contents are the values. Converts the dictionary to 
-        a dataframe and returns the transposed dataframe. """
+        a dataframe and returns the transposed dataframe. Re-parses the table div on every call, so parse uses
+        extract_tables instead; kept for parsing a single table. """
         
         table_div = soup.find('div', id=table_div_id)
         div_encoded = bytearray(str(table_div.contents), 'utf-8')
@@ -135,4 +603,94 @@ class FootballBoxscore():
         }
         
         return output
-    
\ No newline at end of file
+    
+
+
+def parse_boxscore(html, parser=HTML_PARSER):
+    """ Takes the html of a game webpage and parses it once. Returns the scorebox dictionary and the column arrays of
+    every table (see FootballBoxscore.extract_tables) without building any dataframes. """
+
+    soup = BeautifulSoup(uncomment_tables(html), parser)
+    return FootballBoxscore.parse_scorebox(soup), FootballBoxscore.extract_tables(soup)
+
+
+def parse_page(html, parser=HTML_PARSER):
+    """ Parse stage of the scrape pipeline, run in a worker process. Takes the html of a game webpage and returns its
+    sha1, scorebox dictionary and table column arrays - plain lists and strings that are cheap to send back to the
+    parent, never BeautifulSoup trees. Raises AttributeError if one of the boxscore tables is missing. """
+
+    scorebox, tables = parse_boxscore(html, parser=parser)
+    missing = [table_div_id for _, table_div_id in FootballBoxscore.TABLES if table_div_id not in tables]
+    if missing:
+        raise AttributeError(f"No {missing[0]} table")
+    return PageCache.digest(html), scorebox, tables
+
+
+def fetch_and_parse(urls, max_workers=SCRAPE_WORKERS, parse_workers=PARSE_WORKERS, limiter=None, offline=False):
+    """ Two-stage scrape pipeline. Pages are fetched on a pool of max_workers threads and every page is handed to a
+    pool of parse_workers processes as soon as it arrives, so the CPU-bound parsing runs on every core while the network
+    stage keeps fetching. Yields (url, (sha, scorebox, tables)) for each game as soon as it is parsed, or
+    (url, exception) for a game that could not be fetched or parsed. """
+
+    fetch_errors = (requests.RequestException, PageNotCachedError)
+    with ThreadPoolExecutor(max_workers=max_workers) as fetch_pool, \
+            ProcessPoolExecutor(max_workers=parse_workers) as parse_pool:
+        pending = {fetch_pool.submit(fetch, url, limiter=limiter, offline=offline): (url, "fetch") for url in urls}
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url, stage = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except fetch_errors as exc:
+                        yield url, exc
+                        continue
+                    except Exception as exc:
+                        # A malformed page fails its own game, not the season
+                        if stage == "fetch":
+                            raise
+                        yield url, exc
+                        continue
+                    if stage == "fetch":
+                        pending[parse_pool.submit(parse_page, result)] = (url, "parse")
+                    else:
+                        yield url, result
+        finally:
+            # On an unexpected error or an abandoned generator, don't wait on the queued rate-limited fetches
+            fetch_pool.shutdown(wait=False, cancel_futures=True)
+            parse_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def stream_boxscores(urls, writer, max_workers=SCRAPE_WORKERS, parse_workers=PARSE_WORKERS, limiter=None,
+                     offline=False):
+    """ Takes a list of full game urls and a shard writer (see data.BoxscoreShardWriter). Fetches and parses the games
+    with fetch_and_parse and appends each game to the writer as soon as it is parsed, so no FootballBoxscore objects
+    are kept in memory. Games missing one of the boxscore tables are skipped like a failed scrape. Returns the list of
+    urls that failed. """
+
+    failed = []
+    results = fetch_and_parse(
+        urls, max_workers=max_workers, parse_workers=parse_workers, limiter=limiter, offline=offline
+    )
+    for url, result in tqdm(results, total=len(urls)):
+        if isinstance(result, Exception):
+            print(f"Failed to scrape {url}: {result}")
+            failed.append(url)
+            continue
+        _, scorebox, tables = result
+        writer.append(url, scorebox, tables)
+
+    return failed
+
+
+def stream_season(year, writer, max_workers=SCRAPE_WORKERS, parse_workers=PARSE_WORKERS, base_url=BASE_URL,
+                  limiter=None, offline=False):
+    """ Takes a season year and a shard writer. Collects the unique game links for the season and streams every
+    boxscore into the writer. Returns the list of urls that failed. """
+
+    links = unique_game_links(year, max_workers=max_workers, base_url=base_url, limiter=limiter, offline=offline)
+    return stream_boxscores(
+        [base_url + link for link in links], writer, max_workers=max_workers, parse_workers=parse_workers,
+        limiter=limiter, offline=offline
+    )